@@ -0,0 +1,56 @@
+"""fiscal outbox and pos order fiscal status
+
+Revision ID: o1f2s3c4a5l6
+Revises: n7o8p9q0r1s2
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "o1f2s3c4a5l6"
+down_revision = "n7o8p9q0r1s2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    tables = set(inspector.get_table_names())
+
+    if "fiscal_outbox" not in tables:
+        op.create_table(
+            "fiscal_outbox",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id"), nullable=False, index=True),
+            sa.Column("invoice_id", sa.Integer(), sa.ForeignKey("invoices.id"), nullable=False, index=True),
+            sa.Column("pos_order_id", sa.Integer(), sa.ForeignKey("pos_orders.id"), nullable=True, index=True),
+            sa.Column("device_id", sa.Integer(), sa.ForeignKey("devices.id"), nullable=True, index=True),
+            sa.Column("requested_by_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+            sa.Column("status", sa.String(30), nullable=False, server_default="pending", index=True),
+            sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("last_error", sa.Text(), nullable=False, server_default=""),
+            sa.Column("available_at", sa.DateTime(timezone=True), server_default=sa.func.now(), index=True),
+            sa.Column("locked_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("locked_by", sa.String(100), nullable=False, server_default=""),
+            sa.Column("completed_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+
+    columns = {c["name"] for c in inspector.get_columns("pos_orders")}
+    if "fiscal_status" not in columns:
+        op.add_column("pos_orders", sa.Column("fiscal_status", sa.String(30), nullable=True, server_default=""))
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    columns = {c["name"] for c in inspector.get_columns("pos_orders")}
+    if "fiscal_status" in columns:
+        op.drop_column("pos_orders", "fiscal_status")
+    if "fiscal_outbox" in set(inspector.get_table_names()):
+        op.drop_table("fiscal_outbox")
@@ -0,0 +1,62 @@
+"""offline fiscal mode: device fiscal_mode and fiscal_files
+
+Revision ID: p2o3f4f5l6n7
+Revises: o1f2s3c4a5l6
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "p2o3f4f5l6n7"
+down_revision = "o1f2s3c4a5l6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    columns = {c["name"] for c in inspector.get_columns("devices")}
+    if "fiscal_mode" not in columns:
+        op.add_column("devices", sa.Column("fiscal_mode", sa.String(20), nullable=True, server_default="online"))
+    if "offline_since" not in columns:
+        op.add_column("devices", sa.Column("offline_since", sa.DateTime(timezone=True), nullable=True))
+
+    if "fiscal_files" not in set(inspector.get_table_names()):
+        op.create_table(
+            "fiscal_files",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id"), nullable=False, index=True),
+            sa.Column("device_id", sa.Integer(), sa.ForeignKey("devices.id"), nullable=False, index=True),
+            sa.Column("fiscal_day_no", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("file_sequence", sa.Integer(), nullable=False, server_default="1"),
+            sa.Column("first_global_no", sa.Integer(), nullable=False),
+            sa.Column("last_global_no", sa.Integer(), nullable=False),
+            sa.Column("receipt_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("status", sa.String(30), nullable=False, server_default="uploading", index=True),
+            sa.Column("operation_id", sa.String(100), nullable=False, server_default=""),
+            sa.Column("accepted_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("rejected_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("last_error", sa.Text(), nullable=False, server_default=""),
+            sa.Column("submitted_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("completed_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.UniqueConstraint("device_id", "first_global_no", name="uq_fiscal_files_device_first"),
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if "fiscal_files" in set(inspector.get_table_names()):
+        op.drop_table("fiscal_files")
+    columns = {c["name"] for c in inspector.get_columns("devices")}
+    if "offline_since" in columns:
+        op.drop_column("devices", "offline_since")
+    if "fiscal_mode" in columns:
+        op.drop_column("devices", "fiscal_mode")
@@ -0,0 +1,48 @@
+"""local fiscal day counters
+
+Revision ID: q3f4d5c6n7t8
+Revises: p2o3f4f5l6n7
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "q3f4d5c6n7t8"
+down_revision = "p2o3f4f5l6n7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if "fiscal_day_counters" not in set(inspector.get_table_names()):
+        op.create_table(
+            "fiscal_day_counters",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id"), nullable=False, index=True),
+            sa.Column("device_id", sa.Integer(), sa.ForeignKey("devices.id"), nullable=False, index=True),
+            sa.Column("fiscal_day_no", sa.Integer(), nullable=False, index=True),
+            sa.Column("counter_type", sa.String(30), nullable=False),
+            sa.Column("currency", sa.String(10), nullable=False),
+            sa.Column("tax_id", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("tax_percent", sa.Float(), nullable=True),
+            sa.Column("money_type", sa.String(30), nullable=False, server_default=""),
+            sa.Column("value", sa.Float(), nullable=False, server_default="0"),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.UniqueConstraint(
+                "device_id", "fiscal_day_no", "counter_type", "currency", "tax_id", "money_type",
+                name="uq_fiscal_day_counters_key",
+            ),
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if "fiscal_day_counters" in set(inspector.get_table_names()):
+        op.drop_table("fiscal_day_counters")
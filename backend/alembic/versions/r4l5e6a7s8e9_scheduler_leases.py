@@ -0,0 +1,37 @@
+"""scheduler leases for leader election
+
+Revision ID: r4l5e6a7s8e9
+Revises: q3f4d5c6n7t8
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "r4l5e6a7s8e9"
+down_revision = "q3f4d5c6n7t8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if "scheduler_leases" not in set(inspector.get_table_names()):
+        op.create_table(
+            "scheduler_leases",
+            sa.Column("name", sa.String(100), primary_key=True),
+            sa.Column("holder", sa.String(255), nullable=False, server_default=""),
+            sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if "scheduler_leases" in set(inspector.get_table_names()):
+        op.drop_table("scheduler_leases")
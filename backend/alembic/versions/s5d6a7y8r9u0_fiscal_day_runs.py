@@ -0,0 +1,65 @@
+"""scheduled fiscal day close/open runs
+
+Revision ID: s5d6a7y8r9u0
+Revises: r4l5e6a7s8e9
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "s5d6a7y8r9u0"
+down_revision = "r4l5e6a7s8e9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    settings_cols = {c["name"] for c in inspector.get_columns("company_settings")}
+    if "fiscal_day_auto_close" not in settings_cols:
+        op.add_column(
+            "company_settings",
+            sa.Column("fiscal_day_auto_close", sa.Boolean(), nullable=False, server_default=sa.false()),
+        )
+    if "fiscal_day_cutoff" not in settings_cols:
+        op.add_column(
+            "company_settings",
+            sa.Column("fiscal_day_cutoff", sa.String(5), nullable=False, server_default="23:59"),
+        )
+
+    if "fiscal_day_runs" not in set(inspector.get_table_names()):
+        op.create_table(
+            "fiscal_day_runs",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id"), nullable=False, index=True),
+            sa.Column("run_date", sa.String(10), nullable=False, index=True),
+            sa.Column("run_key", sa.String(60), nullable=False),
+            sa.Column("trigger", sa.String(20), nullable=False, server_default="scheduled"),
+            sa.Column("cutoff", sa.String(5), nullable=False, server_default=""),
+            sa.Column("status", sa.String(20), nullable=False, server_default="running", index=True),
+            sa.Column("device_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("succeeded_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("failed_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("skipped_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("results", sa.Text(), nullable=False, server_default="[]"),
+            sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("completed_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.UniqueConstraint("company_id", "run_key", name="uq_fiscal_day_runs_company_key"),
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if "fiscal_day_runs" in set(inspector.get_table_names()):
+        op.drop_table("fiscal_day_runs")
+    settings_cols = {c["name"] for c in inspector.get_columns("company_settings")}
+    for column in ("fiscal_day_cutoff", "fiscal_day_auto_close"):
+        if column in settings_cols:
+            op.drop_column("company_settings", column)
@@ -0,0 +1,40 @@
+"""document reference sequences
+
+Revision ID: t6s7e8q9n0c1
+Revises: s5d6a7y8r9u0
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "t6s7e8q9n0c1"
+down_revision = "s5d6a7y8r9u0"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if "document_sequences" not in set(inspector.get_table_names()):
+        op.create_table(
+            "document_sequences",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("company_id", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("code", sa.String(100), nullable=False),
+            sa.Column("period", sa.String(20), nullable=False, server_default=""),
+            sa.Column("value", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.UniqueConstraint("company_id", "code", "period", name="uq_document_sequences_key"),
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if "document_sequences" in set(inspector.get_table_names()):
+        op.drop_table("document_sequences")
@@ -0,0 +1,42 @@
+"""POS catalog change log
+
+Revision ID: u7c8a9t0l1g2
+Revises: t6s7e8q9n0c1
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "u7c8a9t0l1g2"
+down_revision = "t6s7e8q9n0c1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if "catalog_changes" not in set(inspector.get_table_names()):
+        op.create_table(
+            "catalog_changes",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id"), nullable=False),
+            sa.Column("version", sa.Integer(), nullable=False),
+            sa.Column("entity", sa.String(20), nullable=False),
+            sa.Column("entity_id", sa.Integer(), nullable=False),
+            sa.Column("product_id", sa.Integer(), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_catalog_changes_company_version", "catalog_changes", ["company_id", "version"])
+        op.create_index("ix_catalog_changes_created_at", "catalog_changes", ["created_at"])
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if "catalog_changes" in set(inspector.get_table_names()):
+        op.drop_table("catalog_changes")
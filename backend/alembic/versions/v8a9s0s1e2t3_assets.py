@@ -0,0 +1,109 @@
+"""Asset store for product images and company logos
+
+Revision ID: v8a9s0s1e2t3
+Revises: u7c8a9t0l1g2
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+import base64
+import binascii
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "v8a9s0s1e2t3"
+down_revision = "u7c8a9t0l1g2"
+branch_labels = None
+depends_on = None
+
+_BATCH = 200
+
+
+def _move_data_urls(bind, assets, table: str, column: str) -> None:
+    """Replace inline ``data:`` URLs in ``table.column`` with asset URLs, a batch at a time."""
+    source = sa.table(table, sa.column("id", sa.Integer), sa.column(column, sa.Text))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(source.c.id, source.c[column])
+            .where(source.c.id > last_id, source.c[column].like("data:%"))
+            .order_by(source.c.id)
+            .limit(_BATCH)
+        ).all()
+        if not rows:
+            return
+        for row_id, value in rows:
+            last_id = row_id
+            header, _, payload = value.partition(",")
+            if not header.endswith(";base64"):
+                continue
+            try:
+                data = base64.b64decode(payload, validate=True)
+            except (binascii.Error, ValueError):
+                continue
+            key = hashlib.sha256(data).hexdigest()
+            exists = bind.execute(sa.select(assets.c.key).where(assets.c.key == key)).first()
+            if exists is None:
+                bind.execute(
+                    assets.insert().values(
+                        key=key, content_type=header[5:-7] or "application/octet-stream", size=len(data), data=data
+                    )
+                )
+            bind.execute(source.update().where(source.c.id == row_id).values({column: f"/api/assets/{key}"}))
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "assets" not in tables:
+        op.create_table(
+            "assets",
+            sa.Column("key", sa.String(80), primary_key=True),
+            sa.Column("content_type", sa.String(100), nullable=False),
+            sa.Column("size", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("data", sa.LargeBinary(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+
+    assets = sa.table(
+        "assets",
+        sa.column("key", sa.String),
+        sa.column("content_type", sa.String),
+        sa.column("size", sa.Integer),
+        sa.column("data", sa.LargeBinary),
+    )
+    if "products" in tables:
+        _move_data_urls(bind, assets, "products", "image_url")
+    if "company_settings" in tables:
+        _move_data_urls(bind, assets, "company_settings", "logo_data")
+
+
+def _restore_data_urls(bind, assets, table: str, column: str) -> None:
+    source = sa.table(table, sa.column("id", sa.Integer), sa.column(column, sa.Text))
+    rows = bind.execute(sa.select(source.c.id, source.c[column]).where(source.c[column].like("/api/assets/%"))).all()
+    for row_id, value in rows:
+        key = value[len("/api/assets/"):].split("?", 1)[0]
+        asset = bind.execute(sa.select(assets.c.content_type, assets.c.data).where(assets.c.key == key)).first()
+        if asset is None:
+            continue
+        data_url = f"data:{asset.content_type};base64,{base64.b64encode(asset.data).decode()}"
+        bind.execute(source.update().where(source.c.id == row_id).values({column: data_url}))
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    tables = set(inspector.get_table_names())
+    if "assets" not in tables:
+        return
+    assets = sa.table("assets", sa.column("key", sa.String), sa.column("content_type", sa.String), sa.column("data", sa.LargeBinary))
+    if "products" in tables:
+        _restore_data_urls(bind, assets, "products", "image_url")
+    if "company_settings" in tables:
+        _restore_data_urls(bind, assets, "company_settings", "logo_data")
+    op.drop_table("assets")
@@ -0,0 +1,37 @@
+"""Trigram indexes for product search (PostgreSQL)
+
+Revision ID: w9p0s1r2c3h4
+Revises: v8a9s0s1e2t3
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+from sqlalchemy import inspect
+
+
+revision = "w9p0s1r2c3h4"
+down_revision = "v8a9s0s1e2t3"
+branch_labels = None
+depends_on = None
+
+_COLUMNS = ("name", "barcode", "reference")
+
+
+def upgrade():
+    # Other backends search through the in-process index in app.services.product_search
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or "products" not in set(inspect(bind).get_table_names()):
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for column in _COLUMNS:
+        op.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_products_{column}_trgm ON products USING gin ({column} gin_trgm_ops)"
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    for column in _COLUMNS:
+        op.execute(f"DROP INDEX IF EXISTS ix_products_{column}_trgm")
@@ -0,0 +1,43 @@
+"""POS session ledger
+
+Revision ID: x0l1e2d3g4e5
+Revises: w9p0s1r2c3h4
+Create Date: 2026-10-17 00:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+revision = "x0l1e2d3g4e5"
+down_revision = "w9p0s1r2c3h4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing session totals stay in pos_sessions as the pre-ledger baseline
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if "pos_session_entries" not in set(inspector.get_table_names()):
+        op.create_table(
+            "pos_session_entries",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("session_id", sa.Integer(), sa.ForeignKey("pos_sessions.id"), nullable=False),
+            sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id"), nullable=False),
+            sa.Column("order_id", sa.Integer(), sa.ForeignKey("pos_orders.id"), nullable=False),
+            sa.Column("kind", sa.String(20), nullable=False),
+            sa.Column("method", sa.String(20), nullable=False),
+            sa.Column("amount", sa.Float(), nullable=False, server_default="0"),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_pos_session_entries_session_id", "pos_session_entries", ["session_id"])
+
+
+def downgrade():
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    if "pos_session_entries" in set(inspector.get_table_names()):
+        op.drop_table("pos_session_entries")
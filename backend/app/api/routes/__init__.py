@@ -9,6 +9,9 @@ from app.api.routes import expenses
 from app.api.routes import expense_categories
 from app.api.routes import currencies
 from app.api.routes import notifications
+from app.api.routes import fdms_admin
+from app.api.routes import qr
+from app.api.routes import assets
 
 api_router = APIRouter()
 api_router.include_router(auth.router)
@@ -38,3 +41,6 @@ api_router.include_router(expenses.router)
 api_router.include_router(expense_categories.router)
 api_router.include_router(currencies.router)
 api_router.include_router(notifications.router)
+api_router.include_router(fdms_admin.router)
+api_router.include_router(qr.router)
+api_router.include_router(assets.router)
@@ -0,0 +1,35 @@
+"""Product images and company logos from the asset store."""
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.orm import Session
+
+from app.api.deps import get_db
+from app.services.assets import THUMBNAIL_SIZES, load
+
+router = APIRouter(prefix="/assets", tags=["assets"])
+
+# User uploads (SVG in particular) must never run as a page on our origin
+_HEADERS = {
+    "Cache-Control": "public, max-age=31536000, immutable",
+    "Content-Security-Policy": "default-src 'none'; style-src 'unsafe-inline'; sandbox",
+    "X-Content-Type-Options": "nosniff",
+}
+
+
+@router.get("/{key}")
+def get_asset(
+    key: str,
+    request: Request,
+    size: str | None = Query(None, description="list or pos for a thumbnail"),
+    db: Session = Depends(get_db),
+):
+    """An asset by key; no login needed, as ``<img>`` tags cannot send a bearer token."""
+    if size is not None and size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="size must be 'list' or 'pos'")
+    found = load(db, key, size)
+    if found is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Asset not found")
+    served_key, content_type, data = found
+    headers = {"ETag": f'"{served_key}"', **_HEADERS}
+    if headers["ETag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=data, media_type=content_type, headers=headers)
@@ -4,6 +4,8 @@ from sqlalchemy.orm import Session
 from app.api.deps import get_db, get_current_user, ensure_company_access
 from app.models.company_certificate import CompanyCertificate
 from app.schemas.company_certificate import CompanyCertificateRead
+from app.services.fdms_client import invalidate_company_client
+from app.services.signing_keys import invalidate_company_key
 
 router = APIRouter(prefix="/company-certificates", tags=["company-certificates"])
 
@@ -34,6 +36,7 @@ def upload_company_crt(
     cert.crt_data = crt.file.read()
     db.commit()
     db.refresh(cert)
+    invalidate_company_client(company_id)
     return cert
 
 
@@ -53,4 +56,6 @@ def upload_company_key(
     cert.key_data = key.file.read()
     db.commit()
     db.refresh(cert)
+    invalidate_company_client(company_id)
+    invalidate_company_key(company_id)
     return cert
\ No newline at end of file
@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 from app.api.deps import get_db, ensure_company_access, require_company_access, get_current_user
 from app.models.company_settings import CompanySettings
 from app.schemas.company_settings import CompanySettingsCreate, CompanySettingsRead, CompanySettingsUpdate
+from app.services.assets import externalize
 
 router = APIRouter(prefix="/company-settings", tags=["company-settings"])
 
@@ -24,6 +25,7 @@ def create_company_settings(
         raise HTTPException(status_code=400, detail="Settings already exist for this company")
     
     settings = CompanySettings(**payload.dict())
+    settings.logo_data = externalize(db, settings.logo_data)
     db.add(settings)
     db.commit()
     db.refresh(settings)
@@ -64,6 +66,8 @@ def update_company_settings(
     ensure_company_access(db, user, settings.company_id)
     
     updates = payload.dict(exclude_unset=True)
+    if "logo_data" in updates:
+        updates["logo_data"] = externalize(db, updates["logo_data"])
     for key, value in updates.items():
         setattr(settings, key, value)
     db.commit()
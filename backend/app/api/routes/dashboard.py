@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from app.api import deps
@@ -10,28 +10,33 @@ from app.models.company import Company
 from app.models.company_user import CompanyUser
 from app.models.device import Device
 from app.models.company_certificate import CompanyCertificate
+from app.models.fiscal_day_run import FiscalDayRun
 from app.models.user import User
 from app.schemas.dashboard import DashboardSummary
+from app.services.fiscal_day_scheduler import run_report
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
 
+def _visible_company_ids(db: Session, user: User) -> list[int]:
+    if user.is_admin:
+        return [cid for (cid,) in db.query(Company.id).all()]
+    return [
+        cid
+        for (cid,) in (
+            db.query(CompanyUser.company_id)
+            .filter(CompanyUser.user_id == user.id, CompanyUser.is_active == True)
+            .all()
+        )
+    ]
+
+
 @router.get("/summary", response_model=DashboardSummary)
 def get_dashboard_summary(
     db: Session = Depends(deps.get_db),
     user: User = Depends(deps.get_current_user),
 ) -> DashboardSummary:
-    if user.is_admin:
-        company_ids = [cid for (cid,) in db.query(Company.id).all()]
-    else:
-        company_ids = [
-            cid
-            for (cid,) in (
-                db.query(CompanyUser.company_id)
-                .filter(CompanyUser.user_id == user.id, CompanyUser.is_active == True)
-                .all()
-            )
-        ]
+    company_ids = _visible_company_ids(db, user)
 
     if not company_ids:
         return DashboardSummary.empty()
@@ -117,3 +122,39 @@ def get_dashboard_summary(
         device_health={"online": devices_online, "attention": devices_attention},
         company_status=company_status,
     )
+
+
+@router.get("/fiscal-day-runs")
+def list_fiscal_day_runs(
+    company_id: int | None = None,
+    limit: int = 30,
+    db: Session = Depends(deps.get_db),
+    user: User = Depends(deps.get_current_user),
+) -> list[dict]:
+    """Latest automatic (and manual) fiscal day close/open runs, newest first."""
+    company_ids = _visible_company_ids(db, user)
+    if company_id is not None:
+        if company_id not in company_ids:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Company access denied")
+        company_ids = [company_id]
+    runs = (
+        db.query(FiscalDayRun)
+        .filter(FiscalDayRun.company_id.in_(company_ids))
+        .order_by(FiscalDayRun.id.desc())
+        .limit(max(1, min(limit, 200)))
+        .all()
+    )
+    return [run_report(run, include_results=False) for run in runs]
+
+
+@router.get("/fiscal-day-runs/{run_id}")
+def get_fiscal_day_run(
+    run_id: int,
+    db: Session = Depends(deps.get_db),
+    user: User = Depends(deps.get_current_user),
+) -> dict:
+    """One run with the result of every device."""
+    run = db.get(FiscalDayRun, run_id)
+    if run is None or run.company_id not in _visible_company_ids(db, user):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Run not found")
+    return run_report(run)
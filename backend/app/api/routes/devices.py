@@ -1,6 +1,8 @@
+import json
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, UploadFile, File, Query, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import Optional
 
@@ -17,7 +19,21 @@ from app.models.company_certificate import CompanyCertificate
 from app.models.audit_log import AuditLog
 from app.schemas.device import DeviceCreate, DeviceRead, DeviceUpdate
 from app.schemas.audit_log import AuditLogRead
-from app.services.fdms import get_status, open_day, close_day, get_config, ping_device, register_device
+from app.services.fdms import (
+    FDMSUnavailableError,
+    get_status,
+    open_day,
+    close_day,
+    get_config,
+    reconcile_fiscal_day_counters,
+    register_device,
+)
+from app.services.fiscal_counters import fiscal_day_summary
+from app.services.fiscal_offline import offline_status, retry_file, sync_device
+from app.services.liveness import ping_and_record
+from app.services.receipt_audit import verify_chains
+from app.services.fdms_client import invalidate_device_client
+from app.services.signing_keys import invalidate_device_key
 
 router = APIRouter(prefix="/devices", tags=["devices"])
 
@@ -54,6 +70,39 @@ def list_device_values(
     return []
 
 
+@router.get("/receipt-chain/verify")
+def verify_receipt_chains(
+    company_id: int,
+    device_id: Optional[int] = None,
+    signatures: bool = True,
+    max_issues: int = Query(100, ge=0, le=10000),
+    db: Session = Depends(get_db),
+    user=Depends(require_portal_user),
+):
+    """Verify the stored receipt hash chain of a company's devices.
+
+    Streams one NDJSON report per device as it finishes (gaps, forks, broken
+    links, hash and signature mismatches); the last record is a summary.
+    """
+    ensure_company_access(db, user, company_id)
+    query = db.query(Device.id).filter(Device.company_id == company_id)
+    if device_id is not None:
+        query = query.filter(Device.id == device_id)
+    device_ids = [row.id for row in query.order_by(Device.id).all()]
+    if device_id is not None and not device_ids:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+
+    def stream():
+        for item in verify_chains(device_ids, verify_signatures=signatures, max_issues=max_issues):
+            yield json.dumps(item, default=str) + "\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("", response_model=DeviceRead)
 def create_device(
     payload: DeviceCreate,
@@ -145,6 +194,7 @@ def upload_crt(
     device.crt_data = crt.file.read()
     db.commit()
     db.refresh(device)
+    invalidate_device_client(device.id)
     return device
 
 
@@ -163,18 +213,26 @@ def upload_key(
     device.key_data = key.file.read()
     db.commit()
     db.refresh(device)
+    invalidate_device_client(device.id)
+    invalidate_device_key(device.id)
     return device
 
 
 @router.get("/{device_id}/status")
-def fetch_status(device_id: int, db: Session = Depends(get_db), user=Depends(require_portal_user)):
+def fetch_status(
+    device_id: int,
+    refresh: bool = False,
+    db: Session = Depends(get_db),
+    user=Depends(require_portal_user),
+):
+    """FDMS GetStatus, served from the short-lived status cache unless ``refresh``."""
     device = db.query(Device).filter(Device.id == device_id).first()
     if not device:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
     ensure_company_access(db, user, device.company_id)
     _ensure_company_certificate(db, device.company_id)
     try:
-        result = get_status(device, db)
+        result = get_status(device, db, fresh=refresh)
         # Persist useful fields from FDMS response
         if "fiscalDayStatus" in result:
             raw = result["fiscalDayStatus"]
@@ -197,14 +255,20 @@ def fetch_status(device_id: int, db: Session = Depends(get_db), user=Depends(req
 
 
 @router.get("/{device_id}/config")
-def fetch_config(device_id: int, db: Session = Depends(get_db), user=Depends(require_portal_user)):
+def fetch_config(
+    device_id: int,
+    refresh: bool = False,
+    db: Session = Depends(get_db),
+    user=Depends(require_portal_user),
+):
+    """FDMS GetConfig, served from the config cache unless ``refresh``."""
     device = db.query(Device).filter(Device.id == device_id).first()
     if not device:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
     ensure_company_access(db, user, device.company_id)
     _ensure_company_certificate(db, device.company_id)
     try:
-        result = get_config(device, db)
+        result = get_config(device, db, fresh=refresh)
         # Persist QR URL if present
         if result.get("qrUrl"):
             device.qr_url = result["qrUrl"]
@@ -222,7 +286,7 @@ def ping(device_id: int, db: Session = Depends(get_db), user=Depends(require_por
     ensure_company_access(db, user, device.company_id)
     _ensure_company_certificate(db, device.company_id)
     try:
-        return ping_device(device, db)
+        return ping_and_record(device, db)
     except Exception as exc:
         raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(exc))
 
@@ -275,6 +339,78 @@ def close_fiscal_day(device_id: int, db: Session = Depends(get_db), user=Depends
         raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(exc))
 
 
+@router.get("/{device_id}/fiscal-day")
+def get_fiscal_day(device_id: int, db: Session = Depends(get_db), user=Depends(require_portal_user)):
+    """Fiscal day so far, from the locally maintained counters (no FDMS call)."""
+    device = db.query(Device).filter(Device.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+    ensure_company_access(db, user, device.company_id)
+    return fiscal_day_summary(db, device)
+
+
+@router.get("/{device_id}/fiscal-day/reconcile")
+def reconcile_fiscal_day(device_id: int, db: Session = Depends(get_db), user=Depends(require_portal_user)):
+    """Compare local fiscal day counters with GetStatus and report drift."""
+    device = db.query(Device).filter(Device.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+    ensure_company_access(db, user, device.company_id)
+    _ensure_company_certificate(db, device.company_id)
+    try:
+        return reconcile_fiscal_day_counters(device, db)
+    except FDMSUnavailableError as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc))
+    except Exception as exc:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(exc))
+
+
+@router.get("/{device_id}/offline")
+def get_offline_status(device_id: int, db: Session = Depends(get_db), user=Depends(require_portal_user)):
+    """Fiscal mode, receipts waiting for upload and recent offline files."""
+    device = db.query(Device).filter(Device.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+    ensure_company_access(db, user, device.company_id)
+    return offline_status(db, device)
+
+
+@router.post("/{device_id}/offline/sync")
+def sync_offline_receipts(device_id: int, db: Session = Depends(get_db), user=Depends(require_portal_user)):
+    """Upload offline receipts now instead of waiting for the background sync."""
+    device = db.query(Device).filter(Device.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+    ensure_company_access(db, user, device.company_id)
+    try:
+        return sync_device(db, device.id)
+    except FDMSUnavailableError as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc))
+    except Exception as exc:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(exc))
+
+
+@router.post("/{device_id}/offline/files/{file_id}/retry")
+def retry_offline_file(
+    device_id: int, file_id: int, db: Session = Depends(get_db), user=Depends(require_portal_user)
+):
+    """Upload the receipts of a refused offline file again (after fixing the cause)."""
+    device = db.query(Device).filter(Device.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+    ensure_company_access(db, user, device.company_id)
+    try:
+        retry_file(db, device, file_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    try:
+        return sync_device(db, device.id)
+    except FDMSUnavailableError as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc))
+    except Exception as exc:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(exc))
+
+
 @router.get("/{device_id}/logs", response_model=list[AuditLogRead])
 def get_device_logs(
     device_id: int,
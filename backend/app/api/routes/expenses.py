@@ -7,15 +7,13 @@ from app.api.deps import get_db, ensure_company_access, require_company_access,
 from app.models.expense import Expense
 from app.models.contact import Contact
 from app.schemas.expense import ExpenseCreate, ExpenseRead, ExpenseUpdate
+from app.services.sequence import next_daily_reference
 
 router = APIRouter(prefix="/expenses", tags=["expenses"])
 
 
 def next_expense_reference(db: Session, prefix: str = "EXP") -> str:
-    today = datetime.utcnow().strftime("%Y%m%d")
-    full_prefix = f"{prefix}-{today}-"
-    count = db.query(Expense).filter(Expense.reference.like(f"{full_prefix}%")).count()
-    return f"{full_prefix}{count + 1:04d}"
+    return next_daily_reference(db, Expense.reference, prefix, gapless=False)
 
 
 def recalc_amounts(exp: Expense) -> None:
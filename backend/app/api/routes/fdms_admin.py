@@ -0,0 +1,88 @@
+"""Operational endpoints for the FDMS integration (admin only)."""
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.api.deps import get_db, require_admin
+from app.models.company import Company
+from app.services.fdms_cache import cache_stats
+from app.services.fdms_client import client_stats
+from app.services.fdms_resilience import reset_breakers, resilience_stats
+from app.services.fiscal_day_scheduler import run_report, scheduler_stats, start_manual_run
+from app.services.heartbeat import heartbeat_stats
+from app.services.liveness import liveness_stats
+from app.services.qr_images import qr_stats
+from app.services.signing_keys import signing_key_stats
+
+router = APIRouter(prefix="/fdms", tags=["fdms"])
+
+
+@router.get("/clients")
+def fdms_client_stats(user=Depends(require_admin)):
+    """Pool and TLS handshake statistics of the pooled FDMS clients in this worker."""
+    return client_stats()
+
+
+@router.get("/cache")
+def fdms_cache_stats(user=Depends(require_admin)):
+    """GetStatus/GetConfig response cache hits, misses and coalesced calls in this worker."""
+    return cache_stats()
+
+
+@router.get("/signing-keys")
+def fdms_signing_key_stats(user=Depends(require_admin)):
+    """Hit/miss counters of the parsed signing key cache in this worker."""
+    return signing_key_stats()
+
+
+@router.get("/heartbeat")
+def fdms_heartbeat_stats(user=Depends(require_admin)):
+    """Heartbeat leader and per-device ping lag."""
+    return heartbeat_stats()
+
+
+@router.get("/liveness")
+def fdms_liveness_stats(user=Depends(require_admin)):
+    """Liveness checks on the submission path and background pings they triggered in this worker."""
+    return liveness_stats()
+
+
+@router.get("/qr-images")
+def fdms_qr_image_stats(user=Depends(require_admin)):
+    """QR image store hits and renders in this worker."""
+    return qr_stats()
+
+
+@router.get("/breakers")
+def fdms_breaker_stats(user=Depends(require_admin)):
+    """Circuit breaker states, retry budget and per-operation attempts in this worker."""
+    return resilience_stats()
+
+
+@router.post("/breakers/reset")
+def fdms_reset_breakers(
+    device_id: Optional[int] = None,
+    operation: Optional[str] = None,
+    user=Depends(require_admin),
+):
+    """Close breakers (all, or those of one device and/or operation) in this worker."""
+    scope = f"device:{device_id}" if device_id is not None else None
+    return {"reset": reset_breakers(scope, operation)}
+
+
+@router.get("/fiscal-day-scheduler")
+def fdms_fiscal_day_scheduler(user=Depends(require_admin)):
+    """Leader of the automatic fiscal day close/open scheduler."""
+    return scheduler_stats()
+
+
+@router.post("/fiscal-day-runs")
+def fdms_start_fiscal_day_run(company_id: int, db: Session = Depends(get_db), user=Depends(require_admin)):
+    """Close and reopen the fiscal day of every device of a company now.
+
+    Runs in the background; follow it on ``GET /dashboard/fiscal-day-runs/{id}``.
+    """
+    if db.get(Company, company_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Company not found")
+    return run_report(start_manual_run(db, company_id))
@@ -1,6 +1,9 @@
-﻿from datetime import datetime
+﻿import json
+from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session, selectinload, undefer_group
 
 from app.api.deps import (
     get_db, get_current_user, ensure_company_access, require_company_access, 
@@ -16,8 +19,16 @@ from app.models.stock_move import StockMove
 from app.models.stock_quant import StockQuant
 from app.models.company_settings import CompanySettings
 from app.models.audit_log import AuditAction, ResourceType
-from app.schemas.invoice import InvoiceCreate, InvoiceRead, InvoiceUpdate
+from app.schemas.invoice import (
+    InvoiceBulkFiscalize,
+    InvoiceCreate,
+    InvoiceFiscalReceipt,
+    InvoiceRead,
+    InvoiceUpdate,
+)
 from app.services.fdms import submit_invoice
+from app.services.fiscal_bulk import fiscalize_bulk, select_invoices
+from app.services.sequence import next_daily_reference
 
 router = APIRouter(prefix="/invoices", tags=["invoices"])
 
@@ -26,31 +37,32 @@ def next_invoice_reference(db: Session, prefix: str = "INV", company_id: int | N
     """Generate the next invoice reference.
 
     If company settings define a sequence (sequence_size/step/next), use that and increment
-    the `sequence_next` value. Otherwise fall back to date-based counting.
+    the `sequence_next` value. Otherwise fall back to a date-based sequence.
     """
     if company_id:
-        # Attempt to lock the settings row for update to avoid race conditions
-        try:
-            settings = db.query(CompanySettings).filter(CompanySettings.company_id == company_id).with_for_update().first()
-        except Exception:
-            # Some DB backends or SQLAlchemy configs may not support with_for_update(); fall back
-            settings = db.query(CompanySettings).filter(CompanySettings.company_id == company_id).first()
-        if settings and settings.sequence_next is not None:
-            seq_size = settings.sequence_size or 4
-            next_num = settings.sequence_next or 1
-            used_prefix = settings.invoice_prefix or prefix
+        # Atomic increment: the settings row stays locked until the invoice is committed
+        step = func.coalesce(func.nullif(CompanySettings.sequence_step, 0), 1)
+        row = db.execute(
+            update(CompanySettings)
+            .where(CompanySettings.company_id == company_id, CompanySettings.sequence_next.isnot(None))
+            .values(sequence_next=func.coalesce(func.nullif(CompanySettings.sequence_next, 0), 1) + step)
+            .returning(
+                CompanySettings.sequence_next,
+                CompanySettings.sequence_step,
+                CompanySettings.sequence_size,
+                CompanySettings.invoice_prefix,
+            )
+            .execution_options(synchronize_session="fetch")
+        ).first()
+        if row is not None:
+            seq_size = row.sequence_size or 4
+            next_num = row.sequence_next - (row.sequence_step or 1)
+            used_prefix = row.invoice_prefix or prefix
             # Format without date by default, e.g. INV-0001
-            reference = f"{used_prefix}-{next_num:0{seq_size}d}"
-            # Increment and persist
-            settings.sequence_next = next_num + (settings.sequence_step or 1)
-            db.commit()
-            return reference
+            return f"{used_prefix}-{next_num:0{seq_size}d}"
 
-    # Fallback: date-based sequence
-    today = datetime.utcnow().strftime("%Y%m%d")
-    full_prefix = f"{prefix}-{today}-"
-    count = db.query(Invoice).filter(Invoice.reference.like(f"{full_prefix}%")).count()
-    return f"{full_prefix}{count + 1:04d}"
+    # Fallback: date-based sequence, shared by all companies
+    return next_daily_reference(db, Invoice.reference, prefix, gapless=False)
 
 
 def calculate_line_amounts(line_data: dict) -> tuple[float, float, float]:
@@ -300,7 +312,7 @@ def list_invoices(
         query = query.filter(Invoice.currency.in_(codes))
     if invoice_type:
         query = query.filter(Invoice.invoice_type == invoice_type)
-    return query.order_by(Invoice.created_at.desc()).all()
+    return query.options(selectinload(Invoice.lines)).order_by(Invoice.created_at.desc()).all()
 
 
 @router.get("/{invoice_id}", response_model=InvoiceRead)
@@ -316,6 +328,25 @@ def get_invoice(
     return invoice
 
 
+@router.get("/{invoice_id}/fiscal-receipt", response_model=InvoiceFiscalReceipt)
+def get_invoice_fiscal_receipt(
+    invoice_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(require_portal_user),
+):
+    """Signed ZIMRA receipt payload, hashes and signatures of an invoice."""
+    invoice = (
+        db.query(Invoice)
+        .options(undefer_group("fiscal_artefacts"))
+        .filter(Invoice.id == invoice_id)
+        .first()
+    )
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    ensure_company_access(db, user, invoice.company_id)
+    return invoice
+
+
 @router.post("/{invoice_id}/credit-note", response_model=InvoiceRead)
 def create_credit_note(
     invoice_id: int,
@@ -524,7 +555,7 @@ def reset_invoice(
         raise HTTPException(status_code=404, detail="Invoice not found")
     ensure_company_access(db, user, invoice.company_id)
     
-    if invoice.zimra_status == "submitted":
+    if invoice.zimra_status in ("submitted", "offline"):
         raise HTTPException(status_code=400, detail="Cannot reset fiscalized invoice")
     
     invoice.status = "draft"
@@ -580,6 +611,55 @@ def register_payment(
     return invoice
 
 
+@router.post("/fiscalize-bulk")
+def fiscalize_invoices_bulk(
+    payload: InvoiceBulkFiscalize,
+    db: Session = Depends(get_db),
+    user=Depends(require_portal_user),
+):
+    """Fiscalize many invoices at once, streaming one result per document.
+
+    Select documents by ``invoice_ids`` / ``pos_order_ids`` and/or by
+    ``device_id`` and ``zimra_status`` (e.g. all ``error`` invoices).  Results
+    are streamed as NDJSON (default) or Server-Sent Events; the last record
+    is a summary.
+    """
+    ensure_company_access(db, user, payload.company_id)
+    if not can_fiscalize_invoice(db, user, payload.company_id):
+        raise HTTPException(status_code=403, detail="Permission denied to fiscalize invoices. Admin access required.")
+    if payload.format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'")
+    if payload.invoice_ids is None and payload.pos_order_ids is None and not payload.zimra_status:
+        raise HTTPException(status_code=400, detail="Give invoice_ids, pos_order_ids or a zimra_status filter")
+
+    invoice_ids = select_invoices(
+        db,
+        payload.company_id,
+        invoice_ids=payload.invoice_ids,
+        pos_order_ids=payload.pos_order_ids,
+        device_id=payload.device_id,
+        zimra_status=payload.zimra_status,
+        limit=payload.limit,
+    )
+    user_id = user.id
+    sse = payload.format == "sse"
+
+    def stream():
+        for item in fiscalize_bulk(payload.company_id, invoice_ids, user_id):
+            data = json.dumps(item, default=str)
+            if sse:
+                event = "summary" if "summary" in item else "result"
+                yield f"event: {event}\ndata: {data}\n\n"
+            else:
+                yield data + "\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/{invoice_id}/fiscalize", response_model=InvoiceRead)
 def fiscalize_invoice(
     invoice_id: int,
@@ -602,6 +682,12 @@ def fiscalize_invoice(
     if invoice.zimra_status == "submitted":
         raise HTTPException(status_code=400, detail="Invoice already fiscalized")
 
+    if invoice.zimra_status == "pending":
+        raise HTTPException(status_code=400, detail="Invoice is already queued for fiscalization")
+
+    if invoice.zimra_status == "offline":
+        raise HTTPException(status_code=400, detail="Invoice was signed offline and is waiting for upload")
+
     if not invoice.device_id:
         raise HTTPException(status_code=400, detail="No fiscal device assigned to this invoice")
 
@@ -634,7 +720,11 @@ def fiscalize_invoice(
                 "zimra_status": invoice.zimra_status,
                 "verification_code": invoice.zimra_verification_code,
             },
-            changes_summary=f"Invoice {invoice.reference} fiscalized successfully",
+            changes_summary=(
+                f"Invoice {invoice.reference} signed offline, queued for upload"
+                if invoice.zimra_status == "offline"
+                else f"Invoice {invoice.reference} fiscalized successfully"
+            ),
         )
         
         db.commit()
@@ -742,7 +832,7 @@ def cancel_invoice(
     if not check_permission(db, user, invoice.company_id, "can_cancel_invoices"):
         raise HTTPException(status_code=403, detail="Permission denied to cancel invoices")
     
-    if invoice.status == "fiscalized" or invoice.zimra_status == "submitted":
+    if invoice.status == "fiscalized" or invoice.zimra_status in ("submitted", "offline"):
         raise HTTPException(
             status_code=400, 
             detail="Cannot cancel fiscalized invoice. Create a credit note instead."
@@ -15,16 +15,14 @@ from app.schemas.payment import (
     PaymentCreate, PaymentUpdate, PaymentRead, PaymentReconcile,
     PaymentMethodCreate, PaymentMethodUpdate, PaymentMethodRead
 )
+from app.services.sequence import next_daily_reference
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 
 
 def next_payment_reference(db: Session, prefix: str = "PAY") -> str:
     """Generate next payment reference."""
-    today = datetime.utcnow().strftime("%Y%m%d")
-    full_prefix = f"{prefix}-{today}-"
-    count = db.query(Payment).filter(Payment.reference.like(f"{full_prefix}%")).count()
-    return f"{full_prefix}{count + 1:04d}"
+    return next_daily_reference(db, Payment.reference, prefix, gapless=False)
 
 
 @router.get("", response_model=List[PaymentRead])
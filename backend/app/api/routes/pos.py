@@ -3,27 +3,34 @@
 Provides endpoints for:
 - POS session management (open / close)
 - POS order creation with inline payment + optional auto-fiscalize
+  (queued on the fiscal outbox, see app/services/fiscal_outbox.py)
 - Order listing, detail, refund, receipt reprinting
 - Quick product search optimised for barcode / name lookup
 """
+import asyncio
+import time
+from dataclasses import asdict, dataclass
 from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session, joinedload
 
+from app.core.config import settings as app_settings
+from app.db.session import SessionLocal
 from app.api.deps import (
     get_db, get_current_user, ensure_company_access, require_portal_user,
     log_audit, check_permission,
 )
-from sqlalchemy import func, or_
+from sqlalchemy import func, insert, or_
 from app.models.pos_session import POSSession, POSOrder, POSOrderLine
 from app.models.invoice import Invoice
 from app.models.invoice_line import InvoiceLine
 from app.models.product import Product
 from app.models.device import Device
 from app.models.contact import Contact
-from app.models.tax_setting import TaxSetting
 from app.models.category import Category
 from app.models.company import Company
 from app.models.company_settings import CompanySettings
@@ -40,7 +47,14 @@ from app.schemas.pos import (
     POSEmployeeCreate, POSEmployeeUpdate, POSEmployeeRead,
     POSTillCreate, POSTillUpdate, POSTillRead,
 )
-from app.services.fdms import submit_invoice
+from app.services.assets import thumbnail_url
+from app.services.fiscal_outbox import enqueue_fiscalization, notify_workers
+from app.services.pos_catalog import build_catalog, catalog_version, prune_changes
+from app.services.pos_ledger import record_refund, record_sale, session_totals
+from app.services.pos_scan import scan
+from app.services.product_search import search_products
+from app.services.sequence import next_daily_reference
+from app.services.tax_resolution import TaxTable
 
 router = APIRouter(prefix="/pos", tags=["pos"])
 
@@ -48,17 +62,11 @@ router = APIRouter(prefix="/pos", tags=["pos"])
 # ── helpers ─────────────────────────────────────────────────────────────────
 
 def _next_session_name(db: Session) -> str:
-    today = datetime.utcnow().strftime("%Y%m%d")
-    prefix = f"POS-{today}-"
-    count = db.query(POSSession).filter(POSSession.name.like(f"{prefix}%")).count()
-    return f"{prefix}{count + 1:04d}"
+    return next_daily_reference(db, POSSession.name, "POS", gapless=False)
 
 
 def _next_order_ref(db: Session) -> str:
-    today = datetime.utcnow().strftime("%Y%m%d")
-    prefix = f"POS-ORD-{today}-"
-    count = db.query(POSOrder).filter(POSOrder.reference.like(f"{prefix}%")).count()
-    return f"{prefix}{count + 1:04d}"
+    return next_daily_reference(db, POSOrder.reference, "POS-ORD", gapless=False)
 
 
 def _next_invoice_ref(db: Session, company_id: int | None = None) -> str:
@@ -71,10 +79,7 @@ def _next_invoice_ref(db: Session, company_id: int | None = None) -> str:
         if settings and settings.invoice_prefix:
             base_prefix = settings.invoice_prefix
 
-    today = datetime.utcnow().strftime("%Y%m%d")
-    prefix = f"POS-{base_prefix}-{today}-"
-    count = db.query(Invoice).filter(Invoice.reference.like(f"{prefix}%")).count()
-    return f"{prefix}{count + 1:04d}"
+    return next_daily_reference(db, Invoice.reference, f"POS-{base_prefix}", gapless=False)
 
 
 def _calc_line(data: dict) -> tuple[float, float, float]:
@@ -87,6 +92,60 @@ def _calc_line(data: dict) -> tuple[float, float, float]:
     return round(subtotal, 2), round(tax, 2), round(subtotal + tax, 2)
 
 
+def _fill_line_from_product(ld, tax_table: TaxTable) -> dict:
+    """Line values with blanks filled from the product and its tax setting."""
+    line_dict = ld.model_dump()
+    product = tax_table.product(ld.product_id)
+    if product:
+        if not ld.description:
+            line_dict["description"] = product.name
+        if ld.unit_price == 0:
+            line_dict["unit_price"] = product.sale_price
+        if not ld.uom:
+            line_dict["uom"] = product.uom or "Units"
+        # Get VAT from product's tax setting
+        if ld.vat_rate == 0:
+            tax = tax_table.tax(product.tax_id)
+            if tax:
+                line_dict["vat_rate"] = tax.rate
+    return line_dict
+
+
+@dataclass
+class _PricedLine:
+    """One basket line, priced once and reused for order, stock and invoice lines."""
+    product: Product | None
+    values: dict
+    discount_amount: float
+
+
+def _price_lines(lines, tax_table: TaxTable) -> list[_PricedLine]:
+    priced = []
+    for ld in lines:
+        data = _fill_line_from_product(ld, tax_table)
+        sub, tax, total = _calc_line(data)
+        quantity = data.get("quantity", 1)
+        unit_price = data.get("unit_price", 0)
+        discount = data.get("discount", 0)
+        priced.append(_PricedLine(
+            product=tax_table.product(ld.product_id),
+            values={
+                "product_id": ld.product_id,
+                "description": data.get("description", ""),
+                "quantity": quantity,
+                "uom": data.get("uom", "Units"),
+                "unit_price": unit_price,
+                "discount": discount,
+                "vat_rate": data.get("vat_rate", 0),
+                "subtotal": sub,
+                "tax_amount": tax,
+                "total_price": total,
+            },
+            discount_amount=quantity * unit_price * (discount / 100),
+        ))
+    return priced
+
+
 def _resolve_pos_stock_location(
     db: Session,
     company_id: int,
@@ -162,6 +221,36 @@ def _get_or_create_stock_quant(
     return quant
 
 
+def _tracks_stock(product: Product) -> bool:
+    return product.product_type == "storable" and bool(product.track_inventory)
+
+
+def _load_stock_quants(
+    db: Session,
+    *,
+    company_id: int,
+    products: list[Product],
+    warehouse_id: int | None,
+    location_id: int | None,
+) -> dict[int, StockQuant]:
+    """The quant each stock-tracked product moves against, in one query."""
+    ids = {p.id for p in products if _tracks_stock(p)}
+    if not ids:
+        return {}
+    quant_q = db.query(StockQuant).filter(
+        StockQuant.product_id.in_(ids),
+        StockQuant.company_id == company_id,
+    )
+    if warehouse_id is not None:
+        quant_q = quant_q.filter(StockQuant.warehouse_id == warehouse_id)
+    if location_id is not None:
+        quant_q = quant_q.filter(StockQuant.location_id == location_id)
+    quants: dict[int, StockQuant] = {}
+    for quant in quant_q.order_by(StockQuant.id.asc()):
+        quants.setdefault(quant.product_id, quant)
+    return quants
+
+
 def _apply_pos_inventory_move(
     db: Session,
     *,
@@ -174,21 +263,14 @@ def _apply_pos_inventory_move(
     source_document: str,
     move_type: str,
     notes: str,
-) -> None:
-    if product.product_type != "storable" or not product.track_inventory or quantity <= 0:
-        return
+    quants: dict[int, StockQuant],
+) -> dict | None:
+    """Update the quant for one line (from ``_load_stock_quants``); returns the stock move row to insert."""
+    if not _tracks_stock(product) or quantity <= 0:
+        return None
 
     unit_cost = product.sales_cost or product.purchase_cost or 0
-    quant = None
-    quant_q = db.query(StockQuant).filter(
-        StockQuant.product_id == product.id,
-        StockQuant.company_id == company_id,
-    )
-    if warehouse_id is not None:
-        quant_q = quant_q.filter(StockQuant.warehouse_id == warehouse_id)
-    if location_id is not None:
-        quant_q = quant_q.filter(StockQuant.location_id == location_id)
-    quant = quant_q.order_by(StockQuant.id.asc()).first()
+    quant = quants.get(product.id)
 
     if quant:
         delta = quantity if move_type == "in" else -quantity
@@ -208,8 +290,9 @@ def _apply_pos_inventory_move(
         quant.quantity = round(quantity, 4)
         quant.available_quantity = round(quantity, 4)
         quant.total_value = round(quantity * (quant.unit_cost or 0), 2)
+        quants[product.id] = quant
 
-    db.add(StockMove(
+    return dict(
         company_id=company_id,
         product_id=product.id,
         reference=reference,
@@ -223,12 +306,28 @@ def _apply_pos_inventory_move(
         state="done",
         done_date=datetime.utcnow(),
         notes=notes,
-    ))
-    db.flush()
+    )
+
+
+def _insert_rows(db: Session, model, rows: list[dict]) -> None:
+    """One multi-row INSERT for lines and moves whose ids nobody needs back."""
+    if rows:
+        db.execute(insert(model), rows)
 
 
 # ── sessions ────────────────────────────────────────────────────────────────
 
+def _session_reads(db: Session, sessions: list[POSSession]) -> list[POSSessionRead]:
+    """Sessions with their totals summed from the ledger."""
+    totals = session_totals(db, sessions)
+    reads = []
+    for s in sessions:
+        fields = asdict(totals[s.id])
+        fields.pop("expected_cash")
+        reads.append(POSSessionRead.model_validate(s).model_copy(update=fields))
+    return reads
+
+
 @router.post("/sessions/open", response_model=POSSessionRead)
 def open_session(
     payload: POSSessionOpen,
@@ -249,7 +348,7 @@ def open_session(
         .first()
     )
     if existing:
-        return existing  # return current open session
+        return _session_reads(db, [existing])[0]  # return current open session
 
     resolved_device_id = payload.device_id
     if payload.till_id is not None:
@@ -315,7 +414,7 @@ def close_session(
         session.notes = f"{session.notes}\n{payload.notes}" if session.notes else payload.notes
 
     orders = db.query(POSOrder).filter(POSOrder.session_id == session_id).all()
-    expected_cash = session.opening_balance + session.total_cash - session.total_returns
+    expected_cash = session_totals(db, [session])[session.id].expected_cash
     difference = (payload.closing_balance or 0) - expected_cash
 
     log_audit(
@@ -337,7 +436,7 @@ def close_session(
         order_reads.append(POSOrderRead.model_validate(o))
 
     return POSSessionSummary(
-        session=POSSessionRead.model_validate(session),
+        session=_session_reads(db, [session])[0],
         orders=order_reads,
         expected_cash=round(expected_cash, 2),
         difference=round(difference, 2),
@@ -357,7 +456,7 @@ def list_sessions(
     q = db.query(POSSession).filter(POSSession.company_id == company_id)
     if status:
         q = q.filter(POSSession.status == status)
-    return q.order_by(POSSession.opened_at.desc()).offset(offset).limit(limit).all()
+    return _session_reads(db, q.order_by(POSSession.opened_at.desc()).offset(offset).limit(limit).all())
 
 
 @router.get("/sessions/{session_id}", response_model=POSSessionSummary)
@@ -378,11 +477,11 @@ def get_session(
         .order_by(POSOrder.order_date.desc())
         .all()
     )
-    expected_cash = session.opening_balance + session.total_cash - session.total_returns
+    expected_cash = session_totals(db, [session])[session.id].expected_cash
     difference = (session.closing_balance or 0) - expected_cash if session.closing_balance is not None else 0
 
     return POSSessionSummary(
-        session=POSSessionRead.model_validate(session),
+        session=_session_reads(db, [session])[0],
         orders=[POSOrderRead.model_validate(o) for o in orders],
         expected_cash=round(expected_cash, 2),
         difference=round(difference, 2),
@@ -401,7 +500,9 @@ def create_order(
 
     This is the main POS endpoint – it creates the order, creates a
     backing invoice (for fiscal trail), processes payment, and optionally
-    submits to ZIMRA in one call.
+    queues it for ZIMRA submission. The order is returned as ``paid`` with
+    ``fiscal_status="fiscal_pending"``; poll ``/orders/{id}/fiscal-status``
+    for the receipt ID and QR data.
     """
     ensure_company_access(db, user, payload.company_id)
 
@@ -508,77 +609,56 @@ def create_order(
     db.add(order)
     db.flush()
 
-    # Add lines
+    # Pricing stage: products, taxes and stock quants for the whole basket in
+    # a few queries; each line is priced once and reused below
+    tax_table = TaxTable.load(db, payload.company_id, (ld.product_id for ld in payload.lines))
+    priced_lines = _price_lines(payload.lines, tax_table)
+    quants = _load_stock_quants(
+        db,
+        company_id=payload.company_id,
+        products=[pl.product for pl in priced_lines if pl.product],
+        warehouse_id=resolved_warehouse_id,
+        location_id=resolved_location_id,
+    )
+
     subtotal_sum = 0.0
     discount_sum = 0.0
     tax_sum = 0.0
     total_sum = 0.0
-
-    for ld in payload.lines:
-        line_dict = ld.model_dump()
-
-        # Auto-fill product info
-        if ld.product_id:
-            product = db.query(Product).filter(Product.id == ld.product_id).first()
-            if product:
-                if not ld.description:
-                    line_dict["description"] = product.name
-                if ld.unit_price == 0:
-                    line_dict["unit_price"] = product.sale_price
-                if not ld.uom:
-                    line_dict["uom"] = product.uom or "Units"
-                # Get VAT from product's tax setting
-                if ld.vat_rate == 0 and product.tax_id:
-                    tax = db.query(TaxSetting).filter(TaxSetting.id == product.tax_id).first()
-                    if tax:
-                        line_dict["vat_rate"] = tax.rate
-
-        sub, tax, total = _calc_line(line_dict)
-        disc = line_dict.get("quantity", 1) * line_dict.get("unit_price", 0) * (line_dict.get("discount", 0) / 100)
-
-        ol = POSOrderLine(
-            order_id=order.id,
-            product_id=ld.product_id,
-            description=line_dict.get("description", ""),
-            quantity=line_dict.get("quantity", 1),
-            uom=line_dict.get("uom", "Units"),
-            unit_price=line_dict.get("unit_price", 0),
-            discount=line_dict.get("discount", 0),
-            vat_rate=line_dict.get("vat_rate", 0),
-            subtotal=sub,
-            tax_amount=tax,
-            total_price=total,
-        )
-        db.add(ol)
-        subtotal_sum += sub
-        discount_sum += disc
-        tax_sum += tax
-        total_sum += total
+    for pl in priced_lines:
+        subtotal_sum += pl.values["subtotal"]
+        discount_sum += pl.discount_amount
+        tax_sum += pl.values["tax_amount"]
+        total_sum += pl.values["total_price"]
 
     order.subtotal = round(subtotal_sum, 2)
     order.discount_amount = round(discount_sum, 2)
     order.tax_amount = round(tax_sum, 2)
     order.total_amount = round(total_sum, 2)
 
+    _insert_rows(db, POSOrderLine, [{"order_id": order.id, **pl.values} for pl in priced_lines])
+
     # Deduct inventory for storable products
-    for ld in payload.lines:
-        if not ld.product_id:
+    moves = []
+    for pl in priced_lines:
+        if not pl.product:
             continue
-        product = db.query(Product).filter(Product.id == ld.product_id).first()
-        if not product:
-            continue
-        _apply_pos_inventory_move(
+        move = _apply_pos_inventory_move(
             db,
             company_id=payload.company_id,
-            product=product,
-            quantity=ld.quantity,
+            product=pl.product,
+            quantity=pl.values["quantity"],
             warehouse_id=resolved_warehouse_id,
             location_id=resolved_location_id,
             reference=ref,
             source_document=ref,
             move_type="out",
             notes=f"POS sale: {ref}",
+            quants=quants,
         )
+        if move:
+            moves.append(move)
+    _insert_rows(db, StockMove, moves)
 
     # Calculate change
     paid = payload.cash_amount + payload.card_amount + payload.mobile_amount
@@ -587,12 +667,7 @@ def create_order(
     order.change_amount = round(paid - order.total_amount, 2)
     order.status = "paid"
 
-    # Update session totals
-    session.total_sales = round((session.total_sales or 0) + order.total_amount, 2)
-    session.total_cash = round((session.total_cash or 0) + payload.cash_amount, 2)
-    session.total_card = round((session.total_card or 0) + payload.card_amount, 2)
-    session.total_mobile = round((session.total_mobile or 0) + payload.mobile_amount, 2)
-    session.transaction_count = (session.transaction_count or 0) + 1
+    record_sale(db, order)
 
     # Create backing Invoice for fiscal trail
     inv_ref = _next_invoice_ref(db, company_id=payload.company_id)
@@ -622,58 +697,17 @@ def create_order(
     db.flush()
 
     # Copy lines to invoice
-    for ld in payload.lines:
-        line_dict = ld.model_dump()
-        if ld.product_id:
-            product = db.query(Product).filter(Product.id == ld.product_id).first()
-            if product:
-                if not ld.description:
-                    line_dict["description"] = product.name
-                if ld.unit_price == 0:
-                    line_dict["unit_price"] = product.sale_price
-                if not ld.uom:
-                    line_dict["uom"] = product.uom or "Units"
-                if ld.vat_rate == 0 and product.tax_id:
-                    tax = db.query(TaxSetting).filter(TaxSetting.id == product.tax_id).first()
-                    if tax:
-                        line_dict["vat_rate"] = tax.rate
-
-        sub, tax_amt, total = _calc_line(line_dict)
-        db.add(InvoiceLine(
-            invoice_id=invoice.id,
-            product_id=ld.product_id,
-            description=line_dict.get("description", ""),
-            quantity=line_dict.get("quantity", 1),
-            uom=line_dict.get("uom", "Units"),
-            unit_price=line_dict.get("unit_price", 0),
-            discount=line_dict.get("discount", 0),
-            vat_rate=line_dict.get("vat_rate", 0),
-            subtotal=sub,
-            tax_amount=tax_amt,
-            total_price=total,
-        ))
+    _insert_rows(db, InvoiceLine, [{"invoice_id": invoice.id, **pl.values} for pl in priced_lines])
 
     order.invoice_id = invoice.id
     db.flush()
 
-    # Auto-fiscalize
+    # Auto-fiscalize: queue on the outbox so checkout does not wait on FDMS
     if payload.auto_fiscalize and device:
-        try:
-            result = submit_invoice(invoice, db)
-            invoice.status = "fiscalized"
-            invoice.fiscalized_at = datetime.utcnow()
-            invoice.fiscalized_by_id = user.id
-            order.is_fiscalized = True
-            order.status = "fiscalized"
-            order.zimra_receipt_id = invoice.zimra_receipt_id
-            order.zimra_verification_code = invoice.zimra_verification_code
-            order.zimra_verification_url = invoice.zimra_verification_url
-        except Exception as exc:
-            order.fiscal_errors = str(exc)
-            invoice.zimra_status = "error"
-            invoice.zimra_errors = str(exc)
+        enqueue_fiscalization(db, invoice, order, user_id=user.id)
 
     db.commit()
+    notify_workers()
     db.refresh(order)
     return order
 
@@ -732,7 +766,7 @@ def fiscalize_order(
     db: Session = Depends(get_db),
     user=Depends(require_portal_user),
 ):
-    """Fiscalize a paid POS order that wasn't fiscalized at sale time."""
+    """Re-queue a paid POS order that wasn't fiscalized at sale time."""
     order = db.query(POSOrder).filter(POSOrder.id == order_id).first()
     if not order:
         raise HTTPException(404, "Order not found")
@@ -751,37 +785,77 @@ def fiscalize_order(
     if not invoice.device_id:
         raise HTTPException(400, "No fiscal device assigned. Assign a device in settings.")
 
+    enqueue_fiscalization(db, invoice, order, user_id=user.id)
+    log_audit(
+        db=db, user=user,
+        action="pos_order_fiscalize_queued",
+        resource_type="pos_order",
+        resource_id=order.id,
+        resource_reference=order.reference,
+        company_id=order.company_id,
+        changes_summary=f"POS order {order.reference} queued for fiscalization",
+    )
+    db.commit()
+    notify_workers()
+    db.refresh(order)
+    return order
+
+
+def _fiscal_status_read(order_id: int) -> POSOrderRead:
+    db = SessionLocal()
     try:
-        submit_invoice(invoice, db)
-        invoice.status = "fiscalized"
-        invoice.fiscalized_at = datetime.utcnow()
-        invoice.fiscalized_by_id = user.id
-        order.is_fiscalized = True
-        order.status = "fiscalized"
-        order.zimra_receipt_id = invoice.zimra_receipt_id
-        order.zimra_verification_code = invoice.zimra_verification_code
-        order.zimra_verification_url = invoice.zimra_verification_url
-        order.fiscal_errors = ""
-
-        log_audit(
-            db=db, user=user,
-            action="pos_order_fiscalize",
-            resource_type="pos_order",
-            resource_id=order.id,
-            resource_reference=order.reference,
-            company_id=order.company_id,
-            changes_summary=f"POS order {order.reference} fiscalized",
-        )
-        db.commit()
-        db.refresh(order)
-    except Exception as exc:
-        order.fiscal_errors = str(exc)
-        invoice.zimra_status = "error"
-        invoice.zimra_errors = str(exc)
-        db.commit()
-        db.refresh(order)
+        order = db.query(POSOrder).filter(POSOrder.id == order_id).first()
+        if not order:
+            raise HTTPException(404, "Order not found")
+        return POSOrderRead.model_validate(order)
+    finally:
+        db.close()
 
-    return order
+
+_fiscal_status_waiters = 0
+
+
+@router.get("/orders/{order_id}/fiscal-status", response_model=POSOrderRead)
+async def order_fiscal_status(
+    order_id: int,
+    wait: float = Query(0, ge=0, le=30),
+    db: Session = Depends(get_db),
+    user=Depends(require_portal_user),
+):
+    """Return the order with its fiscal state.
+
+    With ``wait`` > 0 the call long-polls for up to that many seconds while
+    the order is still ``fiscal_pending``, so a till can print the receipt as
+    soon as the receipt ID and QR data arrive.  Waiting happens on the event
+    loop without a database session: each poll reads the order in a short
+    session of its own.  Beyond ``pos_fiscal_status_max_waiters`` concurrent
+    waiters the current state is returned straight away.
+    """
+    global _fiscal_status_waiters
+
+    def check_access() -> None:
+        order = db.query(POSOrder.company_id).filter(POSOrder.id == order_id).first()
+        if not order:
+            raise HTTPException(404, "Order not found")
+        ensure_company_access(db, user, order.company_id)
+        db.close()
+
+    await run_in_threadpool(check_access)
+    result = await run_in_threadpool(_fiscal_status_read, order_id)
+    if result.fiscal_status != "fiscal_pending" or not wait:
+        return result
+    if _fiscal_status_waiters >= app_settings.pos_fiscal_status_max_waiters:
+        return result
+
+    _fiscal_status_waiters += 1
+    try:
+        deadline = time.monotonic() + wait
+        while result.fiscal_status == "fiscal_pending" and time.monotonic() < deadline:
+            await asyncio.sleep(0.25)
+            result = await run_in_threadpool(_fiscal_status_read, order_id)
+    finally:
+        _fiscal_status_waiters -= 1
+    return result
 
 
 @router.post("/orders/{order_id}/refund", response_model=POSOrderRead)
@@ -829,6 +903,17 @@ def refund_order(
     db.add(refund)
     db.flush()
 
+    product_ids = {line.product_id for line in order.lines if line.product_id}
+    products = {p.id: p for p in db.query(Product).filter(Product.id.in_(product_ids))} if product_ids else {}
+    quants = _load_stock_quants(
+        db,
+        company_id=order.company_id,
+        products=list(products.values()),
+        warehouse_id=refund_warehouse_id,
+        location_id=refund_location_id,
+    )
+
+    moves = []
     for line in order.lines:
         db.add(POSOrderLine(
             order_id=refund.id,
@@ -843,12 +928,10 @@ def refund_order(
             tax_amount=-line.tax_amount,
             total_price=-line.total_price,
         ))
-        if not line.product_id:
-            continue
-        product = db.query(Product).filter(Product.id == line.product_id).first()
+        product = products.get(line.product_id)
         if not product:
             continue
-        _apply_pos_inventory_move(
+        move = _apply_pos_inventory_move(
             db,
             company_id=order.company_id,
             product=product,
@@ -859,7 +942,11 @@ def refund_order(
             source_document=order.reference,
             move_type="in",
             notes=f"POS refund return: {refund_ref} for {order.reference}",
+            quants=quants,
         )
+        if move:
+            moves.append(move)
+    _insert_rows(db, StockMove, moves)
 
     # Create credit note invoice
     cn_ref = f"CN-{refund_ref}"
@@ -904,27 +991,15 @@ def refund_order(
     refund.invoice_id = cn.id
     order.status = "refunded"
 
-    # Update session
     if session:
-        session.total_returns = round((session.total_returns or 0) + abs(order.total_amount), 2)
-        session.transaction_count = (session.transaction_count or 0) + 1
+        record_refund(db, refund, order)
 
-    # Auto-fiscalize credit note if device available
+    # Queue the credit note for fiscalization if a device is available
     if session and session.device_id:
-        try:
-            submit_invoice(cn, db)
-            cn.status = "fiscalized"
-            cn.fiscalized_at = datetime.utcnow()
-            cn.fiscalized_by_id = user.id
-            refund.is_fiscalized = True
-            refund.status = "fiscalized"
-            refund.zimra_receipt_id = cn.zimra_receipt_id
-            refund.zimra_verification_code = cn.zimra_verification_code
-            refund.zimra_verification_url = cn.zimra_verification_url
-        except Exception as exc:
-            refund.fiscal_errors = str(exc)
+        enqueue_fiscalization(db, cn, refund, user_id=user.id)
 
     db.commit()
+    notify_workers()
     db.refresh(refund)
     return refund
 
@@ -939,6 +1014,7 @@ def pos_products(
     till_id: Optional[int] = None,
     employee_id: Optional[int] = None,
     limit: int = Query(100, le=500),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
     user=Depends(require_portal_user),
 ):
@@ -1034,17 +1110,13 @@ def pos_products(
                     Product.product_type != "storable",
                 )
             )
-    if search:
-        like = f"%{search}%"
-        q = q.filter(
-            Product.name.ilike(like)
-            | Product.barcode.ilike(like)
-            | Product.reference.ilike(like)
-        )
     if category_id:
         q = q.filter(Product.category_id == category_id)
 
-    products = q.order_by(Product.name).limit(limit).all()
+    if search:
+        products = search_products(db, q, company_id, search, offset=offset, limit=limit)
+    else:
+        products = q.order_by(Product.name).offset(offset).limit(limit).all()
 
     # Batch load stock quantities
     product_ids = [p.id for p in products]
@@ -1064,13 +1136,13 @@ def pos_products(
         quants = quant_q.group_by(StockQuant.product_id).all()
         stock_map = {pid: qty for pid, qty in quants}
 
+    tax_table = TaxTable.for_products(db, company_id, products)
     result = []
     for p in products:
         vat_rate = p.tax_rate or 0
-        if p.tax_id:
-            tax = db.query(TaxSetting).filter(TaxSetting.id == p.tax_id).first()
-            if tax:
-                vat_rate = tax.rate
+        tax = tax_table.tax(p.tax_id)
+        if tax:
+            vat_rate = tax.rate
         result.append({
             "id": p.id,
             "name": p.name,
@@ -1082,7 +1154,7 @@ def pos_products(
             "category_id": p.category_id,
             "category_name": p.category.name if p.category else "",
             "description": p.description,
-            "image_url": p.image_url or "",
+            "image_url": thumbnail_url(p.image_url, "pos"),
             "stock_on_hand": round(stock_map.get(p.id, 0), 2),
             "track_inventory": p.track_inventory,
             "product_type": p.product_type,
@@ -1090,6 +1162,62 @@ def pos_products(
     return result
 
 
+@router.get("/catalog")
+def pos_catalog(
+    company_id: int,
+    request: Request,
+    till_id: Optional[int] = None,
+    since: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(get_db),
+    user=Depends(require_portal_user),
+):
+    """Versioned product catalog for till sync.
+
+    Without ``since`` returns a full snapshot; with the ``version`` of an
+    earlier response returns only the products changed since then (``full``
+    is true if the change log no longer reaches back that far).  Stock is
+    that of the till's warehouse.  Send the ``ETag`` back in
+    ``If-None-Match`` to get 304 while nothing changed.
+    """
+    ensure_company_access(db, user, company_id)
+    warehouse_id = None
+    if till_id is not None:
+        till = db.query(POSTill).filter(POSTill.id == till_id, POSTill.company_id == company_id).first()
+        if not till:
+            raise HTTPException(404, "POS till not found")
+        if not till.is_active:
+            raise HTTPException(400, "POS till is inactive")
+        warehouse_id = till.warehouse_id
+
+    version = catalog_version(db, company_id)
+    etag = f'"catalog-{company_id}-{till_id or 0}-{version}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in request.headers.get("if-none-match", "") or (since and since == version):
+        return Response(status_code=304, headers=headers)
+    body = build_catalog(db, company_id, warehouse_id, since, version)
+    prune_changes(db)
+    return JSONResponse(body, headers=headers)
+
+
+@router.get("/scan/{code}")
+def pos_scan(
+    code: str,
+    company_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(require_portal_user),
+):
+    """Product for a scanned barcode or internal reference, with its price and effective VAT.
+
+    Answered from an in-memory index (see ``app.services.pos_scan``); stock
+    is not included, tills take it from the catalog.
+    """
+    ensure_company_access(db, user, company_id)
+    product = scan(db, company_id, code)
+    if product is None:
+        raise HTTPException(404, "No product with this barcode")
+    return product
+
+
 @router.get("/categories")
 def pos_categories(
     company_id: int,
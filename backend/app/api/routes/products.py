@@ -1,7 +1,6 @@
-﻿from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+﻿from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-import base64
 
 from app.api.deps import get_db, ensure_company_access, require_company_access, require_portal_user, log_audit
 from app.models.audit_log import AuditAction, ResourceType
@@ -14,6 +13,8 @@ from app.models.pos_session import POSOrderLine
 from app.models.stock_move import StockMove
 from app.models.stock_quant import StockQuant
 from app.schemas.product import ProductCreate, ProductRead, ProductUpdate, ProductWithStock
+from app.services.assets import check_image, externalize, store
+from app.services.product_search import search_products
 
 router = APIRouter(prefix="/products", tags=["products"])
 
@@ -26,6 +27,7 @@ def create_product(
 ):
     ensure_company_access(db, user, payload.company_id)
     product = Product(**payload.dict())
+    product.image_url = externalize(db, product.image_url)
     db.add(product)
     db.commit()
     db.refresh(product)
@@ -57,25 +59,26 @@ def list_products(
     search: str | None = None,
     is_active: bool | None = None,
     can_be_sold: bool | None = None,
+    limit: int | None = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
     user=Depends(require_portal_user),
     _=Depends(require_company_access),
 ):
+    """Products of a company; with ``search``, ranked by relevance (see ``app.services.product_search``)."""
     query = db.query(Product).filter(Product.company_id == company_id)
     if category_id:
         query = query.filter(Product.category_id == category_id)
-    if search:
-        like = f"%{search}%"
-        query = query.filter(
-            Product.name.ilike(like) | 
-            Product.barcode.ilike(like) |
-            Product.reference.ilike(like)
-        )
     if is_active is not None:
         query = query.filter(Product.is_active == is_active)
     if can_be_sold is not None:
         query = query.filter(Product.can_be_sold == can_be_sold)
-    return query.order_by(Product.name).all()
+    if search:
+        return search_products(db, query, company_id, search, offset=offset, limit=limit)
+    query = query.order_by(Product.name).offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
 
 
 @router.get("/with-stock", response_model=list[ProductWithStock])
@@ -141,6 +144,8 @@ def update_product(
         "sale_price": product.sale_price,
     }
     updates = payload.dict(exclude_unset=True)
+    if "image_url" in updates:
+        updates["image_url"] = externalize(db, updates["image_url"])
     for field, value in updates.items():
         setattr(product, field, value)
     db.commit()
@@ -230,24 +235,16 @@ def upload_product_image(
     db: Session = Depends(get_db),
     user=Depends(require_portal_user),
 ):
-    """Upload a product image. Stores as base64 data URL."""
+    """Upload a product image into the asset store."""
     product = db.query(Product).filter(Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     ensure_company_access(db, user, product.company_id)
 
-    # Validate file type
-    allowed = {"image/jpeg", "image/png", "image/gif", "image/webp", "image/svg+xml"}
-    if file.content_type not in allowed:
-        raise HTTPException(status_code=400, detail="Invalid image type. Allowed: JPEG, PNG, GIF, WebP, SVG")
-
-    # Read and encode
     content = file.file.read()
-    if len(content) > 5 * 1024 * 1024:  # 5MB limit
-        raise HTTPException(status_code=400, detail="Image too large. Max 5MB")
+    check_image(file.content_type, content)
 
-    b64 = base64.b64encode(content).decode("utf-8")
-    product.image_url = f"data:{file.content_type};base64,{b64}"
+    product.image_url = store(db, content, file.content_type)
     db.commit()
     db.refresh(product)
     return product
@@ -11,6 +11,7 @@ from app.models.stock_move import StockMove
 from app.models.stock_quant import StockQuant
 from app.models.warehouse import Warehouse
 from app.models.location import Location
+from app.services.sequence import next_daily_reference
 from app.schemas.purchase_order import (
     PurchaseOrderCreate,
     PurchaseOrderRead,
@@ -22,10 +23,7 @@ router = APIRouter(prefix="/purchases", tags=["purchases"])
 
 
 def next_purchase_reference(db: Session, prefix: str = "PO") -> str:
-    today = datetime.utcnow().strftime("%Y%m%d")
-    full_prefix = f"{prefix}-{today}-"
-    count = db.query(PurchaseOrder).filter(PurchaseOrder.reference.like(f"{full_prefix}%")).count()
-    return f"{full_prefix}{count + 1:04d}"
+    return next_daily_reference(db, PurchaseOrder.reference, prefix, gapless=False)
 
 
 def calculate_line_amounts(line_data: dict) -> tuple[float, float, float]:
@@ -0,0 +1,78 @@
+"""QR code images of fiscal verification URLs (PNG or SVG)."""
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.orm import Session
+
+from app.api.deps import ensure_company_access, get_db, require_portal_user
+from app.models.invoice import Invoice
+from app.models.pos_session import POSOrder
+from app.services.qr_images import CONTENT_TYPES, decode_token, get_image
+
+router = APIRouter(prefix="/qr", tags=["qr"])
+
+_IMMUTABLE = "max-age=31536000, immutable"
+# The image behind an invoice or order id changes if the document is
+# re-fiscalized, so browsers revalidate it against the ETag on every use
+_REVALIDATE = "private, no-cache"
+
+
+def _image_response(request: Request, data: str, fmt: str, scale: int | None, cache_control: str) -> Response:
+    if fmt not in CONTENT_TYPES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="format must be 'png' or 'svg'")
+    key, body = get_image(data, fmt, scale)
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type=CONTENT_TYPES[fmt], headers=headers)
+
+
+@router.get("/invoices/{invoice_id}")
+def invoice_qr(
+    invoice_id: int,
+    request: Request,
+    format: str = "png",
+    scale: int | None = Query(None, ge=1, le=20),
+    db: Session = Depends(get_db),
+    user=Depends(require_portal_user),
+):
+    """QR image of an invoice's ZIMRA verification URL."""
+    invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
+    if not invoice:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invoice not found")
+    ensure_company_access(db, user, invoice.company_id)
+    if not invoice.zimra_verification_url:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invoice has not been fiscalized")
+    return _image_response(request, invoice.zimra_verification_url, format, scale, _REVALIDATE)
+
+
+@router.get("/pos-orders/{order_id}")
+def pos_order_qr(
+    order_id: int,
+    request: Request,
+    format: str = "png",
+    scale: int | None = Query(None, ge=1, le=20),
+    db: Session = Depends(get_db),
+    user=Depends(require_portal_user),
+):
+    """QR image of a POS order's ZIMRA verification URL."""
+    order = db.query(POSOrder).filter(POSOrder.id == order_id).first()
+    if not order:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    ensure_company_access(db, user, order.company_id)
+    if not order.zimra_verification_url:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order has not been fiscalized")
+    return _image_response(request, order.zimra_verification_url, format, scale, _REVALIDATE)
+
+
+@router.get("/{filename}")
+def qr_image(filename: str, request: Request, scale: int | None = Query(None, ge=1, le=20)):
+    """QR image behind a ``qr_url`` (``<token>.png`` / ``<token>.svg``); no login needed.
+
+    Receipts embed this URL in an ``<img>``, so it must work without a bearer
+    token; the signed token limits it to verification URLs we issued.
+    """
+    token, _, fmt = filename.rpartition(".")
+    data = decode_token(token)
+    if data is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown QR code")
+    return _image_response(request, data, fmt, scale, f"public, {_IMMUTABLE}")
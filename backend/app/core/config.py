@@ -18,6 +18,49 @@ class Settings(BaseSettings):
     fdms_api_url: str = "https://fdmsapitest.zimra.co.zw"
     fdms_verify_ssl: bool = True
     fdms_timeout_seconds: int = 30
+    fdms_connect_timeout_seconds: float = 5.0
+    fdms_max_attempts: int = 3
+    fdms_retry_budget_ratio: float = 0.1
+    fdms_retry_budget_min: int = 10
+    fdms_breaker_failure_threshold: int = 5
+    fdms_breaker_reset_seconds: float = 30.0
+    fdms_status_cache_seconds: float = 30.0
+    fdms_config_cache_seconds: float = 600.0
+    signing_key_cache_size: int = 256
+    fiscal_outbox_workers: int = 4
+    fiscal_outbox_max_attempts: int = 5
+    fiscal_outbox_poll_seconds: float = 2.0
+    pos_fiscal_status_max_waiters: int = 32
+    receipt_chain_lock_timeout_seconds: float = 60.0
+    fiscal_offline_enabled: bool = True
+    fiscal_offline_batch_size: int = 200
+    fiscal_offline_sync_seconds: float = 30.0
+    fiscal_close_day_local_counters: bool = True
+    fiscal_bulk_device_concurrency: int = 4
+    fiscal_bulk_max_documents: int = 2000
+    heartbeat_enabled: bool = True
+    heartbeat_workers: int = 8
+    heartbeat_jitter: float = 0.1
+    heartbeat_lease_seconds: float = 30.0
+    heartbeat_tick_seconds: float = 1.0
+    fiscal_day_scheduler_enabled: bool = True
+    fiscal_day_scheduler_workers: int = 8
+    fiscal_day_scheduler_max_attempts: int = 3
+    fiscal_day_scheduler_retry_seconds: float = 30.0
+    fiscal_day_scheduler_grace_minutes: int = 120
+    fiscal_day_scheduler_lease_seconds: float = 60.0
+    fiscal_day_scheduler_tick_seconds: float = 30.0
+    fiscal_day_close_wait_seconds: float = 60.0
+    receipt_audit_workers: int = 4
+    receipt_audit_batch_size: int = 1000
+    qr_cache_dir: str = "var/qr"
+    qr_memory_cache_items: int = 1024
+    qr_default_scale: int = 4
+    catalog_change_retention_days: int = 30
+    asset_memory_cache_mb: int = 64
+    pos_scan_recheck_seconds: float = 2.0
+    product_search_recheck_seconds: float = 2.0
+    product_search_max_results: int = 1000
 
     class Config:
         env_file = ".env"
@@ -75,6 +75,13 @@ def ensure_new_columns():
                 else:
                     _startup_logger.info(">>> cashier_name column already exists")
 
+                if "fiscal_status" not in cols:
+                    _startup_logger.info(">>> Adding fiscal_status column to pos_orders")
+                    conn.execute(text(
+                        "ALTER TABLE pos_orders ADD COLUMN fiscal_status VARCHAR(30) DEFAULT ''"
+                    ))
+                    _startup_logger.info(">>> fiscal_status column added successfully")
+
                 if "till_id" not in cols:
                     _startup_logger.info(">>> Adding till_id column to pos_orders")
                     conn.execute(text(
@@ -86,6 +93,23 @@ def ensure_new_columns():
             else:
                 _startup_logger.info(">>> ensure_new_columns: pos_orders table not found — skipping pos_orders patch")
 
+            if "devices" in table_names:
+                device_cols = {c["name"] for c in insp.get_columns("devices")}
+                if "fiscal_mode" not in device_cols:
+                    _startup_logger.info(">>> Adding fiscal_mode column to devices")
+                    conn.execute(text(
+                        "ALTER TABLE devices ADD COLUMN fiscal_mode VARCHAR(20) DEFAULT 'online'"
+                    ))
+                    _startup_logger.info(">>> devices.fiscal_mode column added successfully")
+                if "offline_since" not in device_cols:
+                    _startup_logger.info(">>> Adding offline_since column to devices")
+                    conn.execute(text(
+                        "ALTER TABLE devices ADD COLUMN offline_since TIMESTAMP WITH TIME ZONE"
+                        if engine.dialect.name == "postgresql"
+                        else "ALTER TABLE devices ADD COLUMN offline_since DATETIME"
+                    ))
+                    _startup_logger.info(">>> devices.offline_since column added successfully")
+
             if "locations" in table_names:
                 location_cols = {c["name"] for c in insp.get_columns("locations")}
                 if "is_scrap" not in location_cols:
@@ -108,6 +132,19 @@ def ensure_new_columns():
                 else:
                     _startup_logger.info(">>> portal_apps column already exists")
 
+            if "company_settings" in table_names:
+                settings_cols = {c["name"] for c in insp.get_columns("company_settings")}
+                if "fiscal_day_auto_close" not in settings_cols:
+                    _startup_logger.info(">>> Adding fiscal_day_auto_close column to company_settings")
+                    conn.execute(text(
+                        "ALTER TABLE company_settings ADD COLUMN fiscal_day_auto_close BOOLEAN DEFAULT FALSE"
+                    ))
+                if "fiscal_day_cutoff" not in settings_cols:
+                    _startup_logger.info(">>> Adding fiscal_day_cutoff column to company_settings")
+                    conn.execute(text(
+                        "ALTER TABLE company_settings ADD COLUMN fiscal_day_cutoff VARCHAR(5) DEFAULT '23:59'"
+                    ))
+
             if "company_users" in table_names:
                 company_user_cols = {c["name"] for c in insp.get_columns("company_users")}
                 if "portal_apps" not in company_user_cols:
@@ -283,90 +320,48 @@ def ensure_default_portal_user():
         db.close()
 
 
-# --------------- Background device ping scheduler ---------------
-import threading
-import time
-import logging
-import sys
-import os
-
-_ping_logger = logging.getLogger("device_ping")
-_ping_logger.setLevel(logging.INFO)
-if not _ping_logger.handlers:
-    _handler = logging.StreamHandler(sys.stderr)
-    _handler.setFormatter(logging.Formatter("[%(asctime)s] %(name)s %(levelname)s: %(message)s"))
-    _ping_logger.addHandler(_handler)
+@app.on_event("startup")
+def start_device_heartbeat():
+    """Start the device heartbeat scheduler; the DB lease picks one leader."""
+    from app.services.heartbeat import start_heartbeat_scheduler
 
-# Only start one ping thread across workers (use PID file to coordinate)
-_PING_LOCK_FILE = "/tmp/365fiscal_ping.lock"
+    try:
+        start_heartbeat_scheduler()
+    except Exception as e:
+        _startup_logger.error("Failed to start device heartbeat scheduler: %s", e)
 
 
-def _ping_all_devices():
-    """Ping every registered device that has a certificate to keep them online."""
-    from app.models.device import Device
-    from app.services.fdms import ping_device
-    from datetime import datetime
+@app.on_event("startup")
+def start_fiscal_day_scheduler():
+    """Start the scheduler that closes and reopens fiscal days at each company's cut-off."""
+    from app.services.fiscal_day_scheduler import start_fiscal_day_scheduler as start_scheduler
 
-    db = SessionLocal()
     try:
-        devices = (
-            db.query(Device)
-            .filter(Device.crt_data.isnot(None), Device.key_data.isnot(None))
-            .all()
-        )
-        _ping_logger.info("Found %d registered devices to ping", len(devices))
-        for device in devices:
-            try:
-                result = ping_device(device, db)
-                device.last_ping_at = datetime.utcnow()
-                if result.get("reportingFrequency"):
-                    device.reporting_frequency = int(result["reportingFrequency"])
-                db.commit()
-                _ping_logger.info("Pinged device %s (ID %s) OK", device.device_id, device.id)
-            except Exception as e:
-                _ping_logger.warning("Ping failed for device %s: %s", device.device_id, e)
-                db.rollback()
+        start_scheduler()
     except Exception as e:
-        _ping_logger.error("Ping loop error: %s", e)
-    finally:
-        db.close()
+        _startup_logger.error("Failed to start fiscal day scheduler: %s", e)
 
 
-def _ping_loop():
-    """Background thread that pings devices every 3 minutes."""
-    _ping_logger.info("Ping loop thread started, first ping in 10 seconds...")
-    time.sleep(10)  # wait for app to be fully ready
-    while True:
-        try:
-            _ping_all_devices()
-        except Exception as e:
-            _ping_logger.error("Ping loop exception: %s", e)
-        time.sleep(180)  # 3 minutes
+@app.on_event("startup")
+def start_fiscal_outbox():
+    """Start the workers that drain the fiscalization outbox."""
+    from app.services.fiscal_outbox import start_outbox_workers
+
+    try:
+        start_outbox_workers()
+    except Exception as e:
+        _startup_logger.error("Failed to start fiscal outbox workers: %s", e)
 
 
 @app.on_event("startup")
-def start_ping_scheduler():
-    """Start the background ping thread on app startup (only in first worker)."""
+def start_fiscal_offline_sync():
+    """Start the loop that uploads receipts signed while FDMS was offline."""
+    from app.services.fiscal_offline import start_offline_sync
+
     try:
-        # Simple coordination: only the first worker to grab the lock file starts the thread
-        pid = str(os.getpid())
-        if os.path.exists(_PING_LOCK_FILE):
-            try:
-                with open(_PING_LOCK_FILE) as f:
-                    old_pid = f.read().strip()
-                # Check if old process is still alive
-                if old_pid and os.path.exists(f"/proc/{old_pid}"):
-                    _ping_logger.info("Ping scheduler already running in PID %s, skipping", old_pid)
-                    return
-            except Exception:
-                pass
-        with open(_PING_LOCK_FILE, "w") as f:
-            f.write(pid)
-        t = threading.Thread(target=_ping_loop, daemon=True, name="device-ping")
-        t.start()
-        _ping_logger.info("Device ping scheduler started in PID %s (every 3 min)", pid)
+        start_offline_sync()
     except Exception as e:
-        _ping_logger.error("Failed to start ping scheduler: %s", e)
+        _startup_logger.error("Failed to start offline fiscal sync: %s", e)
 
 
 @app.get("/health")
@@ -26,7 +26,15 @@ from app.models.expense import Expense
 from app.models.expense_category import ExpenseCategory
 from app.models.subscription import Subscription, ActivationCode
 from app.models.notification import Notification
-from app.models.pos_session import POSSession, POSOrder, POSOrderLine
+from app.models.pos_session import POSSession, POSOrder, POSOrderLine, POSSessionEntry
 from app.models.pos_employee import POSEmployee
 from app.models.pos_till import POSTill, pos_till_employees
 from app.models.currency import Currency, CurrencyRate
+from app.models.fiscal_outbox import FiscalOutbox
+from app.models.fiscal_file import FiscalFile
+from app.models.fiscal_day_counter import FiscalDayCounter
+from app.models.scheduler_lease import SchedulerLease
+from app.models.fiscal_day_run import FiscalDayRun
+from app.models.document_sequence import DocumentSequence
+from app.models.catalog_change import CatalogChange
+from app.models.asset import Asset
@@ -0,0 +1,21 @@
+"""Binary assets (product images, company logos) stored by content hash."""
+from sqlalchemy import Integer, LargeBinary, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+from app.models.common import TimestampMixin
+
+
+class Asset(Base, TimestampMixin):
+    """An uploaded file or one of its thumbnails.
+
+    Originals are keyed by the SHA-256 of their bytes; a thumbnail is keyed
+    ``<original key>.<size>`` since it is derived from the original.  Either
+    way a key always names the same bytes, so it serves as a strong ETag.
+    """
+    __tablename__ = "assets"
+
+    key: Mapped[str] = mapped_column(String(80), primary_key=True)
+    content_type: Mapped[str] = mapped_column(String(100))
+    size: Mapped[int] = mapped_column(Integer, default=0)
+    data: Mapped[bytes] = mapped_column(LargeBinary, deferred=True)
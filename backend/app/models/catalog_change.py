@@ -0,0 +1,29 @@
+"""Change log behind the POS catalog sync."""
+from sqlalchemy import ForeignKey, Index, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+from app.models.common import TimestampMixin
+
+
+class CatalogChange(Base, TimestampMixin):
+    """One write to a product, tax setting, stock quant or category of a company.
+
+    Rows are appended in the writing transaction by the session hooks in
+    ``app.services.pos_catalog``.  ``version`` comes from the company's
+    ``catalog`` sequence, bumped in that same transaction, so versions
+    become visible in order: a till that synced at version ``v`` has seen
+    every change up to ``v`` and only needs those above it.
+    """
+    __tablename__ = "catalog_changes"
+    __table_args__ = (
+        Index("ix_catalog_changes_company_version", "company_id", "version"),
+        Index("ix_catalog_changes_created_at", "created_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    company_id: Mapped[int] = mapped_column(ForeignKey("companies.id"))
+    version: Mapped[int] = mapped_column(Integer)
+    entity: Mapped[str] = mapped_column(String(20))  # product, tax, stock, category
+    entity_id: Mapped[int] = mapped_column(Integer)
+    product_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
@@ -48,6 +48,9 @@ class CompanySettings(Base, TimestampMixin):
     zimra_bp_no: Mapped[str] = mapped_column(String(50), default="")
     zimra_tin: Mapped[str] = mapped_column(String(50), default="")
     fiscal_auto_submit: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Close and reopen every device's fiscal day daily at this CAT time (HH:MM)
+    fiscal_day_auto_close: Mapped[bool] = mapped_column(Boolean, default=False)
+    fiscal_day_cutoff: Mapped[str] = mapped_column(String(5), default="23:59")
     
     # Tax settings
     default_sales_tax_id: Mapped[int | None] = mapped_column(ForeignKey("tax_settings.id"), nullable=True)
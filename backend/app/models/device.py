@@ -31,5 +31,9 @@ class Device(Base, TimestampMixin):
     last_ping_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     reporting_frequency: Mapped[int] = mapped_column(Integer, default=5)  # minutes
     fiscal_day_opened_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # "online" submits receipts one by one; "offline" signs and chains them
+    # locally until they are uploaded as files (see services/fiscal_offline.py)
+    fiscal_mode: Mapped[str] = mapped_column(String(20), default="online")
+    offline_since: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     company = relationship("Company", back_populates="devices")
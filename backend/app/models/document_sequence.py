@@ -0,0 +1,27 @@
+"""Counters behind document references."""
+from sqlalchemy import Integer, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+from app.models.common import TimestampMixin
+
+
+class DocumentSequence(Base, TimestampMixin):
+    """Last number handed out in one reference series.
+
+    A series is a document prefix (``POS-ORD``, ``INV``...) in a period (the
+    day, for references like ``PO-20261017-0001``) and a scope: a company id,
+    or ``0`` for series shared by all companies because their references are
+    unique table-wide.  ``0`` rather than NULL keeps the unique constraint
+    effective on every backend.
+    """
+    __tablename__ = "document_sequences"
+    __table_args__ = (
+        UniqueConstraint("company_id", "code", "period", name="uq_document_sequences_key"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    company_id: Mapped[int] = mapped_column(Integer, default=0)
+    code: Mapped[str] = mapped_column(String(100))
+    period: Mapped[str] = mapped_column(String(20), default="")
+    value: Mapped[int] = mapped_column(Integer, default=0)
@@ -0,0 +1,34 @@
+"""Locally maintained fiscal day counters per device."""
+from sqlalchemy import Float, ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+from app.models.common import TimestampMixin
+
+
+class FiscalDayCounter(Base, TimestampMixin):
+    """Running value of one ZIMRA fiscal counter for a device's fiscal day.
+
+    Rows are keyed like the counters FDMS reports: ``counter_type`` plus
+    currency and either ``tax_id`` (``*ByTax`` counters) or ``money_type``
+    (``BalanceByMoneyType``).  The unused part of the key is stored as ``0`` /
+    ``""`` so the unique constraint holds on every backend.
+    """
+    __tablename__ = "fiscal_day_counters"
+    __table_args__ = (
+        UniqueConstraint(
+            "device_id", "fiscal_day_no", "counter_type", "currency", "tax_id", "money_type",
+            name="uq_fiscal_day_counters_key",
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    company_id: Mapped[int] = mapped_column(ForeignKey("companies.id"), index=True)
+    device_id: Mapped[int] = mapped_column(ForeignKey("devices.id"), index=True)
+    fiscal_day_no: Mapped[int] = mapped_column(Integer, index=True)
+    counter_type: Mapped[str] = mapped_column(String(30))
+    currency: Mapped[str] = mapped_column(String(10))
+    tax_id: Mapped[int] = mapped_column(Integer, default=0)
+    tax_percent: Mapped[float | None] = mapped_column(Float, nullable=True)
+    money_type: Mapped[str] = mapped_column(String(30), default="")
+    value: Mapped[float] = mapped_column(Float, default=0.0)
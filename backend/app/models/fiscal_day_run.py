@@ -0,0 +1,34 @@
+"""Reports of scheduled fiscal day close/open runs."""
+from datetime import datetime
+from sqlalchemy import DateTime, ForeignKey, Integer, String, Text, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+from app.models.common import TimestampMixin
+
+
+class FiscalDayRun(Base, TimestampMixin):
+    """One end-of-day rollover of a company's devices.
+
+    ``results`` holds a JSON list with one entry per device (closed and
+    opened day numbers, attempts, error).  Scheduled runs are unique per
+    company and CAT business date so a cut-off is never processed twice;
+    manual runs use ``trigger="manual"`` and a per-run ``run_key``.
+    """
+    __tablename__ = "fiscal_day_runs"
+    __table_args__ = (UniqueConstraint("company_id", "run_key", name="uq_fiscal_day_runs_company_key"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    company_id: Mapped[int] = mapped_column(ForeignKey("companies.id"), index=True)
+    run_date: Mapped[str] = mapped_column(String(10), index=True)  # CAT business date, YYYY-MM-DD
+    run_key: Mapped[str] = mapped_column(String(60))
+    trigger: Mapped[str] = mapped_column(String(20), default="scheduled")  # scheduled, manual
+    cutoff: Mapped[str] = mapped_column(String(5), default="")
+    status: Mapped[str] = mapped_column(String(20), default="running", index=True)  # running, completed, partial, failed
+    device_count: Mapped[int] = mapped_column(Integer, default=0)
+    succeeded_count: Mapped[int] = mapped_column(Integer, default=0)
+    failed_count: Mapped[int] = mapped_column(Integer, default=0)
+    skipped_count: Mapped[int] = mapped_column(Integer, default=0)
+    results: Mapped[str] = mapped_column(Text, default="[]")  # JSON string
+    started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    completed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,35 @@
+"""Batches of offline receipts uploaded to ZIMRA with SubmitFile."""
+from datetime import datetime
+from sqlalchemy import DateTime, ForeignKey, Integer, String, Text, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+from app.models.common import TimestampMixin
+
+
+class FiscalFile(Base, TimestampMixin):
+    """One uploaded file of offline receipts for a device.
+
+    A file covers the device's receipts with global numbers
+    ``first_global_no``..``last_global_no``; the unique constraint stops two
+    workers uploading the same range.
+    """
+    __tablename__ = "fiscal_files"
+    __table_args__ = (UniqueConstraint("device_id", "first_global_no", name="uq_fiscal_files_device_first"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    company_id: Mapped[int] = mapped_column(ForeignKey("companies.id"), index=True)
+    device_id: Mapped[int] = mapped_column(ForeignKey("devices.id"), index=True)
+    fiscal_day_no: Mapped[int] = mapped_column(Integer, default=0)
+    file_sequence: Mapped[int] = mapped_column(Integer, default=1)
+    first_global_no: Mapped[int] = mapped_column(Integer)
+    last_global_no: Mapped[int] = mapped_column(Integer)
+    receipt_count: Mapped[int] = mapped_column(Integer, default=0)
+
+    status: Mapped[str] = mapped_column(String(30), default="uploading", index=True)  # uploading, processing, done, error
+    operation_id: Mapped[str] = mapped_column(String(100), default="")
+    accepted_count: Mapped[int] = mapped_column(Integer, default=0)
+    rejected_count: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str] = mapped_column(Text, default="")
+    submitted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    completed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
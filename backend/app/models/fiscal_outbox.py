@@ -0,0 +1,34 @@
+"""Durable outbox of documents waiting to be fiscalized with ZIMRA."""
+from datetime import datetime
+from sqlalchemy import DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from app.db.base import Base
+from app.models.common import TimestampMixin
+
+
+class FiscalOutbox(Base, TimestampMixin):
+    """One pending fiscalization of an invoice (optionally backing a POS order).
+
+    Rows are written in the same transaction as the document and drained by
+    the fiscal outbox workers, so checkout never waits on FDMS.
+    """
+    __tablename__ = "fiscal_outbox"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    company_id: Mapped[int] = mapped_column(ForeignKey("companies.id"), index=True)
+    invoice_id: Mapped[int] = mapped_column(ForeignKey("invoices.id"), index=True)
+    pos_order_id: Mapped[int | None] = mapped_column(ForeignKey("pos_orders.id"), nullable=True, index=True)
+    device_id: Mapped[int | None] = mapped_column(ForeignKey("devices.id"), nullable=True, index=True)
+    requested_by_id: Mapped[int | None] = mapped_column(ForeignKey("users.id"), nullable=True)
+
+    status: Mapped[str] = mapped_column(String(30), default="pending", index=True)  # pending, processing, done, error
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str] = mapped_column(Text, default="")
+    available_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, index=True)
+    locked_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    locked_by: Mapped[str] = mapped_column(String(100), default="")
+    completed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    invoice = relationship("Invoice")
+    pos_order = relationship("POSOrder")
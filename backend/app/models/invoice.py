@@ -38,18 +38,26 @@ class Invoice(Base, TimestampMixin):
     payment_reference: Mapped[str] = mapped_column(String(100), default="")
     notes: Mapped[str] = mapped_column(String(2000), default="")
     
-    # ZIMRA fiscalization fields
+    # ZIMRA fiscalization fields.  The signed payload and signatures are only
+    # needed to audit or re-upload a receipt, so they are deferred
+    # ("fiscal_artefacts") and not read with every invoice row.
     zimra_status: Mapped[str] = mapped_column(String(50), default="not_submitted")
     zimra_receipt_id: Mapped[str] = mapped_column(String(100), default="")
     zimra_receipt_counter: Mapped[int] = mapped_column(default=0)
     zimra_receipt_global_no: Mapped[int] = mapped_column(default=0)
-    zimra_device_signature: Mapped[str] = mapped_column(String(2048), default="")
+    zimra_device_signature: Mapped[str] = mapped_column(
+        String(2048), default="", deferred=True, deferred_group="fiscal_artefacts"
+    )
     zimra_device_hash: Mapped[str] = mapped_column(String(512), default="")
-    zimra_server_signature: Mapped[str] = mapped_column(String(2048), default="")
+    zimra_server_signature: Mapped[str] = mapped_column(
+        String(2048), default="", deferred=True, deferred_group="fiscal_artefacts"
+    )
     zimra_server_hash: Mapped[str] = mapped_column(String(512), default="")
     zimra_verification_code: Mapped[str] = mapped_column(String(50), default="")
     zimra_verification_url: Mapped[str] = mapped_column(String(255), default="")
-    zimra_payload: Mapped[str] = mapped_column(String(10000), default="")
+    zimra_payload: Mapped[str] = mapped_column(
+        String(10000), default="", deferred=True, deferred_group="fiscal_artefacts"
+    )
     zimra_errors: Mapped[str] = mapped_column(String(2000), default="")
     
     # Audit fields
@@ -22,7 +22,9 @@ class POSSession(Base, TimestampMixin):
     opened_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
     closed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
-    # Cash management
+    # Cash management.  The total_* columns and transaction_count hold what
+    # was recorded before the session ledger existed; movements since are
+    # POSSessionEntry rows (see app.services.pos_ledger)
     opening_balance: Mapped[float] = mapped_column(Float, default=0)
     closing_balance: Mapped[float | None] = mapped_column(Float, nullable=True)
     total_sales: Mapped[float] = mapped_column(Float, default=0)
@@ -38,6 +40,7 @@ class POSSession(Base, TimestampMixin):
     opened_by = relationship("User", foreign_keys=[opened_by_id])
     closed_by = relationship("User", foreign_keys=[closed_by_id])
     orders = relationship("POSOrder", back_populates="session", cascade="all, delete-orphan")
+    entries = relationship("POSSessionEntry", cascade="all, delete-orphan")
 
 
 class POSOrder(Base, TimestampMixin):
@@ -76,6 +79,7 @@ class POSOrder(Base, TimestampMixin):
 
     # Fiscalization
     is_fiscalized: Mapped[bool] = mapped_column(Boolean, default=False)
+    fiscal_status: Mapped[str | None] = mapped_column(String(30), nullable=True, default="")  # "", fiscal_pending, fiscal_offline, fiscalized, fiscal_error
     zimra_receipt_id: Mapped[str] = mapped_column(String(100), default="")
     zimra_verification_code: Mapped[str] = mapped_column(String(50), default="")
     zimra_verification_url: Mapped[str] = mapped_column(String(255), default="")
@@ -111,3 +115,22 @@ class POSOrderLine(Base, TimestampMixin):
 
     order = relationship("POSOrder", back_populates="lines")
     product = relationship("Product")
+
+
+class POSSessionEntry(Base, TimestampMixin):
+    """Append-only session movement: one payment-method amount of a sale or refund.
+
+    Sale amounts are positive (cash as tendered, with the change handed back
+    as a negative ``change`` entry), refund amounts negative.
+    Rows are only ever inserted, so cashiers sharing a session never wait
+    on each other the way they did updating the session's running totals.
+    """
+    __tablename__ = "pos_session_entries"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    session_id: Mapped[int] = mapped_column(ForeignKey("pos_sessions.id"), index=True)
+    company_id: Mapped[int] = mapped_column(ForeignKey("companies.id"))
+    order_id: Mapped[int] = mapped_column(ForeignKey("pos_orders.id"))
+    kind: Mapped[str] = mapped_column(String(20))  # sale, refund
+    method: Mapped[str] = mapped_column(String(20))  # cash, change, card, mobile
+    amount: Mapped[float] = mapped_column(Float, default=0)
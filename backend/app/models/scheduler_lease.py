@@ -0,0 +1,21 @@
+"""Database leases used to elect a single leader among app workers."""
+from datetime import datetime
+from sqlalchemy import DateTime, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+from app.models.common import TimestampMixin
+
+
+class SchedulerLease(Base, TimestampMixin):
+    """A named lease held by one worker until ``expires_at``.
+
+    Works on every backend: a worker takes or renews the lease with a
+    conditional UPDATE that only matches if it already holds it or the
+    previous holder let it expire.
+    """
+    __tablename__ = "scheduler_leases"
+
+    name: Mapped[str] = mapped_column(String(100), primary_key=True)
+    holder: Mapped[str] = mapped_column(String(255), default="")
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
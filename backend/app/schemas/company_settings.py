@@ -1,7 +1,18 @@
-from pydantic import BaseModel
+from datetime import datetime
+
+from pydantic import BaseModel, field_validator
 from app.schemas.common import ORMBase
 
 
+def _check_cutoff(v: str | None) -> str | None:
+    if v is not None:
+        try:
+            datetime.strptime(v, "%H:%M")
+        except ValueError:
+            raise ValueError("Fiscal day cut-off must be a time in HH:MM format")
+    return v
+
+
 class CompanySettingsCreate(BaseModel):
     company_id: int
     currency_code: str = "USD"
@@ -29,6 +40,8 @@ class CompanySettingsCreate(BaseModel):
     zimra_bp_no: str = ""
     zimra_tin: str = ""
     fiscal_auto_submit: bool = False
+    fiscal_day_auto_close: bool = False
+    fiscal_day_cutoff: str = "23:59"
     default_sales_tax_id: int | None = None
     default_purchase_tax_id: int | None = None
     tax_included_in_price: bool = False
@@ -44,6 +57,11 @@ class CompanySettingsCreate(BaseModel):
     disable_mobile_redirect: bool = False
     inter_company_transactions: bool = False
 
+    @field_validator("fiscal_day_cutoff")
+    @classmethod
+    def validate_fiscal_day_cutoff(cls, v: str | None) -> str | None:
+        return _check_cutoff(v)
+
 
 class CompanySettingsUpdate(BaseModel):
     currency_code: str | None = None
@@ -71,6 +89,8 @@ class CompanySettingsUpdate(BaseModel):
     zimra_bp_no: str | None = None
     zimra_tin: str | None = None
     fiscal_auto_submit: bool | None = None
+    fiscal_day_auto_close: bool | None = None
+    fiscal_day_cutoff: str | None = None
     default_sales_tax_id: int | None = None
     default_purchase_tax_id: int | None = None
     tax_included_in_price: bool | None = None
@@ -86,6 +106,11 @@ class CompanySettingsUpdate(BaseModel):
     disable_mobile_redirect: bool | None = None
     inter_company_transactions: bool | None = None
 
+    @field_validator("fiscal_day_cutoff")
+    @classmethod
+    def validate_fiscal_day_cutoff(cls, v: str | None) -> str | None:
+        return _check_cutoff(v)
+
 
 class CompanySettingsRead(ORMBase):
     id: int
@@ -112,6 +137,8 @@ class CompanySettingsRead(ORMBase):
     zimra_bp_no: str
     zimra_tin: str
     fiscal_auto_submit: bool
+    fiscal_day_auto_close: bool
+    fiscal_day_cutoff: str
     default_sales_tax_id: int | None
     default_purchase_tax_id: int | None
     tax_included_in_price: bool
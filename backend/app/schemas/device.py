@@ -35,3 +35,5 @@ class DeviceRead(ORMBase):
     last_fiscal_day_no: int
     last_receipt_counter: int
     last_receipt_global_no: int
+    fiscal_mode: str = "online"
+    offline_since: datetime | None = None
@@ -1,7 +1,8 @@
 ﻿from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, computed_field
 from app.schemas.common import ORMBase
 from app.schemas.invoice_line import InvoiceLineCreate, InvoiceLineRead
+from app.services.qr_images import qr_url as _qr_url
 
 
 class InvoiceCreate(BaseModel):
@@ -22,6 +23,16 @@ class InvoiceCreate(BaseModel):
     lines: list[InvoiceLineCreate] = []
 
 
+class InvoiceBulkFiscalize(BaseModel):
+    company_id: int
+    invoice_ids: list[int] | None = None
+    pos_order_ids: list[int] | None = None
+    device_id: int | None = None
+    zimra_status: str | None = None  # e.g. "error" or "not_submitted"
+    limit: int = 500
+    format: str = "ndjson"  # ndjson or sse
+
+
 class InvoiceUpdate(BaseModel):
     invoice_type: str | None = None
     reversed_invoice_id: int | None = None
@@ -74,5 +85,27 @@ class InvoiceRead(ORMBase):
     zimra_receipt_global_no: int
     zimra_verification_code: str
     zimra_verification_url: str
-    zimra_payload: str
     lines: list[InvoiceLineRead] = []
+
+    @computed_field
+    @property
+    def qr_url(self) -> str:
+        return _qr_url(self.zimra_verification_url)
+
+
+class InvoiceFiscalReceipt(ORMBase):
+    """Signed receipt and signatures of a fiscalized invoice (not in list responses)."""
+    id: int
+    reference: str
+    device_id: int | None
+    zimra_status: str
+    zimra_receipt_id: str
+    zimra_receipt_counter: int
+    zimra_receipt_global_no: int
+    zimra_device_hash: str
+    zimra_device_signature: str
+    zimra_server_hash: str
+    zimra_server_signature: str
+    zimra_verification_code: str
+    zimra_verification_url: str
+    zimra_payload: str
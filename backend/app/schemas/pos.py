@@ -1,9 +1,10 @@
 """POS schemas for API serialization."""
 from datetime import datetime
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, computed_field, field_validator
 from typing import Optional, List
 
 from app.schemas.common import ORMBase
+from app.services.qr_images import qr_url as _qr_url
 from app.schemas.warehouse import WarehouseRead
 
 
@@ -74,6 +75,7 @@ class POSOrderRead(ORMBase):
     payment_method: str
     payment_reference: str | None = ""
     is_fiscalized: bool
+    fiscal_status: str | None = ""
     zimra_receipt_id: str | None = ""
     zimra_verification_code: str | None = ""
     zimra_verification_url: str | None = ""
@@ -84,7 +86,7 @@ class POSOrderRead(ORMBase):
     lines: List[POSOrderLineRead] = []
 
     @field_validator(
-        "cashier_name", "payment_reference", "zimra_receipt_id",
+        "cashier_name", "payment_reference", "fiscal_status", "zimra_receipt_id",
         "zimra_verification_code", "zimra_verification_url",
         "fiscal_errors", "notes",
         mode="before",
@@ -93,6 +95,11 @@ class POSOrderRead(ORMBase):
     def _none_to_empty(cls, v):  # noqa: N805
         return v if v is not None else ""
 
+    @computed_field
+    @property
+    def qr_url(self) -> str:
+        return _qr_url(self.zimra_verification_url)
+
 
 class POSOrderRefund(BaseModel):
     reason: str = ""
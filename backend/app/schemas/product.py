@@ -1,5 +1,6 @@
-﻿from pydantic import BaseModel
+﻿from pydantic import BaseModel, computed_field
 from app.schemas.common import ORMBase
+from app.services.assets import thumbnail_url as _thumbnail_url
 
 
 class ProductCreate(BaseModel):
@@ -58,6 +59,11 @@ class ProductRead(ORMBase):
     can_be_purchased: bool
     show_in_pos: bool
 
+    @computed_field
+    @property
+    def thumbnail_url(self) -> str:
+        return _thumbnail_url(self.image_url, "list")
+
 
 class ProductUpdate(BaseModel):
     category_id: int | None = None
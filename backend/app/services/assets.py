@@ -0,0 +1,208 @@
+"""Binary asset store for product images and company logos.
+
+Images used to live in text columns as base64 data URLs (a third larger
+than the file) and were echoed back by every product list and POS lookup.
+They are now stored once in the ``assets`` table under the SHA-256 of their
+bytes, and the columns hold a URL to ``GET /api/assets/{key}`` instead.
+Since a key always names the same bytes, responses carry the key as a
+strong ETag and can be cached by browsers indefinitely.
+
+Thumbnails for lists (``?size=list``) and POS tiles (``?size=pos``) are
+rendered with Pillow on first request and stored next to the original.
+Formats Pillow cannot scale (SVG) and images already small enough are
+served as they are; a marker row records that, so Pillow looks at each
+original once.  Hot assets are kept in a small in-memory cache, bounded by
+``asset_memory_cache_mb``.
+
+Inline images are checked against ``IMAGE_TYPES`` and ``MAX_ASSET_BYTES``
+like uploads, and rejected with a 400.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import threading
+from collections import OrderedDict
+
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, undefer
+
+from app.core.config import settings
+from app.models.asset import Asset
+
+logger = logging.getLogger(__name__)
+
+URL_PREFIX = "/api/assets/"
+THUMBNAIL_SIZES = {"list": 96, "pos": 256}
+MAX_ASSET_BYTES = 5 * 1024 * 1024
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp", "image/svg+xml"}
+
+# Content type of a thumbnail row that stands for "serve the original"
+_ORIGINAL = "original"
+_SCALABLE = {"image/jpeg": "JPEG", "image/png": "PNG", "image/gif": "PNG", "image/webp": "WEBP"}
+
+
+class _MemoryCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items: OrderedDict[str, tuple[str, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[str, bytes] | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key: str, content_type: str, data: bytes) -> None:
+        if len(data) > self.max_bytes // 8:
+            return
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = (content_type, data)
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                _, (_, dropped) = self._items.popitem(last=False)
+                self.bytes -= len(dropped)
+
+
+_cache = _MemoryCache(settings.asset_memory_cache_mb * 1024 * 1024)
+_warned_no_pillow = False
+
+
+def asset_url(key: str, size: str | None = None) -> str:
+    return f"{URL_PREFIX}{key}?size={size}" if size else f"{URL_PREFIX}{key}"
+
+
+def key_from_url(url: str | None) -> str | None:
+    if url and url.startswith(URL_PREFIX):
+        return url[len(URL_PREFIX):].split("?", 1)[0]
+    return None
+
+
+def thumbnail_url(url: str | None, size: str) -> str:
+    """Thumbnail URL for an asset URL; other values are returned unchanged."""
+    key = key_from_url(url)
+    return asset_url(key, size) if key else (url or "")
+
+
+def parse_data_url(value: str | None) -> tuple[str, bytes] | None:
+    """``(content_type, bytes)`` of a base64 data URL, or None."""
+    if not value or not value.startswith("data:"):
+        return None
+    header, _, payload = value.partition(",")
+    if not header.endswith(";base64"):
+        return None
+    try:
+        return header[5:-7] or "application/octet-stream", base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def _save(db: Session, key: str, content_type: str, data: bytes) -> None:
+    if db.get(Asset, key) is not None:
+        return
+    try:
+        with db.begin_nested():
+            db.add(Asset(key=key, content_type=content_type, size=len(data), data=data))
+    except IntegrityError:
+        # Stored concurrently by another request
+        pass
+
+
+def store(db: Session, data: bytes, content_type: str) -> str:
+    """Store bytes (deduplicated) and return their URL."""
+    key = hashlib.sha256(data).hexdigest()
+    _save(db, key, content_type, data)
+    return asset_url(key)
+
+
+def check_image(content_type: str | None, data: bytes) -> None:
+    """Reject anything but an image of an allowed type and size with a 400."""
+    if content_type not in IMAGE_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid image type. Allowed: JPEG, PNG, GIF, WebP, SVG")
+    if len(data) > MAX_ASSET_BYTES:
+        raise HTTPException(status_code=400, detail="Image too large. Max 5MB")
+
+
+def externalize(db: Session, value: str | None) -> str | None:
+    """Move an inline data URL into the store; any other value is kept."""
+    if not value or not value.startswith("data:"):
+        return value
+    parsed = parse_data_url(value)
+    if parsed is None:
+        raise HTTPException(status_code=400, detail="Images must be base64 data URLs")
+    content_type, data = parsed
+    check_image(content_type, data)
+    return store(db, data, content_type)
+
+
+def _thumbnail(data: bytes, content_type: str, px: int) -> tuple[str, bytes] | None:
+    """A rendered thumbnail, the ``_ORIGINAL`` marker if the original will do, or None without Pillow."""
+    fmt = _SCALABLE.get(content_type)
+    if fmt is None:
+        return _ORIGINAL, b""
+    try:
+        from PIL import Image
+    except ImportError:
+        global _warned_no_pillow
+        if not _warned_no_pillow:
+            _warned_no_pillow = True
+            logger.warning("Pillow is not installed; serving full-size images instead of thumbnails")
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if max(image.size) <= px:
+                return _ORIGINAL, b""
+            image.thumbnail((px, px))
+            if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            out = io.BytesIO()
+            image.save(out, format=fmt, optimize=True)
+    except Exception:
+        logger.exception("Could not render a %spx thumbnail", px)
+        return _ORIGINAL, b""
+    return f"image/{fmt.lower()}", out.getvalue()
+
+
+def _fetch(db: Session, key: str) -> tuple[str, bytes] | None:
+    asset = db.query(Asset).options(undefer(Asset.data)).filter(Asset.key == key).first()
+    return (asset.content_type, asset.data) if asset is not None else None
+
+
+def load(db: Session, key: str, size: str | None = None) -> tuple[str, str, bytes] | None:
+    """``(key, content_type, bytes)`` of an asset or its thumbnail, or None if unknown.
+
+    The returned key is the original's when no thumbnail applies.
+    """
+    thumb = None
+    if size:
+        thumb_key = f"{key}.{size}"
+        thumb = _cache.get(thumb_key) or _fetch(db, thumb_key)
+        if thumb is not None:
+            _cache.put(thumb_key, *thumb)
+            if thumb[0] != _ORIGINAL:
+                return thumb_key, *thumb
+
+    found = _cache.get(key) or _fetch(db, key)
+    if found is None or found[0] == _ORIGINAL:
+        return None
+    _cache.put(key, *found)
+    if size and thumb is None:
+        thumb = _thumbnail(found[1], found[0], THUMBNAIL_SIZES[size])
+        if thumb is None:
+            # No Pillow: remember for this process only, so installing it
+            # later still produces thumbnails
+            _cache.put(thumb_key, _ORIGINAL, b"")
+        else:
+            _save(db, thumb_key, *thumb)
+            db.commit()
+            _cache.put(thumb_key, *thumb)
+            if thumb[0] != _ORIGINAL:
+                return thumb_key, *thumb
+    return key, *found
@@ -2,7 +2,7 @@ import base64
 import hashlib
 import json
 import logging
-import tempfile
+import time
 from datetime import datetime, timezone, timedelta
 from decimal import Decimal, ROUND_HALF_UP
 from typing import Any
@@ -17,20 +17,50 @@ from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
 
 from app.core.config import settings
+from app.services.fdms_client import (
+    FDMSClient,
+    company_scope,
+    device_scope,
+    get_client,
+    get_public_client,
+    invalidate_device_client,
+)
+from app.services.fdms_cache import cached_call, invalidate_device
+from app.services.fdms_resilience import (
+    backoff_delay,
+    count_attempt,
+    get_breaker,
+    operation_name,
+    policy_for,
+    request_not_sent,
+    retry_budget,
+    retryable_status,
+)
+from app.services.fiscal_counters import apply_receipt, compare_counters, local_counters
+from app.services.liveness import ensure_fresh
+from app.services import qr_images
+from app.services.receipt_chain import advance, lock_device_chain, reserve_next
+from app.services.signing_keys import get_signing_key, invalidate_device_key, load_private_key
+from app.services.tax_resolution import TaxTable
 from app.models.company_certificate import CompanyCertificate
 from app.models.device import Device
 from app.models.invoice import Invoice
-from app.models.product import Product
 from app.models.quotation import Quotation
 from app.models.quotation_line import QuotationLine
-from app.models.tax_setting import TaxSetting
 
 
-def _write_temp_file(data: bytes, suffix: str) -> str:
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    tmp.write(data)
-    tmp.flush()
-    return tmp.name
+class FDMSUnavailableError(ValueError):
+    """FDMS could not be reached (connection failure, timeout or 502/503/504).
+
+    ``not_sent`` is true when FDMS certainly did not act on the request
+    (connection never made, 503, circuit open).  A read timeout or a
+    gateway error leaves it false: a non-idempotent call may have been
+    applied.
+    """
+
+    def __init__(self, message: str, not_sent: bool = False):
+        super().__init__(message)
+        self.not_sent = not_sent
 
 
 def _unpadded_device_id(device: Device) -> str:
@@ -43,22 +73,20 @@ def _unpadded_device_id(device: Device) -> str:
     return str(int(device.device_id))
 
 
-def _get_company_cert_paths(company_id: int, db) -> tuple[str, str]:
-    cert = db.query(CompanyCertificate).filter(CompanyCertificate.company_id == company_id).first()
-    if not cert or not cert.crt_data or not cert.key_data:
-        raise ValueError("Company certificate or key not configured")
-    crt_path = _write_temp_file(cert.crt_data, ".crt")
-    key_path = _write_temp_file(cert.key_data, ".key")
-    return crt_path, key_path
-
+def _get_fdms_client(device: Device, db, use_certificate: bool = True) -> FDMSClient:
+    """Return the pooled mutual-TLS client for a device.
 
-def _get_device_cert_paths(device: Device) -> tuple[str, str] | None:
-    """Return temp file paths for the device's own certificate + key, if available."""
+    Prefers the device certificate (returned during registration) and falls
+    back to the company certificate.
+    """
+    if not use_certificate:
+        return get_public_client()
     if device.crt_data and device.key_data:
-        crt_path = _write_temp_file(device.crt_data, ".crt")
-        key_path = _write_temp_file(device.key_data, ".key")
-        return crt_path, key_path
-    return None
+        return get_client(device_scope(device.id), device.crt_data, device.key_data)
+    cert = db.query(CompanyCertificate).filter(CompanyCertificate.company_id == device.company_id).first()
+    if not cert or not cert.crt_data or not cert.key_data:
+        raise ValueError("Company certificate or key not configured")
+    return get_client(company_scope(device.company_id), cert.crt_data, cert.key_data)
 
 
 def _call_fdms(
@@ -79,65 +107,106 @@ def _call_fdms(
         "DeviceModelVersion": "1.0",
     }
 
-    cert_paths: tuple[str, str] | None = None
-    if use_certificate:
-        # Prefer device cert (returned during registration) over company cert
-        cert_paths = _get_device_cert_paths(device)
-        if not cert_paths:
-            cert_paths = _get_company_cert_paths(device.company_id, db)
+    client = _get_fdms_client(device, db, use_certificate)
+    operation = operation_name(endpoint)
+    policy = policy_for(operation)
+    breaker = get_breaker(f"device:{device.id}", operation)
+    if not breaker.allow():
+        raise FDMSUnavailableError(
+            f"FDMS {operation} circuit open for device {device.device_id}; retry in {breaker.retry_in():.0f}s",
+            not_sent=True,
+        )
 
+    budget = retry_budget()
+    budget.record_call()
+    attempt = 0
     try:
-        resp = requests.request(
-            method=method,
-            url=url,
-            json=payload,
-            headers=headers,
-            cert=cert_paths,
-            verify=settings.fdms_verify_ssl,
-            timeout=settings.fdms_timeout_seconds,
-        )
-        if not resp.ok:
-            # Try to extract a clean error message from FDMS JSON response
-            err_msg = ""
-            err_code = ""
+        while True:
+            count_attempt(operation, retry=attempt > 0)
+            resp = None
             try:
-                err_data = resp.json() if resp.text else {}
-                err_msg = err_data.get("message", "") or ""
-                err_code = err_data.get("errorCode", "") or ""
-            except Exception:
-                pass
-            if err_msg and err_code:
-                raise ValueError(f"[{err_code}] {err_msg}")
-            elif err_msg:
-                raise ValueError(err_msg)
-            elif err_code:
-                raise ValueError(f"FDMS error code: {err_code}")
-            else:
-                raise ValueError(f"FDMS error {resp.status_code}: {resp.text}")
-        if resp.text:
-            return resp.json()
-        return {}
-    finally:
-        if cert_paths:
-            for path in cert_paths:
-                try:
-                    import os
+                resp = client.request(
+                    method,
+                    url,
+                    json=payload,
+                    headers=headers,
+                    timeout=(policy.connect_timeout, policy.read_timeout),
+                )
+                retry = retryable_status(resp.status_code, policy)
+                failure = f"FDMS unavailable ({resp.status_code})" if resp.status_code in (502, 503, 504) else ""
+                not_sent = resp.status_code == 503
+            except requests.RequestException as exc:
+                # A read timeout may mean FDMS already applied the request;
+                # other client errors (TLS, redirects, bad URL) are not retried
+                not_sent = request_not_sent(exc)
+                network = isinstance(exc, (requests.ConnectionError, requests.Timeout))
+                retry = network and (policy.idempotent or not_sent)
+                failure = f"FDMS unreachable: {exc}"
+                error = exc
+            attempt += 1
+            if not retry or attempt >= policy.max_attempts or not budget.try_spend():
+                break
+            time.sleep(backoff_delay(attempt, resp.headers.get("Retry-After") if resp is not None else None))
+    except Exception as exc:
+        # Whatever ends the call must be recorded, or a half-open trial never ends
+        breaker.record_failure(f"FDMS call failed: {exc}")
+        raise
+
+    if resp is None:
+        breaker.record_failure(failure)
+        raise FDMSUnavailableError(failure, not_sent=not_sent) from error
+    if failure:
+        breaker.record_failure(failure)
+        raise FDMSUnavailableError(failure, not_sent=not_sent)
+    # Any other answer, even an error, means FDMS is reachable
+    breaker.record_success()
+    if not resp.ok:
+        # Try to extract a clean error message from FDMS JSON response
+        err_msg = ""
+        err_code = ""
+        try:
+            err_data = resp.json() if resp.text else {}
+            err_msg = err_data.get("message", "") or ""
+            err_code = err_data.get("errorCode", "") or ""
+        except Exception:
+            pass
+        if err_msg and err_code:
+            raise ValueError(f"[{err_code}] {err_msg}")
+        elif err_msg:
+            raise ValueError(err_msg)
+        elif err_code:
+            raise ValueError(f"FDMS error code: {err_code}")
+        else:
+            raise ValueError(f"FDMS error {resp.status_code}: {resp.text}")
+    if resp.text:
+        return resp.json()
+    return {}
 
-                    os.unlink(path)
-                except Exception:
-                    pass
 
+def get_status(device: Device, db, fresh: bool = False) -> dict:
+    """GET /Device/v1/{deviceID}/GetStatus – returns fiscal day status, counters etc.
 
-def get_status(device: Device, db) -> dict:
-    """GET /Device/v1/{deviceID}/GetStatus – returns fiscal day status, counters etc."""
+    Served from the per-device cache (``fdms_cache``); ``fresh`` forces a
+    round-trip and refreshes the cached copy.
+    """
     did = _unpadded_device_id(device)
-    return _call_fdms(device, db, f"Device/v1/{did}/GetStatus", method="GET")
+    if fresh:
+        invalidate_device(device.id, "GetStatus")
+    return cached_call(
+        device.id, "GetStatus", settings.fdms_status_cache_seconds,
+        lambda: _call_fdms(device, db, f"Device/v1/{did}/GetStatus", method="GET"),
+    )
 
 
-def get_config(device: Device, db) -> dict:
+def get_config(device: Device, db, fresh: bool = False) -> dict:
     """GET /Device/v1/{deviceID}/GetConfig – returns device configuration & tax tables."""
     did = _unpadded_device_id(device)
-    return _call_fdms(device, db, f"Device/v1/{did}/GetConfig", method="GET")
+    if fresh:
+        invalidate_device(device.id, "GetConfig")
+    return cached_call(
+        device.id, "GetConfig", settings.fdms_config_cache_seconds,
+        lambda: _call_fdms(device, db, f"Device/v1/{did}/GetConfig", method="GET"),
+    )
 
 
 def ping_device(device: Device, db) -> dict:
@@ -147,6 +216,23 @@ def ping_device(device: Device, db) -> dict:
     return _call_fdms(device, db, f"Device/v1/{did}/Ping", method="POST", payload=payload)
 
 
+def submit_file(device: Device, db, file_payload: dict) -> dict:
+    """POST /Device/v1/{deviceID}/SubmitFile – upload a batch of offline receipts."""
+    did = _unpadded_device_id(device)
+    try:
+        return _call_fdms(device, db, f"Device/v1/{did}/SubmitFile", payload=file_payload)
+    finally:
+        invalidate_device(device.id, "GetStatus")
+
+
+def get_file_status(device: Device, db, operation_id: str) -> dict:
+    """GET /Device/v1/{deviceID}/GetFileStatus – processing result of an uploaded file."""
+    did = _unpadded_device_id(device)
+    return _call_fdms(
+        device, db, f"Device/v1/{did}/GetFileStatus?operationID={operation_id}", method="GET"
+    )
+
+
 def _generate_ecc_csr(device: Device) -> tuple[str, str]:
     """Generate an ECC P-256 private key and CSR for ZIMRA registration.
 
@@ -204,6 +290,9 @@ def register_device(device: Device, db) -> dict:
     device.key_filename = f"device_{device.device_id}.key"
     db.commit()
     db.refresh(device)
+    invalidate_device_client(device.id)
+    invalidate_device_key(device.id)
+    invalidate_device(device.id)
 
     return result
 
@@ -214,10 +303,19 @@ def open_day(device: Device, db) -> dict:
     Fetches GetStatus first to determine the correct next day number.
     Stores the opened timestamp on the device for CloseDay signature.
     """
-    # Get current status from FDMS to find the correct next day
+    # The receipt chain restarts with the new day: hold it from reading the
+    # counters until the new day is recorded, so no receipt is sequenced
+    # against the old day's head while OpenDay is in flight.  The lock is
+    # released by the single commit below (or the rollback on failure).
+    device = lock_device_chain(db, device.id)
     try:
-        status = get_status(device, db)
-        last_day = status.get("lastFiscalDayNo", device.last_fiscal_day_no or 0)
+        # Get current status from FDMS to find the correct next day
+        try:
+            status = get_status(device, db, fresh=True)
+        except Exception:
+            logger.warning("OpenDay: GetStatus failed for device %s; using stored day numbers", device.device_id)
+            status = {}
+        last_day = status.get("lastFiscalDayNo", device.last_fiscal_day_no or device.current_fiscal_day_no or 0)
         # Persist status fields while we have them
         if "fiscalDayStatus" in status:
             raw = status["fiscalDayStatus"]
@@ -227,28 +325,34 @@ def open_day(device: Device, db) -> dict:
             )
         if "lastFiscalDayNo" in status:
             device.last_fiscal_day_no = status["lastFiscalDayNo"]
-        if "lastReceiptCounter" in status:
-            device.last_receipt_counter = status["lastReceiptCounter"]
         if "lastReceiptGlobalNo" in status:
             device.last_receipt_global_no = status["lastReceiptGlobalNo"]
-        db.commit()
-    except Exception:
-        last_day = device.last_fiscal_day_no or device.current_fiscal_day_no or 0
 
-    next_day_no = last_day + 1
-    # Capture the timestamp BEFORE sending the request (same approach as farmware)
-    now_utc = datetime.now(timezone.utc)
-    now_str = now_utc.strftime("%Y-%m-%dT%H:%M:%S")
-    payload = {
-        "fiscalDayNo": next_day_no,
-        "fiscalDayOpened": now_str,
-    }
-    result = _call_fdms(device, db, f"Device/v1/{_unpadded_device_id(device)}/OpenDay", payload=payload)
+        next_day_no = last_day + 1
+        # Capture the timestamp BEFORE sending the request (same approach as farmware)
+        now_utc = datetime.now(timezone.utc)
+        now_str = now_utc.strftime("%Y-%m-%dT%H:%M:%S")
+        payload = {
+            "fiscalDayNo": next_day_no,
+            "fiscalDayOpened": now_str,
+        }
+        try:
+            result = _call_fdms(device, db, f"Device/v1/{_unpadded_device_id(device)}/OpenDay", payload=payload)
+        finally:
+            invalidate_device(device.id, "GetStatus")
+    except Exception:
+        db.rollback()
+        raise
 
     # Store the opened timestamp on the device so CloseDay can compute the
     # correct fiscalDayDate for the signature (must be the date the day was
     # opened in local time, not the date the day is closed).
     device.fiscal_day_opened_at = now_utc
+    device.current_fiscal_day_no = result.get("fiscalDayNo", next_day_no)
+    device.fiscal_day_status = "open"
+    # Receipt counters and the hash chain restart with every fiscal day
+    device.last_receipt_counter = 0
+    device.last_receipt_hash = ""
     db.commit()
 
     return result
@@ -325,34 +429,28 @@ def _build_counters_concat(counters: list[dict]) -> str:
     return "".join(parts)
 
 
+def build_close_day_concat(device_id_str: str, fiscal_day_no: int, fiscal_day_date: str, counters: list[dict]) -> str:
+    """concat = deviceID + fiscalDayNo + fiscalDayDate + counters_concat"""
+    return f"{device_id_str}{fiscal_day_no}{fiscal_day_date}{_build_counters_concat(counters)}"
+
+
 def _sign_close_day(device: Device, db, current_day: int, fiscal_day_date: str, counters: list[dict]) -> dict:
     """Build and sign the CloseDay concatenation string.
 
-    concat = deviceID + fiscalDayNo + fiscalDayDate + counters_concat
     Returns {"hash": b64, "signature": b64, "concat": str}
     """
-    device_id_str = _unpadded_device_id(device)
-    counters_concat = _build_counters_concat(counters)
-    concat = f"{device_id_str}{current_day}{fiscal_day_date}{counters_concat}"
+    concat = build_close_day_concat(_unpadded_device_id(device), current_day, fiscal_day_date, counters)
 
-    payload_bytes = concat.encode("utf-8")
-    hash_bytes = hashlib.sha256(payload_bytes).digest()
+    hash_bytes = hashlib.sha256(concat.encode("utf-8")).digest()
     hash_b64 = base64.b64encode(hash_bytes).decode("ascii")
 
-    sign_key = device.key_data
-    if not sign_key:
-        cert = db.query(CompanyCertificate).filter(CompanyCertificate.company_id == device.company_id).first()
-        if not cert or not cert.key_data:
-            raise ValueError("No signing key available for CloseDay")
-        sign_key = cert.key_data
+    key = get_signing_key(device, db)
+    if key is None:
+        raise ValueError("No signing key available for CloseDay")
 
-    from cryptography.hazmat.primitives.asymmetric import utils as asym_utils
-    key = serialization.load_pem_private_key(sign_key, password=None)
-    if isinstance(key, ec.EllipticCurvePrivateKey):
-        sig_bytes = key.sign(hash_bytes, ec.ECDSA(asym_utils.Prehashed(hashes.SHA256())))
-    elif isinstance(key, rsa.RSAPrivateKey):
-        sig_bytes = key.sign(hash_bytes, padding.PKCS1v15(), asym_utils.Prehashed(hashes.SHA256()))
-    else:
+    try:
+        sig_bytes = _sign_digest(key, hash_bytes)
+    except ValueError:
         raise ValueError("Unsupported key type for CloseDay signature")
 
     sig_b64 = base64.b64encode(sig_bytes).decode("ascii")
@@ -362,8 +460,10 @@ def _sign_close_day(device: Device, db, current_day: int, fiscal_day_date: str,
 def close_day(device: Device, db) -> dict:
     """POST /Device/v1/{deviceID}/CloseDay – close the current fiscal day.
 
-    Fetches GetStatus first to get counters from ZIMRA, then signs and submits.
-    ZIMRA requires: fiscalDayNo, fiscalDayCounters, fiscalDayDeviceSignature, receiptCounter
+    Signs the locally maintained counters (``fiscal_counters``) when
+    ``fiscal_close_day_local_counters`` is on; otherwise, or for a day opened
+    before local counters existed, fetches GetStatus first to get counters
+    from ZIMRA.  ZIMRA requires: fiscalDayNo, fiscalDayCounters, fiscalDayDeviceSignature, receiptCounter
 
     CRITICAL NOTES:
     - lastFiscalDayNo from GetStatus is the last CLOSED day, NOT the current open day.
@@ -372,29 +472,56 @@ def close_day(device: Device, db) -> dict:
       not the date it is being closed.
     - Only positive non-zero counter values are included in the signature.
     """
-    # 1. Get current status from ZIMRA
-    status = get_status(device, db)
-    receipt_counter = status.get("lastReceiptCounter", device.last_receipt_counter or 0)
-
-    # 2. Determine the CORRECT current fiscal day number
-    #    GetStatus.lastFiscalDayNo = last CLOSED day.
-    #    When day is open: current open day = lastFiscalDayNo + 1
-    fiscal_day_status = status.get("fiscalDayStatus", "")
-    last_closed_day = status.get("lastFiscalDayNo", device.last_fiscal_day_no or 0)
-
-    if fiscal_day_status == "FiscalDayOpened":
-        current_day = last_closed_day + 1
-    else:
-        # Fallback: use device's stored value (set during OpenDay)
-        current_day = device.current_fiscal_day_no or last_closed_day
-
-    logger.info(
-        "CloseDay: lastFiscalDayNo=%s, fiscalDayStatus=%s → current_day=%s",
-        last_closed_day, fiscal_day_status, current_day,
+    # Offline receipts belong to this day and must reach ZIMRA first
+    pending_offline = (
+        db.query(Invoice.id)
+        .filter(Invoice.device_id == device.id, Invoice.zimra_status == "offline")
+        .count()
     )
+    if pending_offline:
+        raise ValueError(
+            f"{pending_offline} offline receipt(s) have not been uploaded yet; sync the device before closing the day"
+        )
+
+    raw_counters: list[dict] | None = None
+    if settings.fiscal_close_day_local_counters and device.current_fiscal_day_no:
+        # Counters are kept locally per receipt; hold the chain so no receipt
+        # lands between reading them and CloseDay.
+        device = lock_device_chain(db, device.id)
+        raw_counters = local_counters(db, device)
+        receipt_counter = device.last_receipt_counter or 0
+        current_day = device.current_fiscal_day_no
+        if not raw_counters and receipt_counter:
+            # Day was opened before local counters were kept
+            raw_counters = None
+        else:
+            logger.info("CloseDay: using local counters for day %s", current_day)
+
+    if raw_counters is None:
+        # 1. Get current status from ZIMRA (never a cached copy: the counters
+        #    are signed into the CloseDay request)
+        status = get_status(device, db, fresh=True)
+        receipt_counter = status.get("lastReceiptCounter", device.last_receipt_counter or 0)
+
+        # 2. Determine the CORRECT current fiscal day number
+        #    GetStatus.lastFiscalDayNo = last CLOSED day.
+        #    When day is open: current open day = lastFiscalDayNo + 1
+        fiscal_day_status = status.get("fiscalDayStatus", "")
+        last_closed_day = status.get("lastFiscalDayNo", device.last_fiscal_day_no or 0)
+
+        if fiscal_day_status == "FiscalDayOpened":
+            current_day = last_closed_day + 1
+        else:
+            # Fallback: use device's stored value (set during OpenDay)
+            current_day = device.current_fiscal_day_no or last_closed_day
+
+        logger.info(
+            "CloseDay: lastFiscalDayNo=%s, fiscalDayStatus=%s → current_day=%s",
+            last_closed_day, fiscal_day_status, current_day,
+        )
 
-    # 3. Get fiscal day counters from ZIMRA status (they may be in either key)
-    raw_counters = status.get("fiscalDayCounter") or status.get("fiscalDayCounters") or []
+        # 3. Get fiscal day counters from ZIMRA status (they may be in either key)
+        raw_counters = status.get("fiscalDayCounter") or status.get("fiscalDayCounters") or []
 
     # 4. Sort and filter out non-positive counters
     sorted_counters = _sort_fiscal_counters(raw_counters)
@@ -426,27 +553,49 @@ def close_day(device: Device, db) -> dict:
         },
         "receiptCounter": receipt_counter,
     }
-    return _call_fdms(device, db, f"Device/v1/{_unpadded_device_id(device)}/CloseDay", payload=payload)
+    try:
+        return _call_fdms(device, db, f"Device/v1/{_unpadded_device_id(device)}/CloseDay", payload=payload)
+    finally:
+        invalidate_device(device.id, "GetStatus")
+
+
+def reconcile_fiscal_day_counters(device: Device, db) -> dict:
+    """Compare the local counters of the open fiscal day with GetStatus.
+
+    Returns ``{"in_sync": bool, "drift": [...]}``; each drift entry names the
+    counter and both values.  Offline receipts that FDMS has not seen yet
+    show up as drift until they are uploaded.
+    """
+    status = get_status(device, db, fresh=True)
+    remote = status.get("fiscalDayCounter") or status.get("fiscalDayCounters") or []
+    local = local_counters(db, device)
+    drift = compare_counters(local, remote)
+    local_counter = device.last_receipt_counter or 0
+    fdms_counter = status.get("lastReceiptCounter", local_counter)
+    if drift:
+        logger.warning("Fiscal day counters drift for device %s: %s", device.device_id, drift)
+    return {
+        "device_id": device.id,
+        "fiscal_day_no": device.current_fiscal_day_no,
+        "fdms_fiscal_day_status": status.get("fiscalDayStatus", ""),
+        "local_receipt_counter": local_counter,
+        "fdms_receipt_counter": fdms_counter,
+        "in_sync": not drift and fdms_counter == local_counter,
+        "drift": drift,
+    }
 
 
 def _to_cents(value: Decimal) -> str:
     return str(int((value * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP)))
 
 
-def _sign_receipt(receipt: dict, private_key_pem: bytes) -> dict:
-    """Sign receipt per ZIMRA Section 13.2.1 spec.
+def build_receipt_concat(receipt: dict) -> str:
+    """Canonical string that is hashed and signed for a receipt (Section 13.2.1).
 
-    Matches the proven working implementation exactly:
     concat = deviceID + receiptType + currency + globalNo + receiptDate + totalCents
            + for each tax sorted by taxID: taxCode(empty) + percent + taxAmountCents + salesAmountCents
            + previousReceiptHash (if chained)
-    hash   = SHA256(concat)
-    sig    = sign(hash, Prehashed(SHA256))
     """
-    from cryptography.hazmat.primitives.asymmetric import utils as asym_utils
-
-    key = serialization.load_pem_private_key(private_key_pem, password=None)
-
     # Use integer form of device ID (no leading zeros) for signature concatenation
     device_id = str(int(receipt.get("deviceID", 0)))
     receipt_type = str(receipt.get("receiptType", "")).upper()
@@ -485,21 +634,54 @@ def _sign_receipt(receipt: dict, private_key_pem: bytes) -> dict:
     prev_hash = receipt.get("previousReceiptHash")
     if prev_hash:
         concat += str(prev_hash).strip()
+    return concat
+
+
+def _sign_digest(key: Any, digest: bytes) -> bytes:
+    from cryptography.hazmat.primitives.asymmetric import utils as asym_utils
+
+    if isinstance(key, rsa.RSAPrivateKey):
+        return key.sign(digest, padding.PKCS1v15(), asym_utils.Prehashed(hashes.SHA256()))
+    if isinstance(key, ec.EllipticCurvePrivateKey):
+        return key.sign(digest, ec.ECDSA(asym_utils.Prehashed(hashes.SHA256())))
+    raise ValueError("Unsupported private key type")
+
+
+def verify_signature(public_key: Any, hash_b64: str, signature_b64: str) -> bool:
+    """Check a device signature over a base64 SHA-256 hash with the device public key."""
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives.asymmetric import utils as asym_utils
+
+    try:
+        digest = base64.b64decode(hash_b64)
+        signature = base64.b64decode(signature_b64)
+        if isinstance(public_key, rsa.RSAPublicKey):
+            public_key.verify(signature, digest, padding.PKCS1v15(), asym_utils.Prehashed(hashes.SHA256()))
+        elif isinstance(public_key, ec.EllipticCurvePublicKey):
+            public_key.verify(signature, digest, ec.ECDSA(asym_utils.Prehashed(hashes.SHA256())))
+        else:
+            return False
+    except (InvalidSignature, ValueError):
+        return False
+    return True
+
+
+def _sign_receipt(receipt: dict, private_key: Any) -> dict:
+    """Sign receipt per ZIMRA Section 13.2.1 spec.
+
+    hash = SHA256(build_receipt_concat(receipt)), sig = sign(hash, Prehashed(SHA256)).
+    ``private_key`` is a parsed key (see ``signing_keys``) or raw PEM bytes.
+    """
+    key = load_private_key(private_key) if isinstance(private_key, bytes) else private_key
+
+    concat = build_receipt_concat(receipt)
 
     # Step 1: hash = SHA256(concat)
-    data = concat.encode("utf-8")
-    digest = hashlib.sha256(data).digest()
+    digest = hashlib.sha256(concat.encode("utf-8")).digest()
     hash_b64 = base64.b64encode(digest).decode("ascii")
 
     # Step 2: signature = sign(digest, Prehashed(SHA256))
-    if isinstance(key, rsa.RSAPrivateKey):
-        signature = key.sign(digest, padding.PKCS1v15(), asym_utils.Prehashed(hashes.SHA256()))
-    elif isinstance(key, ec.EllipticCurvePrivateKey):
-        signature = key.sign(digest, ec.ECDSA(asym_utils.Prehashed(hashes.SHA256())))
-    else:
-        raise ValueError("Unsupported private key type")
-
-    signature_b64 = base64.b64encode(signature).decode("ascii")
+    signature_b64 = base64.b64encode(_sign_digest(key, digest)).decode("ascii")
     return {"signature": signature_b64, "hash": hash_b64, "concat": concat}
 
 
@@ -542,6 +724,12 @@ def _build_receipt(invoice: Invoice, lines: list[Any], device_id_str: str, db=No
     tax_summary: dict[str, dict[str, Any]] = {}
     total_with_tax = Decimal("0.00")
 
+    # Products and tax settings for all lines in two queries
+    tax_table = (
+        TaxTable.load(db, invoice.company_id, (getattr(line, "product_id", None) for line in lines))
+        if db else None
+    )
+
     for idx, line in enumerate(lines, start=1):
         qty = Decimal(str(getattr(line, "quantity", 0) or 0))
         price = Decimal(str(getattr(line, "unit_price", 0) or 0))
@@ -552,17 +740,13 @@ def _build_receipt(invoice: Invoice, lines: list[Any], device_id_str: str, db=No
         # Resolve ZIMRA tax ID and HS code from the product's linked tax setting
         zimra_tax_id = 1  # default fallback
         hs_code = "00000000"  # default HS code
-        product_id = getattr(line, "product_id", None)
-        if product_id and db:
-            product = db.query(Product).filter(Product.id == product_id).first()
-            if product:
-                # HS code from product
-                hs_code = _normalize_hs_code(getattr(product, "hs_code", "") or "")
-                if product.tax_id:
-                    tax_setting = db.query(TaxSetting).filter(TaxSetting.id == product.tax_id).first()
-                    if tax_setting and tax_setting.zimra_tax_id is not None:
-                        zimra_tax_id = tax_setting.zimra_tax_id
-                        vat_rate = Decimal(str(tax_setting.rate))
+        resolved = tax_table.resolve(getattr(line, "product_id", None)) if tax_table else None
+        if resolved:
+            # HS code from product
+            hs_code = _normalize_hs_code(resolved.hs_code)
+            if resolved.zimra_tax_id is not None:
+                zimra_tax_id = resolved.zimra_tax_id
+                vat_rate = Decimal(str(resolved.rate))
 
         # receiptLinesTaxInclusive = True means price must be tax-inclusive
         # so that receiptLineTotal = receiptLinePrice * receiptLineQuantity
@@ -657,26 +841,20 @@ def _build_receipt(invoice: Invoice, lines: list[Any], device_id_str: str, db=No
     return receipt
 
 
-def _ensure_device_online(device: Device, db) -> None:
-    """Ping the device if it hasn't been pinged recently to keep it online with ZIMRA."""
-    from datetime import timedelta, timezone
-    freq = device.reporting_frequency or 5
-    now = datetime.now(timezone.utc)
-    if device.last_ping_at:
-        last_ping = device.last_ping_at
-        # Make comparison tz-aware regardless of DB driver behaviour
-        if last_ping.tzinfo is None:
-            last_ping = last_ping.replace(tzinfo=timezone.utc)
-        if (now - last_ping) < timedelta(minutes=max(1, freq - 1)):
-            return  # pinged recently enough
+def _receipt_reached_fdms(device: Device, db, receipt_global_no: int) -> bool:
+    """Whether FDMS recorded a receipt whose submission had no clear answer.
+
+    Raises ``FDMSUnavailableError`` (with ``not_sent`` false) when FDMS
+    cannot be asked either: the receipt must then stay out of offline files
+    until someone can tell.
+    """
     try:
-        result = ping_device(device, db)
-        device.last_ping_at = now.replace(tzinfo=None)  # store as naive UTC for consistency
-        if result.get("reportingFrequency"):
-            device.reporting_frequency = int(result["reportingFrequency"])
-        db.commit()
-    except Exception:
-        pass  # don't fail fiscalization if ping fails
+        status = get_status(device, db, fresh=True)
+    except FDMSUnavailableError as exc:
+        raise FDMSUnavailableError(
+            f"SubmitReceipt outcome unknown for global no {receipt_global_no}: {exc}"
+        ) from exc
+    return int(status.get("lastReceiptGlobalNo") or 0) >= receipt_global_no
 
 
 def submit_invoice(invoice: Invoice, db) -> dict:
@@ -686,8 +864,10 @@ def submit_invoice(invoice: Invoice, db) -> dict:
     if not device:
         raise ValueError("Device not found")
 
-    # Keep device online with ZIMRA before submitting
-    _ensure_device_online(device, db)
+    # The heartbeat keeps the device online; a stale one gets a background
+    # ping rather than holding up this receipt.
+    if device.fiscal_mode != "offline":
+        ensure_fresh(device)
 
     lines: list[Any] = list(invoice.lines) if invoice.lines else []
     if not lines and invoice.quotation_id:
@@ -698,21 +878,22 @@ def submit_invoice(invoice: Invoice, db) -> dict:
     if not lines:
         raise ValueError("Invoice has no lines to fiscalize")
 
-    invoice.zimra_receipt_counter = (device.last_receipt_counter or 0) + 1
-    invoice.zimra_receipt_global_no = (device.last_receipt_global_no or 0) + 1
+    # Reserve the next chain position; the device stays locked until the
+    # caller commits or rolls back, so concurrent receipts cannot fork it.
+    slot = reserve_next(db, device.id)
+    device = slot.device
+    invoice.zimra_receipt_counter = slot.receipt_counter
+    invoice.zimra_receipt_global_no = slot.receipt_global_no
 
     did = _unpadded_device_id(device)
     receipt = _build_receipt(invoice, lines, did, db=db)
-    if invoice.zimra_receipt_counter > 1 and device.last_receipt_hash:
-        receipt["previousReceiptHash"] = device.last_receipt_hash
+    if slot.previous_hash:
+        receipt["previousReceiptHash"] = slot.previous_hash
 
     # Prefer device private key (from registration), fall back to company key
-    sign_key = device.key_data
-    if not sign_key:
-        cert = db.query(CompanyCertificate).filter(CompanyCertificate.company_id == invoice.company_id).first()
-        if not cert or not cert.key_data:
-            raise ValueError("No signing key available – register the device or upload a company key")
-        sign_key = cert.key_data
+    sign_key = get_signing_key(device, db)
+    if sign_key is None:
+        raise ValueError("No signing key available – register the device or upload a company key")
 
     sig = _sign_receipt(receipt, sign_key)
     receipt["receiptDeviceSignature"] = {
@@ -721,9 +902,33 @@ def submit_invoice(invoice: Invoice, db) -> dict:
     }
 
     submit_payload = {"deviceID": int(did), "receipt": receipt}
-    result = _call_fdms(device, db, f"Device/v1/{did}/SubmitReceipt", payload=submit_payload)
+    result: dict = {}
+    if device.fiscal_mode != "offline":
+        try:
+            try:
+                result = _call_fdms(device, db, f"Device/v1/{did}/SubmitReceipt", payload=submit_payload)
+            finally:
+                # Counters and last receipt changed (or may have)
+                invalidate_device(device.id, "GetStatus")
+        except FDMSUnavailableError as exc:
+            if not settings.fiscal_offline_enabled:
+                raise
+            # SubmitReceipt is not idempotent: after a read timeout FDMS may
+            # already hold this receipt, and re-sending it in a file would be
+            # rejected as a duplicate.  Ask FDMS how far it got first.
+            if not exc.not_sent and _receipt_reached_fdms(device, db, slot.receipt_global_no):
+                logger.warning(
+                    "Device %s: SubmitReceipt for global no %s timed out but FDMS has it",
+                    device.device_id, slot.receipt_global_no,
+                )
+            else:
+                # Keep issuing receipts: they stay signed and chained locally
+                # and are uploaded in files once FDMS is reachable again.
+                logger.warning("Device %s switching to offline mode: %s", device.device_id, exc)
+                device.fiscal_mode = "offline"
+                device.offline_since = datetime.utcnow()
 
-    invoice.zimra_status = "submitted"
+    invoice.zimra_status = "offline" if device.fiscal_mode == "offline" else "submitted"
     invoice.zimra_receipt_id = result.get("receiptID", "")
     invoice.zimra_device_signature = sig["signature"]
     invoice.zimra_device_hash = sig["hash"]
@@ -739,10 +944,10 @@ def submit_invoice(invoice: Invoice, db) -> dict:
     qr = _generate_qr(sig["signature"], invoice.zimra_receipt_global_no, str(device.device_id), qr_base)
     invoice.zimra_verification_code = qr["code"]
     invoice.zimra_verification_url = qr["url"]
+    qr_images.warm(qr["url"])
 
-    device.last_receipt_counter = invoice.zimra_receipt_counter
-    device.last_receipt_global_no = invoice.zimra_receipt_global_no
-    device.last_receipt_hash = sig["hash"]
-    device.last_receipt_signature = sig["signature"]
+    # Same transaction as the receipt, still under the chain lock
+    apply_receipt(db, device, receipt)
+    advance(slot, sig["hash"], sig["signature"])
 
     return result
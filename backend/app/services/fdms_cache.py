@@ -0,0 +1,114 @@
+"""Per-device TTL cache for FDMS read calls (GetStatus, GetConfig).
+
+Status and configuration change rarely and, apart from the operations this
+app performs itself, never behind our back, so repeated reads from the
+devices page, the dashboard, OpenDay or CloseDay can share one response.
+Entries expire after a per-operation TTL and are dropped explicitly when
+OpenDay, CloseDay, SubmitReceipt, SubmitFile or registration changes the
+device's state.  Concurrent misses for the same key are coalesced: one caller
+fetches and the others wait for its result.  A caller only joins a fetch
+started since the device's last invalidation, so a read made right after an
+invalidation never returns an answer FDMS gave before it.
+
+The cache is per process; other workers may serve a response up to one TTL
+old after a change made elsewhere.
+"""
+import copy
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+
+@dataclass
+class _Flight:
+    event: threading.Event = field(default_factory=threading.Event)
+    value: Any = None
+    error: BaseException | None = None
+    # Device generation when the fetch started
+    generation: int = 0
+
+
+class FDMSResponseCache:
+    def __init__(self):
+        self._entries: dict[tuple[int, str], tuple[float, Any]] = {}
+        self._flights: dict[tuple[int, str], _Flight] = {}
+        # Bumped on invalidation so a fetch that started before it is not stored
+        self._generation: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def get(self, device_id: int, operation: str, ttl: float, fetch: Callable[[], Any]) -> Any:
+        key = (device_id, operation)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            generation = self._generation.get(device_id, 0)
+            flight = self._flights.get(key)
+            # A fetch from before the last invalidation keeps its own waiters
+            leader = flight is None or flight.generation != generation
+            if leader:
+                flight = self._flights[key] = _Flight(generation=generation)
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.value)
+
+        try:
+            flight.value = fetch()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                if flight.error is None and ttl > 0 and self._generation.get(device_id, 0) == generation:
+                    self._entries[key] = (time.monotonic() + ttl, flight.value)
+            flight.event.set()
+        return copy.deepcopy(flight.value)
+
+    def invalidate(self, device_id: int, operation: str | None = None) -> None:
+        with self._lock:
+            self.invalidations += 1
+            self._generation[device_id] = self._generation.get(device_id, 0) + 1
+            for key in [k for k in self._entries if k[0] == device_id and operation in (None, k[1])]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            live = sum(1 for expires, _ in self._entries.values() if expires > now)
+            return {
+                "entries": live,
+                "in_flight": len(self._flights),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "invalidations": self.invalidations,
+            }
+
+
+_cache = FDMSResponseCache()
+
+
+def cached_call(device_id: int, operation: str, ttl: float, fetch: Callable[[], Any]) -> Any:
+    return _cache.get(device_id, operation, ttl, fetch)
+
+
+def invalidate_device(device_id: int, operation: str | None = None) -> None:
+    _cache.invalidate(device_id, operation)
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
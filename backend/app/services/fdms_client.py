@@ -0,0 +1,236 @@
+"""Pooled mutual-TLS HTTP clients for the ZIMRA FDMS API.
+
+Each fiscal device (or company certificate, when a device has no certificate
+of its own) gets one long-lived ``requests.Session`` whose adapter carries an
+``SSLContext`` built once from the PEM material stored in the database.
+Connections are kept alive between receipts, so a busy till pays for a TLS
+handshake once per pooled connection instead of once per receipt, and the
+certificate/key never have to be written to disk for each call.
+
+Clients are rebuilt when the certificate material changes: the upload and
+registration routes call :func:`invalidate_device_client` /
+:func:`invalidate_company_client`, and every lookup also compares a digest of
+the material so other workers pick up new certificates without a restart.
+"""
+import hashlib
+import logging
+import os
+import ssl
+import tempfile
+import threading
+import time
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.ssl_ import create_urllib3_context
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Connections kept per FDMS host for a single device/company client
+_POOL_MAXSIZE = 4
+
+
+def _material_digest(crt_data: bytes | None, key_data: bytes | None) -> str:
+    h = hashlib.sha256()
+    h.update(crt_data or b"")
+    h.update(b"\0")
+    h.update(key_data or b"")
+    return h.hexdigest()
+
+
+def _build_ssl_context(crt_data: bytes | None, key_data: bytes | None) -> ssl.SSLContext:
+    """Build an SSLContext holding the client certificate in memory.
+
+    ``SSLContext.load_cert_chain`` only accepts file paths, so the PEM data is
+    written to a private temporary directory just long enough to be loaded and
+    removed again; the context keeps the parsed material afterwards.
+    """
+    ctx = create_urllib3_context()
+    if settings.fdms_verify_ssl:
+        ctx.load_verify_locations(requests.certs.where())
+    else:
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+
+    if crt_data and key_data:
+        with tempfile.TemporaryDirectory(prefix="fdms-") as tmp_dir:
+            crt_path = os.path.join(tmp_dir, "client.crt")
+            key_path = os.path.join(tmp_dir, "client.key")
+            with open(crt_path, "wb") as f:
+                f.write(crt_data)
+            with open(key_path, "wb") as f:
+                f.write(key_data)
+            ctx.load_cert_chain(crt_path, key_path)
+    return ctx
+
+
+class _ContextAdapter(HTTPAdapter):
+    """HTTPAdapter that hands a prebuilt SSLContext to every pooled connection."""
+
+    def __init__(self, ssl_context: ssl.SSLContext, **kwargs):
+        self._ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs["ssl_context"] = self._ssl_context
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+
+
+class FDMSClient:
+    """A warm keep-alive session bound to one set of certificate material."""
+
+    def __init__(self, scope: str, crt_data: bytes | None, key_data: bytes | None):
+        self.scope = scope
+        self.digest = _material_digest(crt_data, key_data)
+        self.created_at = time.time()
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        self._adapter = _ContextAdapter(
+            _build_ssl_context(crt_data, key_data),
+            pool_connections=2,
+            pool_maxsize=_POOL_MAXSIZE,
+        )
+        self.session.mount("https://", self._adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        with self._lock:
+            self.requests += 1
+        try:
+            return self.session.request(
+                method=method, url=url, verify=settings.fdms_verify_ssl, **kwargs
+            )
+        except requests.RequestException:
+            with self._lock:
+                self.errors += 1
+            raise
+
+    def connections_opened(self) -> int:
+        """Number of connections (and therefore TLS handshakes) opened so far."""
+        pools = self._adapter.poolmanager.pools
+        total = 0
+        for key in list(pools.keys()):
+            try:
+                total += pools[key].num_connections
+            except KeyError:
+                continue
+        return total
+
+    def close(self) -> None:
+        try:
+            self.session.close()
+        except Exception:
+            pass
+
+    def stats(self) -> dict[str, Any]:
+        opened = self.connections_opened()
+        return {
+            "scope": self.scope,
+            "requests": self.requests,
+            "errors": self.errors,
+            "handshakes": opened,
+            "reused_requests": max(0, self.requests - opened),
+            "age_seconds": round(time.time() - self.created_at, 1),
+        }
+
+
+class FDMSClientRegistry:
+    """Process-wide registry of FDMS clients keyed by certificate scope."""
+
+    def __init__(self):
+        self._clients: dict[str, FDMSClient] = {}
+        self._lock = threading.Lock()
+        self.contexts_built = 0
+        self.rebuilds = 0
+        self.invalidations = 0
+        # Totals from clients that have been dropped, so stats survive rebuilds
+        self._retired_requests = 0
+        self._retired_handshakes = 0
+
+    def get(self, scope: str, crt_data: bytes | None, key_data: bytes | None) -> FDMSClient:
+        digest = _material_digest(crt_data, key_data)
+        client = self._clients.get(scope)
+        if client is not None and client.digest == digest:
+            return client
+
+        with self._lock:
+            client = self._clients.get(scope)
+            if client is not None and client.digest == digest:
+                return client
+            if client is not None:
+                # Material changed underneath us (e.g. uploaded via another worker)
+                self.rebuilds += 1
+                self._retire(client)
+            client = FDMSClient(scope, crt_data, key_data)
+            self.contexts_built += 1
+            self._clients[scope] = client
+            logger.info("Built FDMS client for %s", scope)
+            return client
+
+    def invalidate(self, scope: str) -> None:
+        with self._lock:
+            client = self._clients.pop(scope, None)
+            if client is not None:
+                self.invalidations += 1
+                self._retire(client)
+
+    def _retire(self, client: FDMSClient) -> None:
+        self._retired_requests += client.requests
+        self._retired_handshakes += client.connections_opened()
+        client.close()
+
+    def stats(self) -> dict[str, Any]:
+        clients = [c.stats() for c in list(self._clients.values())]
+        total_requests = self._retired_requests + sum(c["requests"] for c in clients)
+        total_handshakes = self._retired_handshakes + sum(c["handshakes"] for c in clients)
+        return {
+            "clients": clients,
+            "active_clients": len(clients),
+            "contexts_built": self.contexts_built,
+            "rebuilds": self.rebuilds,
+            "invalidations": self.invalidations,
+            "total_requests": total_requests,
+            "total_handshakes": total_handshakes,
+            "handshakes_saved": max(0, total_requests - total_handshakes),
+        }
+
+
+registry = FDMSClientRegistry()
+
+# Shared client for unauthenticated calls (RegisterDevice)
+_PUBLIC_SCOPE = "public"
+
+
+def device_scope(device_id: int) -> str:
+    return f"device:{device_id}"
+
+
+def company_scope(company_id: int) -> str:
+    return f"company:{company_id}"
+
+
+def get_client(scope: str, crt_data: bytes | None = None, key_data: bytes | None = None) -> FDMSClient:
+    return registry.get(scope, crt_data, key_data)
+
+
+def get_public_client() -> FDMSClient:
+    return registry.get(_PUBLIC_SCOPE, None, None)
+
+
+def invalidate_device_client(device_id: int) -> None:
+    """Drop the pooled client of a device after its certificate or key changed."""
+    registry.invalidate(device_scope(device_id))
+
+
+def invalidate_company_client(company_id: int) -> None:
+    """Drop the pooled client built from a company certificate."""
+    registry.invalidate(company_scope(company_id))
+
+
+def client_stats() -> dict[str, Any]:
+    return registry.stats()
@@ -0,0 +1,280 @@
+"""Timeouts, retries and circuit breakers for FDMS calls.
+
+``_call_fdms`` used one 30s timeout for every endpoint and never retried, so a
+degraded FDMS tied up every worker thread for the full timeout.  This module
+supplies the policy it now applies per call:
+
+* ``policy_for`` gives each operation (Ping, SubmitReceipt, CloseDay, ...)
+  its own connect/read timeout and says whether it is idempotent.
+* Retries use full-jitter exponential back-off.  Idempotent reads retry on
+  any transient failure; operations that change FDMS state (SubmitReceipt,
+  OpenDay, CloseDay, ...) only retry when the request provably never reached
+  FDMS (connect failures, 429, 503), so a receipt is never sent twice.
+* A process-wide ``RetryBudget`` caps retries to a fraction of recent calls,
+  so retries cannot multiply load on an FDMS that is already struggling.
+* A ``CircuitBreaker`` per device and operation opens after consecutive
+  unavailability failures and fails fast until a trial call succeeds.
+"""
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from app.core.config import settings
+
+
+@dataclass(frozen=True)
+class CallPolicy:
+    connect_timeout: float
+    read_timeout: float
+    idempotent: bool
+    max_attempts: int
+
+
+# Read timeouts per operation; anything unlisted uses fdms_timeout_seconds
+_POLICIES: dict[str, tuple[float, bool, int]] = {
+    "Ping": (10.0, True, 2),
+    "GetStatus": (15.0, True, 3),
+    "GetConfig": (15.0, True, 3),
+    "GetFileStatus": (15.0, True, 3),
+    "GetServerCertificate": (15.0, True, 3),
+    "SubmitReceipt": (20.0, False, 3),
+    "OpenDay": (30.0, False, 3),
+    "CloseDay": (30.0, False, 3),
+    "SubmitFile": (60.0, False, 3),
+    "RegisterDevice": (30.0, False, 2),
+}
+
+# Statuses that mean FDMS did not act on the request
+_SAFE_RETRY_STATUSES = {429, 503}
+# Statuses worth retrying when repeating the request is harmless
+_IDEMPOTENT_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_BACKOFF_BASE = 0.2
+_BACKOFF_CAP = 2.0
+
+
+def operation_name(endpoint: str) -> str:
+    """``Device/v1/123/GetStatus?x=1`` -> ``GetStatus``."""
+    return endpoint.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+
+
+def policy_for(operation: str) -> CallPolicy:
+    read, idempotent, attempts = _POLICIES.get(operation, (float(settings.fdms_timeout_seconds), False, 1))
+    return CallPolicy(
+        connect_timeout=settings.fdms_connect_timeout_seconds,
+        read_timeout=min(read, float(settings.fdms_timeout_seconds)),
+        idempotent=idempotent,
+        max_attempts=max(1, min(attempts, settings.fdms_max_attempts)),
+    )
+
+
+def request_not_sent(exc: Exception) -> bool:
+    """True if a requests error happened before the request reached FDMS."""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.ConnectionError):
+        reason = getattr(exc.args[0], "reason", None) if exc.args else None
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+    return False
+
+
+def retryable_status(status: int, policy: CallPolicy) -> bool:
+    return status in (_IDEMPOTENT_RETRY_STATUSES if policy.idempotent else _SAFE_RETRY_STATUSES)
+
+
+def backoff_delay(attempt: int, retry_after: str | None = None) -> float:
+    """Full-jitter exponential back-off; honours a short Retry-After."""
+    if retry_after:
+        try:
+            return min(float(retry_after), _BACKOFF_CAP)
+        except ValueError:
+            pass
+    return random.uniform(0, min(_BACKOFF_CAP, _BACKOFF_BASE * (2 ** attempt)))
+
+
+class RetryBudget:
+    """Allow retries up to ``ratio`` of calls in a sliding window, plus a floor."""
+
+    def __init__(self, window_seconds: float = 10.0):
+        self.window = window_seconds
+        self._calls: deque[float] = deque()
+        self._retries: deque[float] = deque()
+        self._lock = threading.Lock()
+        self.exhausted = 0
+
+    def _trim(self, now: float) -> None:
+        for q in (self._calls, self._retries):
+            while q and now - q[0] > self.window:
+                q.popleft()
+
+    def record_call(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            self._calls.append(now)
+
+    def try_spend(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            allowed = settings.fdms_retry_budget_min + settings.fdms_retry_budget_ratio * len(self._calls)
+            if len(self._retries) >= allowed:
+                self.exhausted += 1
+                return False
+            self._retries.append(now)
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            return {
+                "window_seconds": self.window,
+                "calls": len(self._calls),
+                "retries": len(self._retries),
+                "exhausted": self.exhausted,
+            }
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures -> half-open trial -> closed."""
+
+    def __init__(self, key: tuple[str, str]):
+        self.key = key
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.trial_started = 0.0
+        self.failures = 0
+        self.successes = 0
+        self.short_circuited = 0
+        self.last_error = ""
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= settings.fdms_breaker_reset_seconds:
+                self.state = "half_open"
+            # A trial that never reported back (a crashed caller) expires
+            # after the reset period rather than keeping the circuit shut
+            if self.state == "half_open" and (
+                not self.trial_in_flight or now - self.trial_started >= settings.fdms_breaker_reset_seconds
+            ):
+                self.trial_in_flight = True
+                self.trial_started = now
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.trial_in_flight = False
+            self.state = "closed"
+
+    def record_failure(self, error: str) -> None:
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+            self.trial_in_flight = False
+            if self.state == "half_open" or self.consecutive_failures >= settings.fdms_breaker_failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def retry_in(self) -> float:
+        if self.state != "open":
+            return 0.0
+        return max(0.0, settings.fdms_breaker_reset_seconds - (time.monotonic() - self.opened_at))
+
+    def stats(self) -> dict:
+        scope, operation = self.key
+        return {
+            "scope": scope,
+            "operation": operation,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failures": self.failures,
+            "successes": self.successes,
+            "short_circuited": self.short_circuited,
+            "retry_in_seconds": round(self.retry_in(), 1),
+            "last_error": self.last_error,
+        }
+
+
+class ResilienceRegistry:
+    def __init__(self):
+        self.budget = RetryBudget()
+        self._breakers: dict[tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self.attempts: dict[str, int] = {}
+        self.retries: dict[str, int] = {}
+
+    def breaker(self, scope: str, operation: str) -> CircuitBreaker:
+        key = (scope, operation)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(key)
+            return breaker
+
+    def count(self, operation: str, retry: bool) -> None:
+        with self._lock:
+            self.attempts[operation] = self.attempts.get(operation, 0) + 1
+            if retry:
+                self.retries[operation] = self.retries.get(operation, 0) + 1
+
+    def reset(self, scope: str | None = None, operation: str | None = None) -> int:
+        with self._lock:
+            keys = [
+                k for k in self._breakers
+                if (scope is None or k[0] == scope) and (operation is None or k[1] == operation)
+            ]
+            for key in keys:
+                del self._breakers[key]
+        return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            breakers = list(self._breakers.values())
+            attempts = dict(self.attempts)
+            retries = dict(self.retries)
+        return {
+            "retry_budget": self.budget.stats(),
+            "attempts": attempts,
+            "retries": retries,
+            "open_breakers": sum(1 for b in breakers if b.state != "closed"),
+            "breakers": sorted((b.stats() for b in breakers), key=lambda s: (s["scope"], s["operation"])),
+        }
+
+
+_registry = ResilienceRegistry()
+
+
+def get_breaker(scope: str, operation: str) -> CircuitBreaker:
+    return _registry.breaker(scope, operation)
+
+
+def retry_budget() -> RetryBudget:
+    return _registry.budget
+
+
+def count_attempt(operation: str, retry: bool) -> None:
+    _registry.count(operation, retry)
+
+
+def reset_breakers(scope: str | None = None, operation: str | None = None) -> int:
+    return _registry.reset(scope, operation)
+
+
+def resilience_stats() -> dict:
+    return _registry.stats()
@@ -0,0 +1,238 @@
+"""Bulk fiscalization of a backlog of invoices.
+
+Documents are grouped by fiscal device.  Each device's documents are
+submitted one after another in the order they were issued (invoice id), so
+its receipt chain follows document order, while different devices run in
+parallel on a bounded pool.  Every document is its own transaction, so one
+rejected receipt does not undo the others, and results are yielded as they
+finish so the caller can stream progress.  Audit entries are collected and
+written in a single transaction at the end.
+"""
+import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterator
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.audit_log import AuditAction, ResourceType
+from app.models.device import Device
+from app.models.invoice import Invoice
+from app.models.pos_session import POSOrder
+from app.models.user import User
+from app.services.fdms import submit_invoice
+from app.services.fiscal_outbox import mark_fiscal_error, mark_fiscalized, mark_offline
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def select_invoices(
+    db: Session,
+    company_id: int,
+    invoice_ids: list[int] | None = None,
+    pos_order_ids: list[int] | None = None,
+    device_id: int | None = None,
+    zimra_status: str | None = None,
+    limit: int = 500,
+) -> list[int]:
+    """Ids of the company's invoices matching the filter, in issue order."""
+    query = db.query(Invoice.id).filter(Invoice.company_id == company_id)
+    ids: set[int] = set(invoice_ids or [])
+    if pos_order_ids:
+        ids.update(
+            invoice_id
+            for (invoice_id,) in db.query(POSOrder.invoice_id).filter(
+                POSOrder.id.in_(pos_order_ids),
+                POSOrder.company_id == company_id,
+                POSOrder.invoice_id.isnot(None),
+            )
+        )
+    if invoice_ids is not None or pos_order_ids is not None:
+        query = query.filter(Invoice.id.in_(ids))
+    if device_id is not None:
+        query = query.filter(Invoice.device_id == device_id)
+    if zimra_status:
+        query = query.filter(Invoice.zimra_status == zimra_status)
+    limit = max(1, min(limit, settings.fiscal_bulk_max_documents))
+    return [row.id for row in query.order_by(Invoice.id).limit(limit).all()]
+
+
+def _skip_reason(invoice: Invoice, device: Device | None) -> str:
+    """Same preconditions as ``POST /invoices/{id}/fiscalize``."""
+    if invoice.status not in ("posted", "paid"):
+        return "Can only fiscalize posted or paid invoices"
+    if invoice.zimra_status == "submitted":
+        return "Invoice already fiscalized"
+    if invoice.zimra_status == "pending":
+        return "Invoice is already queued for fiscalization"
+    if invoice.zimra_status == "offline":
+        return "Invoice was signed offline and is waiting for upload"
+    if not invoice.device_id:
+        return "No fiscal device assigned to this invoice"
+    if device is None:
+        return "Assigned fiscal device was not found"
+    if (device.fiscal_day_status or "").lower() != "open":
+        return "No fiscal day is open for the assigned fiscal device"
+    return ""
+
+
+def _result(invoice: Invoice, status: str, error: str = "") -> dict:
+    return {
+        "invoice_id": invoice.id,
+        "reference": invoice.reference,
+        "device_id": invoice.device_id,
+        "status": status,
+        "zimra_status": invoice.zimra_status,
+        "receipt_global_no": invoice.zimra_receipt_global_no,
+        "verification_code": invoice.zimra_verification_code,
+        "error": error,
+    }
+
+
+def _missing(invoice_id: int, device_id: int | None) -> dict:
+    return {
+        "invoice_id": invoice_id,
+        "reference": "",
+        "device_id": device_id,
+        "status": "skipped",
+        "zimra_status": "",
+        "receipt_global_no": None,
+        "verification_code": "",
+        "error": "Invoice not found",
+    }
+
+
+def _fiscalize_device(device_id: int | None, invoice_ids: list[int], user_id: int, out: queue.Queue) -> None:
+    """Submit one device's invoices in order, reporting each result to ``out``."""
+    db = SessionLocal()
+    try:
+        device = db.get(Device, device_id) if device_id else None
+        for invoice_id in invoice_ids:
+            invoice = db.get(Invoice, invoice_id)
+            if invoice is None:
+                # Deleted since the batch was selected
+                out.put(_missing(invoice_id, device_id))
+                continue
+            order = db.query(POSOrder).filter(POSOrder.invoice_id == invoice_id).first()
+            reason = _skip_reason(invoice, device)
+            if reason:
+                out.put(_result(invoice, "skipped", reason))
+                continue
+            try:
+                submit_invoice(invoice, db)
+                if invoice.zimra_status == "offline":
+                    mark_offline(invoice, order, user_id)
+                else:
+                    mark_fiscalized(invoice, order, user_id)
+                db.commit()
+                out.put(_result(invoice, "offline" if invoice.zimra_status == "offline" else "fiscalized"))
+            except Exception as exc:
+                db.rollback()
+                invoice = db.get(Invoice, invoice_id)
+                if invoice is None:
+                    out.put(_missing(invoice_id, device_id))
+                else:
+                    order = db.query(POSOrder).filter(POSOrder.invoice_id == invoice_id).first()
+                    mark_fiscal_error(invoice, order, str(exc))
+                    db.commit()
+                    out.put(_result(invoice, "error", str(exc)))
+            # Later receipts see the device as it is now (e.g. switched offline)
+            if device is not None:
+                db.refresh(device)
+    except Exception as exc:
+        logger.exception("Bulk fiscalization failed for device %s", device_id)
+        out.put({"device_id": device_id, "status": "error", "error": str(exc)})
+    finally:
+        db.close()
+        out.put(_DONE)
+
+
+def _write_audit(user_id: int, company_id: int, results: list[dict], started: datetime) -> None:
+    from app.api.deps import log_audit
+
+    db = SessionLocal()
+    try:
+        user = db.get(User, user_id)
+        for r in results:
+            if "invoice_id" not in r or r["status"] == "skipped":
+                continue
+            failed = r["status"] == "error"
+            log_audit(
+                db=db,
+                user=user,
+                action=AuditAction.INVOICE_FISCALIZE_FAILED if failed else AuditAction.INVOICE_FISCALIZE,
+                resource_type=ResourceType.INVOICE,
+                resource_id=r["invoice_id"],
+                resource_reference=r["reference"] or "",
+                company_id=company_id,
+                new_values={"zimra_status": r["zimra_status"], "verification_code": r["verification_code"]},
+                status="error" if failed else "success",
+                error_message=r["error"] if failed else "",
+                changes_summary=(
+                    f"Bulk fiscalization failed for {r['reference']}: {r['error']}" if failed
+                    else f"Invoice {r['reference']} signed offline, queued for upload" if r["status"] == "offline"
+                    else f"Invoice {r['reference']} fiscalized successfully (bulk)"
+                ),
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Could not write bulk fiscalization audit entries (started %s)", started)
+    finally:
+        db.close()
+
+
+def fiscalize_bulk(company_id: int, invoice_ids: list[int], user_id: int) -> Iterator[dict]:
+    """Fiscalize ``invoice_ids`` grouped by device; yields one result per document.
+
+    The last item is ``{"summary": {...}}``.
+    """
+    started = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        rows = db.query(Invoice.id, Invoice.device_id).filter(Invoice.id.in_(invoice_ids)).all()
+    finally:
+        db.close()
+    by_device: dict[int | None, list[int]] = {}
+    for invoice_id, device_id in sorted(rows):
+        by_device.setdefault(device_id, []).append(invoice_id)
+
+    out: queue.Queue = queue.Queue()
+    results: list[dict] = []
+    workers = max(1, min(settings.fiscal_bulk_device_concurrency, len(by_device) or 1))
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fiscal-bulk") as pool:
+            for device_id, ids in by_device.items():
+                pool.submit(_fiscalize_device, device_id, ids, user_id, out)
+            remaining = len(by_device)
+            while remaining:
+                item = out.get()
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                results.append(item)
+                yield item
+    finally:
+        # If the client went away the workers still finished; audit everything
+        while not out.empty():
+            item = out.get_nowait()
+            if item is not _DONE:
+                results.append(item)
+        _write_audit(user_id, company_id, results, started)
+
+    counts: dict[str, int] = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    yield {
+        "summary": {
+            "documents": len(rows),
+            "devices": len(by_device),
+            "counts": counts,
+            "elapsed_seconds": round((datetime.utcnow() - started).total_seconds(), 3),
+        }
+    }
@@ -0,0 +1,177 @@
+"""Local fiscal day counters, maintained receipt by receipt.
+
+``submit_invoice`` folds every signed receipt into ``fiscal_day_counters``
+while it still holds the device's chain lock, so the counters commit (or roll
+back) together with the receipt and never race another submission.  That
+gives a live view of the open day without asking FDMS, lets CloseDay sign
+from local values, and can be compared with GetStatus to spot drift.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from sqlalchemy.orm import Session
+
+from app.models.device import Device
+from app.models.fiscal_day_counter import FiscalDayCounter
+
+_CENT = Decimal("0.01")
+
+# (counter_type, currency, tax_id, money_type)
+CounterKey = tuple[str, str, int, str]
+
+
+def current_day_no(device: Device) -> int:
+    """Number of the device's open (or most recently opened) fiscal day."""
+    return device.current_fiscal_day_no or (device.last_fiscal_day_no or 0) + 1
+
+
+def _money(value) -> Decimal:
+    return Decimal(str(value or 0)).quantize(_CENT, rounding=ROUND_HALF_UP)
+
+
+def receipt_counter_deltas(receipt: dict) -> dict[CounterKey, tuple[Decimal, float | None]]:
+    """Counter increments a receipt contributes, with the tax percent of each.
+
+    Invoices feed ``SaleByTax``/``SaleTaxByTax``, credit and debit notes their
+    own ``*ByTax`` counters (credit notes count negative), and every payment
+    feeds ``BalanceByMoneyType``.
+    """
+    receipt_type = receipt.get("receiptType", "FiscalInvoice")
+    prefix = {"CreditNote": "CreditNote", "DebitNote": "DebitNote"}.get(receipt_type, "Sale")
+    sign = Decimal("-1") if receipt_type == "CreditNote" else Decimal("1")
+    currency = str(receipt.get("receiptCurrency", "")).upper()
+
+    deltas: dict[CounterKey, tuple[Decimal, float | None]] = {}
+
+    def add(key: CounterKey, amount, percent: float | None = None) -> None:
+        current, _ = deltas.get(key, (Decimal("0"), percent))
+        deltas[key] = (current + sign * _money(amount), percent)
+
+    for tax in receipt.get("receiptTaxes", []):
+        tax_id = int(tax.get("taxID", 0) or 0)
+        percent = tax.get("taxPercent")
+        percent = float(percent) if percent is not None else None
+        add((f"{prefix}ByTax", currency, tax_id, ""), tax.get("salesAmountWithTax", 0), percent)
+        add((f"{prefix}TaxByTax", currency, tax_id, ""), tax.get("taxAmount", 0), percent)
+    for payment in receipt.get("receiptPayments", []):
+        add(("BalanceByMoneyType", currency, 0, str(payment.get("moneyTypeCode", ""))), payment.get("paymentAmount", 0))
+    return deltas
+
+
+def apply_receipt(db: Session, device: Device, receipt: dict) -> None:
+    """Add a receipt to the device's counters for the current fiscal day.
+
+    The caller must hold the device's chain lock (see ``receipt_chain``) so
+    the read-modify-write below cannot interleave with another receipt.
+    """
+    deltas = receipt_counter_deltas(receipt)
+    if not deltas:
+        return
+    day_no = current_day_no(device)
+    rows = {
+        (r.counter_type, r.currency, r.tax_id, r.money_type): r
+        for r in db.query(FiscalDayCounter).filter(
+            FiscalDayCounter.device_id == device.id,
+            FiscalDayCounter.fiscal_day_no == day_no,
+        )
+    }
+    for key, (amount, percent) in deltas.items():
+        row = rows.get(key)
+        if row is None:
+            counter_type, currency, tax_id, money_type = key
+            row = FiscalDayCounter(
+                company_id=device.company_id,
+                device_id=device.id,
+                fiscal_day_no=day_no,
+                counter_type=counter_type,
+                currency=currency,
+                tax_id=tax_id,
+                tax_percent=percent,
+                money_type=money_type,
+                value=0.0,
+            )
+            db.add(row)
+        row.value = float(_money(row.value) + amount)
+    # Later receipts in the same transaction must see these rows
+    db.flush()
+
+
+def to_fdms(row: FiscalDayCounter) -> dict:
+    """A counter row in the shape FDMS uses for ``fiscalDayCounters``."""
+    counter = {
+        "fiscalCounterType": row.counter_type,
+        "fiscalCounterCurrency": row.currency,
+        "fiscalCounterValue": row.value,
+    }
+    if row.counter_type == "BalanceByMoneyType":
+        counter["fiscalCounterMoneyType"] = row.money_type
+    else:
+        counter["fiscalCounterTaxID"] = row.tax_id
+        if row.tax_percent is not None:
+            counter["fiscalCounterTaxPercent"] = row.tax_percent
+    return counter
+
+
+def local_counters(db: Session, device: Device, fiscal_day_no: int | None = None) -> list[dict]:
+    """The device's counters for a fiscal day (default: the current one)."""
+    day_no = fiscal_day_no if fiscal_day_no is not None else current_day_no(device)
+    rows = (
+        db.query(FiscalDayCounter)
+        .filter(FiscalDayCounter.device_id == device.id, FiscalDayCounter.fiscal_day_no == day_no)
+        .order_by(FiscalDayCounter.counter_type, FiscalDayCounter.currency, FiscalDayCounter.tax_id, FiscalDayCounter.money_type)
+        .all()
+    )
+    return [to_fdms(r) for r in rows]
+
+
+def _key(counter: dict) -> CounterKey:
+    counter_type = str(counter.get("fiscalCounterType", ""))
+    currency = str(counter.get("fiscalCounterCurrency", "")).upper()
+    if counter_type == "BalanceByMoneyType":
+        return (counter_type, currency, 0, str(counter.get("fiscalCounterMoneyType", "")))
+    return (counter_type, currency, int(counter.get("fiscalCounterTaxID", 0) or 0), "")
+
+
+def compare_counters(local: list[dict], remote: list[dict]) -> list[dict]:
+    """Counters whose local and FDMS values differ by at least a cent."""
+    local_values = {_key(c): _money(c.get("fiscalCounterValue")) for c in local}
+    remote_values: dict[CounterKey, Decimal] = {}
+    for c in remote:
+        remote_values[_key(c)] = remote_values.get(_key(c), Decimal("0")) + _money(c.get("fiscalCounterValue"))
+
+    drift = []
+    for key in sorted(set(local_values) | set(remote_values)):
+        mine = local_values.get(key, Decimal("0"))
+        theirs = remote_values.get(key, Decimal("0"))
+        if mine != theirs:
+            counter_type, currency, tax_id, money_type = key
+            drift.append({
+                "counter_type": counter_type,
+                "currency": currency,
+                "tax_id": tax_id if counter_type != "BalanceByMoneyType" else None,
+                "money_type": money_type or None,
+                "local": float(mine),
+                "fdms": float(theirs),
+                "difference": float(mine - theirs),
+            })
+    return drift
+
+
+def fiscal_day_summary(db: Session, device: Device) -> dict:
+    """Live "fiscal day so far" view, read only from local state."""
+    counters = local_counters(db, device)
+    totals: dict[str, dict[str, float]] = {}
+    for c in counters:
+        per_currency = totals.setdefault(c["fiscalCounterCurrency"], {})
+        per_currency[c["fiscalCounterType"]] = round(
+            per_currency.get(c["fiscalCounterType"], 0.0) + c["fiscalCounterValue"], 2
+        )
+    return {
+        "device_id": device.id,
+        "fiscal_day_no": current_day_no(device),
+        "fiscal_day_status": device.fiscal_day_status,
+        "fiscal_day_opened_at": device.fiscal_day_opened_at,
+        "fiscal_mode": device.fiscal_mode,
+        "receipt_counter": device.last_receipt_counter or 0,
+        "totals": totals,
+        "counters": counters,
+    }
@@ -0,0 +1,418 @@
+"""Automatic fiscal day rollover at each company's cut-off time.
+
+Companies with ``fiscal_day_auto_close`` set get every registered device's
+fiscal day closed and a new one opened once a day at ``fiscal_day_cutoff``
+(CAT).  One worker across all processes holds the ``fiscal-day-scheduler``
+lease (see ``leases``) and looks for companies whose cut-off has passed.  The
+devices of all due companies are rolled over on one bounded thread pool, each
+device on its own, so a slow or failing device only holds up itself.  A
+device that fails is retried with back-off; every attempt starts again from
+GetStatus, so a retry after a successful close only opens the new day.
+
+Each run is stored in ``fiscal_day_runs`` with one result per device for the
+dashboard.  A cut-off missed while no worker was running is caught up within
+``fiscal_day_scheduler_grace_minutes``; after that the day is left for a
+manual close rather than being closed in the middle of trading.
+"""
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, time as dt_time, timedelta, timezone
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.company_settings import CompanySettings
+from app.models.device import Device
+from app.models.fiscal_day_run import FiscalDayRun
+from app.models.invoice import Invoice
+from app.services.fdms import close_day, get_status, open_day
+from app.services.fiscal_offline import sync_device
+from app.services.leases import WORKER_ID, acquire_lease, lease_info
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "fiscal-day-scheduler"
+
+# ZIMRA devices are in Central Africa Time (CAT = UTC+2)
+_CAT = timezone(timedelta(hours=2))
+# How often a pending asynchronous CloseDay is polled
+_CLOSE_POLL_SECONDS = 2.0
+
+
+def _parse_cutoff(value: str | None) -> dt_time | None:
+    try:
+        return datetime.strptime(value or "", "%H:%M").time()
+    except ValueError:
+        return None
+
+
+def due_runs(db: Session, now: datetime | None = None) -> list[tuple[int, str, str]]:
+    """``(company_id, run_date, cutoff)`` of companies due for a scheduled run.
+
+    ``run_date`` is the CAT date of the cut-off; a cut-off is due from its
+    time until the grace period ends and only if it has no run yet.
+    """
+    local = (now or datetime.now(timezone.utc)).astimezone(_CAT)
+    grace = timedelta(minutes=settings.fiscal_day_scheduler_grace_minutes)
+    rows = (
+        db.query(CompanySettings.company_id, CompanySettings.fiscal_day_cutoff)
+        .filter(CompanySettings.fiscal_day_auto_close == True)
+        .all()
+    )
+    due = []
+    for company_id, cutoff in rows:
+        at = _parse_cutoff(cutoff)
+        if at is None:
+            logger.warning("Company %s has an invalid fiscal day cut-off %r", company_id, cutoff)
+            continue
+        for day in (local.date(), local.date() - timedelta(days=1)):
+            scheduled = datetime.combine(day, at, tzinfo=_CAT)
+            if scheduled <= local < scheduled + grace:
+                due.append((company_id, day.isoformat(), cutoff))
+                break
+    if not due:
+        return []
+    done = set(
+        db.query(FiscalDayRun.company_id, FiscalDayRun.run_key)
+        .filter(FiscalDayRun.company_id.in_([c for c, _, _ in due]))
+        .filter(FiscalDayRun.run_key.in_([d for _, d, _ in due]))
+        .all()
+    )
+    return [entry for entry in due if (entry[0], entry[1]) not in done]
+
+
+def _company_devices(db: Session, company_id: int) -> list[int]:
+    return [
+        device_id
+        for (device_id,) in db.query(Device.id)
+        .filter(Device.company_id == company_id, Device.crt_data.isnot(None), Device.key_data.isnot(None))
+        .order_by(Device.id)
+    ]
+
+
+def create_run(
+    db: Session, company_id: int, run_date: str, trigger: str = "scheduled", cutoff: str = ""
+) -> FiscalDayRun | None:
+    """Record a new run; None if the scheduled run for that date already exists."""
+    run = FiscalDayRun(
+        company_id=company_id,
+        run_date=run_date,
+        run_key=run_date if trigger == "scheduled" else f"{trigger}-{uuid.uuid4().hex[:12]}",
+        trigger=trigger,
+        cutoff=cutoff,
+        status="running",
+        device_count=len(_company_devices(db, company_id)),
+        started_at=datetime.utcnow(),
+    )
+    db.add(run)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    db.refresh(run)
+    return run
+
+
+def _wait_for_close(device: Device, db: Session) -> dict:
+    """Poll GetStatus until an asynchronous CloseDay has been processed."""
+    deadline = time.monotonic() + settings.fiscal_day_close_wait_seconds
+    while True:
+        status = get_status(device, db, fresh=True)
+        day_status = status.get("fiscalDayStatus", "")
+        if day_status == "FiscalDayCloseFailed":
+            code = status.get("fiscalDayClosingErrorCode", "")
+            raise ValueError(f"FDMS could not close fiscal day{f' ({code})' if code else ''}")
+        if day_status != "FiscalDayCloseInitiated":
+            return status
+        if time.monotonic() >= deadline:
+            raise ValueError("FDMS is still processing CloseDay; will retry")
+        time.sleep(_CLOSE_POLL_SECONDS)
+
+
+def _rollover(device: Device, db: Session, result: dict) -> None:
+    """Close the device's open day (if any) and open the next one.
+
+    Day numbers are written to ``result`` as each step succeeds, so a close
+    done by an attempt whose OpenDay failed is still reported.
+    """
+    pending_offline = (
+        db.query(Invoice.id)
+        .filter(Invoice.device_id == device.id, Invoice.zimra_status == "offline")
+        .count()
+    )
+    if pending_offline or device.fiscal_mode == "offline":
+        # Offline receipts belong to the day being closed
+        summary = sync_device(db, device.id)
+        if summary["pending_receipts"]:
+            raise ValueError(f"{summary['pending_receipts']} offline receipt(s) are still waiting for upload")
+        db.refresh(device)
+
+    status = get_status(device, db, fresh=True)
+    if status.get("fiscalDayStatus") == "FiscalDayCloseInitiated":
+        status = _wait_for_close(device, db)
+
+    if status.get("fiscalDayStatus") in ("FiscalDayOpened", "FiscalDayCloseFailed"):
+        closed_day_no = status.get("lastFiscalDayNo", device.last_fiscal_day_no or 0) + 1
+        close_day(device, db)
+        db.commit()
+        status = _wait_for_close(device, db)
+        device.fiscal_day_status = "closed"
+        device.last_fiscal_day_no = status.get("lastFiscalDayNo", closed_day_no)
+        db.commit()
+        result["closed_day_no"] = closed_day_no
+
+    open_day(device, db)
+    result["opened_day_no"] = device.current_fiscal_day_no
+
+
+class _DeviceGuard:
+    """Devices being rolled over in this process, so two runs never overlap on one."""
+
+    def __init__(self):
+        self._active: set[int] = set()
+        self._lock = threading.Lock()
+
+    def claim(self, device_id: int) -> bool:
+        with self._lock:
+            if device_id in self._active:
+                return False
+            self._active.add(device_id)
+            return True
+
+    def release(self, device_id: int) -> None:
+        with self._lock:
+            self._active.discard(device_id)
+
+
+_guard = _DeviceGuard()
+
+
+def _retry_delay(attempt: int) -> float:
+    base = settings.fiscal_day_scheduler_retry_seconds * (2 ** (attempt - 1))
+    return base * random.uniform(0.5, 1.0)
+
+
+def roll_device(device_id: int) -> dict:
+    """Roll one device's fiscal day over, retrying failures; returns its result."""
+    result = {
+        "device_id": device_id,
+        "fdms_device_id": None,
+        "status": "failed",
+        "closed_day_no": None,
+        "opened_day_no": None,
+        "attempts": 0,
+        "error": "",
+        "duration_ms": 0.0,
+    }
+    if not _guard.claim(device_id):
+        result.update(status="skipped", error="A rollover of this device is already in progress")
+        return result
+    clock = time.perf_counter()
+    max_attempts = max(1, settings.fiscal_day_scheduler_max_attempts)
+    try:
+        for attempt in range(1, max_attempts + 1):
+            result["attempts"] = attempt
+            db = SessionLocal()
+            try:
+                device = db.get(Device, device_id)
+                if device is None:
+                    result.update(status="skipped", error="Device not found")
+                    break
+                result["fdms_device_id"] = device.device_id
+                _rollover(device, db, result)
+                result.update(status="ok", error="")
+                break
+            except Exception as exc:
+                db.rollback()
+                result["error"] = str(exc)
+                logger.warning(
+                    "Fiscal day rollover of device %s failed (attempt %s/%s): %s",
+                    device_id, attempt, max_attempts, exc,
+                )
+            finally:
+                db.close()
+            if attempt < max_attempts:
+                time.sleep(_retry_delay(attempt))
+    finally:
+        _guard.release(device_id)
+        result["duration_ms"] = round((time.perf_counter() - clock) * 1000, 1)
+    return result
+
+
+def _finish_run(run_id: int, results: list[dict]) -> None:
+    results = sorted(results, key=lambda r: r["device_id"])
+    succeeded = sum(1 for r in results if r["status"] == "ok")
+    failed = sum(1 for r in results if r["status"] == "failed")
+    db = SessionLocal()
+    try:
+        run = db.get(FiscalDayRun, run_id)
+        run.device_count = len(results)
+        run.succeeded_count = succeeded
+        run.failed_count = failed
+        run.skipped_count = len(results) - succeeded - failed
+        run.status = "completed" if not failed else "failed" if not succeeded else "partial"
+        run.results = json.dumps(results)
+        run.completed_at = datetime.utcnow()
+        db.commit()
+        logger.info(
+            "Fiscal day run %s for company %s %s: %s ok, %s failed",
+            run_id, run.company_id, run.status, succeeded, failed,
+        )
+    finally:
+        db.close()
+
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _device_pool() -> ThreadPoolExecutor:
+    """One pool for every run in this process, so concurrent runs share the bound."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=max(1, settings.fiscal_day_scheduler_workers), thread_name_prefix="fiscal-day"
+            )
+        return _pool
+
+
+def execute_runs(run_ids: list[int]) -> None:
+    """Roll over the devices of the given runs and store each run's report."""
+    db = SessionLocal()
+    try:
+        plan = {
+            run.id: _company_devices(db, run.company_id)
+            for run in db.query(FiscalDayRun).filter(FiscalDayRun.id.in_(run_ids))
+        }
+    finally:
+        db.close()
+
+    results: dict[int, list[dict]] = {run_id: [] for run_id in plan}
+    for run_id, device_ids in plan.items():
+        if not device_ids:
+            _finish_run(run_id, [])
+    pool = _device_pool()
+    futures = {
+        pool.submit(roll_device, device_id): run_id
+        for run_id, device_ids in plan.items()
+        for device_id in device_ids
+    }
+    for future in as_completed(futures):
+        run_id = futures[future]
+        try:
+            results[run_id].append(future.result())
+        except Exception as exc:
+            logger.exception("Fiscal day rollover task failed")
+            results[run_id].append({"device_id": 0, "status": "failed", "error": str(exc)})
+        if len(results[run_id]) == len(plan[run_id]):
+            _finish_run(run_id, results[run_id])
+
+
+def start_manual_run(db: Session, company_id: int) -> FiscalDayRun:
+    """Roll over a company's devices now, in the background."""
+    run = create_run(db, company_id, datetime.now(_CAT).date().isoformat(), trigger="manual")
+    threading.Thread(target=execute_runs, args=([run.id],), daemon=True, name="fiscal-day-manual").start()
+    return run
+
+
+class FiscalDayScheduler:
+    def __init__(self):
+        self.is_leader = False
+        self.last_check_at: datetime | None = None
+
+    def tick(self) -> list[int]:
+        """Create the runs that are due and start them; returns their ids."""
+        db = SessionLocal()
+        try:
+            run_ids = []
+            for company_id, run_date, cutoff in due_runs(db):
+                run = create_run(db, company_id, run_date, cutoff=cutoff)
+                if run is not None:
+                    run_ids.append(run.id)
+        finally:
+            db.close()
+        self.last_check_at = datetime.utcnow()
+        if run_ids:
+            logger.info("Starting scheduled fiscal day runs %s", run_ids)
+            # Run off the loop thread so the lease keeps being renewed
+            threading.Thread(target=execute_runs, args=(run_ids,), daemon=True, name="fiscal-day-runs").start()
+        return run_ids
+
+    def run(self) -> None:
+        renew_every = settings.fiscal_day_scheduler_lease_seconds / 3
+        renewed = 0.0
+        checked = 0.0
+        while True:
+            try:
+                if time.monotonic() - renewed >= renew_every:
+                    leader = acquire_lease(LEASE_NAME, settings.fiscal_day_scheduler_lease_seconds)
+                    renewed = time.monotonic()
+                    if leader != self.is_leader:
+                        logger.info("Fiscal day scheduler leadership %s (%s)", "acquired" if leader else "lost", WORKER_ID)
+                        self.is_leader = leader
+                if self.is_leader and time.monotonic() - checked >= settings.fiscal_day_scheduler_tick_seconds:
+                    checked = time.monotonic()
+                    self.tick()
+            except Exception:
+                logger.exception("Fiscal day scheduler pass failed")
+            time.sleep(min(renew_every, settings.fiscal_day_scheduler_tick_seconds))
+
+
+_scheduler: FiscalDayScheduler | None = None
+_start_lock = threading.Lock()
+
+
+def start_fiscal_day_scheduler() -> None:
+    """Start this process's fiscal day scheduler (idempotent).
+
+    Every worker runs one, but only the lease holder starts runs.
+    """
+    global _scheduler
+    with _start_lock:
+        if _scheduler is not None or not settings.fiscal_day_scheduler_enabled:
+            return
+        _scheduler = FiscalDayScheduler()
+    threading.Thread(target=_scheduler.run, daemon=True, name="fiscal-day-scheduler").start()
+
+
+def run_report(run: FiscalDayRun, include_results: bool = True) -> dict:
+    report = {
+        "id": run.id,
+        "company_id": run.company_id,
+        "run_date": run.run_date,
+        "trigger": run.trigger,
+        "cutoff": run.cutoff,
+        "status": run.status,
+        "device_count": run.device_count,
+        "succeeded_count": run.succeeded_count,
+        "failed_count": run.failed_count,
+        "skipped_count": run.skipped_count,
+        "started_at": run.started_at,
+        "completed_at": run.completed_at,
+    }
+    if include_results:
+        report["results"] = json.loads(run.results or "[]")
+    return report
+
+
+def scheduler_stats() -> dict:
+    db = SessionLocal()
+    try:
+        leader = lease_info(db, LEASE_NAME)
+    finally:
+        db.close()
+    return {
+        "worker": WORKER_ID,
+        "is_leader": bool(_scheduler and _scheduler.is_leader),
+        "last_check_at": _scheduler.last_check_at if _scheduler else None,
+        "lease": leader,
+    }
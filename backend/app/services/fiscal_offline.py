@@ -0,0 +1,390 @@
+"""Offline fiscal mode: upload locally signed receipts in batched files.
+
+When SubmitReceipt cannot reach FDMS, ``submit_invoice`` switches the device
+to ``fiscal_mode="offline"`` and keeps signing and chaining receipts locally
+(``Invoice.zimra_status="offline"``).  The sync loop here pings offline
+devices and, once FDMS answers, uploads their receipts in chain order as
+SubmitFile batches of ``fiscal_offline_batch_size``.  GetFileStatus results
+are reconciled per receipt onto ``Invoice`` and ``POSOrder``; when nothing is
+left to upload the device goes back to online submission.
+
+A file FDMS refuses as a whole (SubmitFile fails, or processing fails with no
+per-receipt result) is marked ``error`` but its receipts stay ``offline``:
+they are signed into the device's hash chain, so they still hold back
+CloseDay and nothing after them may be uploaded.  The device's uploads stop
+until someone fixes the cause and calls ``retry_file``.
+"""
+import base64
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import exists, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, undefer_group
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.device import Device
+from app.models.fiscal_file import FiscalFile
+from app.models.invoice import Invoice
+from app.models.pos_session import POSOrder
+from app.services.fdms import (
+    FDMSUnavailableError,
+    get_file_status,
+    submit_file,
+)
+from app.services.fiscal_outbox import mark_fiscal_error, mark_fiscalized
+from app.services.liveness import ping_and_record
+from app.services.receipt_chain import lock_device_chain
+
+logger = logging.getLogger(__name__)
+
+# Files stuck in "uploading" this long were abandoned by a crashed worker
+_STALE_UPLOAD = timedelta(minutes=10)
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def _pending_query(db: Session, device_id: int):
+    return db.query(Invoice).filter(Invoice.device_id == device_id, Invoice.zimra_status == "offline")
+
+
+def _in_flight_files(db: Session, device_id: int) -> list[FiscalFile]:
+    return (
+        db.query(FiscalFile)
+        .filter(FiscalFile.device_id == device_id, FiscalFile.status.in_(("uploading", "processing")))
+        .order_by(FiscalFile.first_global_no)
+        .all()
+    )
+
+
+def _build_file(device: Device, invoices: list[Invoice], sequence: int) -> dict:
+    receipts = [json.loads(inv.zimra_payload)["receipt"] for inv in invoices]
+    opened = device.fiscal_day_opened_at
+    content = {
+        "header": {
+            "deviceId": int(device.device_id),
+            "fiscalDayNo": device.current_fiscal_day_no or (device.last_fiscal_day_no or 0) + 1,
+            "fiscalDayOpened": opened.strftime("%Y-%m-%dT%H:%M:%S") if opened else "",
+            "fileSequence": sequence,
+        },
+        "content": {"receipts": receipts},
+        "footer": {"receiptCounter": receipts[-1]["receiptCounter"] if receipts else 0},
+    }
+    return {"file": base64.b64encode(json.dumps(content).encode("utf-8")).decode("ascii")}
+
+
+def _upload_next(db: Session, device: Device) -> FiscalFile | None:
+    """Upload the next batch of offline receipts that is not in a file yet."""
+    covered = (
+        db.query(func.max(FiscalFile.last_global_no))
+        .filter(FiscalFile.device_id == device.id, FiscalFile.status.in_(("uploading", "processing")))
+        .scalar()
+    ) or 0
+    invoices = (
+        _pending_query(db, device.id)
+        .options(undefer_group("fiscal_artefacts"))
+        .filter(Invoice.zimra_receipt_global_no > covered)
+        .order_by(Invoice.zimra_receipt_global_no)
+        .limit(settings.fiscal_offline_batch_size)
+        .all()
+    )
+    if not invoices:
+        return None
+
+    sequence = (
+        db.query(func.count(FiscalFile.id))
+        .filter(FiscalFile.device_id == device.id, FiscalFile.fiscal_day_no == device.current_fiscal_day_no)
+        .scalar()
+    ) + 1
+    fiscal_file = FiscalFile(
+        company_id=device.company_id,
+        device_id=device.id,
+        fiscal_day_no=device.current_fiscal_day_no or 0,
+        file_sequence=sequence,
+        first_global_no=invoices[0].zimra_receipt_global_no,
+        last_global_no=invoices[-1].zimra_receipt_global_no,
+        receipt_count=len(invoices),
+        status="uploading",
+    )
+    db.add(fiscal_file)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker claimed this range
+        db.rollback()
+        return None
+
+    try:
+        result = submit_file(device, db, _build_file(device, invoices, sequence))
+    except FDMSUnavailableError:
+        # Still offline; drop the claim so the range is retried as a whole
+        db.delete(fiscal_file)
+        db.commit()
+        raise
+    except Exception as exc:
+        _fail_file(db, device, fiscal_file, f"SubmitFile failed: {exc}")
+        db.commit()
+        return fiscal_file
+
+    fiscal_file.operation_id = str(result.get("operationID", ""))
+    fiscal_file.status = "processing"
+    fiscal_file.submitted_at = datetime.utcnow()
+    db.commit()
+    logger.info(
+        "Uploaded offline file %s for device %s (receipts %s-%s)",
+        fiscal_file.id, device.device_id, fiscal_file.first_global_no, fiscal_file.last_global_no,
+    )
+    return fiscal_file
+
+
+def _file_invoices(db: Session, fiscal_file: FiscalFile) -> list[Invoice]:
+    return (
+        _pending_query(db, fiscal_file.device_id)
+        .filter(
+            Invoice.zimra_receipt_global_no >= fiscal_file.first_global_no,
+            Invoice.zimra_receipt_global_no <= fiscal_file.last_global_no,
+        )
+        .all()
+    )
+
+
+def _orders_by_invoice(db: Session, invoices: list[Invoice]) -> dict[int, POSOrder]:
+    ids = [inv.id for inv in invoices]
+    if not ids:
+        return {}
+    return {o.invoice_id: o for o in db.query(POSOrder).filter(POSOrder.invoice_id.in_(ids)).all()}
+
+
+def _fail_file(db: Session, device: Device, fiscal_file: FiscalFile, error: str) -> None:
+    """Mark a file refused as a whole; its receipts stay offline and block the device's uploads."""
+    fiscal_file.status = "error"
+    fiscal_file.last_error = error
+    fiscal_file.completed_at = datetime.utcnow()
+    logger.error(
+        "Offline uploads of device %s stopped: file %s (receipts %s-%s) was refused: %s",
+        device.device_id, fiscal_file.id, fiscal_file.first_global_no, fiscal_file.last_global_no, error,
+    )
+
+
+def _blocking_file(db: Session, device_id: int) -> FiscalFile | None:
+    """The first refused file whose receipts are still waiting for upload."""
+    return (
+        db.query(FiscalFile)
+        .filter(
+            FiscalFile.device_id == device_id,
+            FiscalFile.status == "error",
+            exists().where(
+                Invoice.device_id == FiscalFile.device_id,
+                Invoice.zimra_status == "offline",
+                Invoice.zimra_receipt_global_no >= FiscalFile.first_global_no,
+                Invoice.zimra_receipt_global_no <= FiscalFile.last_global_no,
+            ),
+        )
+        .order_by(FiscalFile.first_global_no)
+        .first()
+    )
+
+
+def _reconcile(db: Session, fiscal_file: FiscalFile, status: dict) -> None:
+    """Apply per-receipt acknowledgements of a processed file."""
+    acks = {int(r.get("receiptGlobalNo", 0)): r for r in status.get("receipts", []) or []}
+    invoices = _file_invoices(db, fiscal_file)
+    orders = _orders_by_invoice(db, invoices)
+    accepted = rejected = 0
+    for invoice in invoices:
+        order = orders.get(invoice.id)
+        ack = acks.get(invoice.zimra_receipt_global_no)
+        errors = (ack or {}).get("validationErrors") or []
+        if ack is None or errors:
+            detail = "; ".join(
+                str(e.get("validationErrorCode") or e.get("message") or e) if isinstance(e, dict) else str(e)
+                for e in errors
+            ) or "Receipt missing from file acknowledgement"
+            mark_fiscal_error(invoice, order, detail)
+            rejected += 1
+            continue
+        invoice.zimra_status = "submitted"
+        invoice.zimra_receipt_id = str(ack.get("receiptID", ""))
+        mark_fiscalized(invoice, order, invoice.fiscalized_by_id)
+        accepted += 1
+    fiscal_file.accepted_count = accepted
+    fiscal_file.rejected_count = rejected
+
+
+def _poll(db: Session, device: Device, fiscal_file: FiscalFile) -> None:
+    status = get_file_status(device, db, fiscal_file.operation_id)
+    state = status.get("fileProcessingStatus", "")
+    if state == "FileProcessingInProgress":
+        return
+    if state == "FileProcessingError" and not status.get("receipts"):
+        _fail_file(db, device, fiscal_file, str(status.get("fileProcessingError", "") or "File rejected"))
+        db.commit()
+        return
+    _reconcile(db, fiscal_file, status)
+    fiscal_file.status = "done" if not fiscal_file.rejected_count else "error"
+    if fiscal_file.rejected_count:
+        fiscal_file.last_error = f"{fiscal_file.rejected_count} receipt(s) rejected"
+    fiscal_file.completed_at = datetime.utcnow()
+    db.commit()
+
+
+def _release_stale_uploads(db: Session, device_id: int) -> None:
+    cutoff = datetime.utcnow() - _STALE_UPLOAD
+    stale = (
+        db.query(FiscalFile)
+        .filter(
+            FiscalFile.device_id == device_id,
+            FiscalFile.status == "uploading",
+            FiscalFile.created_at < cutoff,
+        )
+        .all()
+    )
+    for fiscal_file in stale:
+        db.delete(fiscal_file)
+    if stale:
+        db.commit()
+
+
+def sync_device(db: Session, device_id: int) -> dict:
+    """Upload and reconcile offline receipts of one device.
+
+    Returns a summary; raises ``FDMSUnavailableError`` while FDMS is still
+    unreachable.
+    """
+    device = db.query(Device).filter(Device.id == device_id).first()
+    if device is None:
+        raise ValueError("Device not found")
+    _release_stale_uploads(db, device.id)
+
+    # Confirm the link is back before uploading anything
+    ping_and_record(device, db)
+
+    for fiscal_file in _in_flight_files(db, device.id):
+        if fiscal_file.status == "processing":
+            _poll(db, device, fiscal_file)
+
+    uploaded = 0
+    blocked = _blocking_file(db, device.id)
+    while blocked is None:
+        fiscal_file = _upload_next(db, device)
+        if fiscal_file is None:
+            break
+        uploaded += 1
+        if fiscal_file.status == "processing":
+            _poll(db, device, fiscal_file)
+        if fiscal_file.status == "error":
+            blocked = _blocking_file(db, device.id)
+
+    pending = _pending_query(db, device.id).count()
+    if not pending and not _in_flight_files(db, device.id) and device.fiscal_mode == "offline":
+        # Flip back under the chain lock so no receipt is signed offline in between
+        device = lock_device_chain(db, device.id)
+        if not _pending_query(db, device.id).count():
+            device.fiscal_mode = "online"
+            device.offline_since = None
+            logger.info("Device %s back online", device.device_id)
+        db.commit()
+    return {
+        "device_id": device.id,
+        "fiscal_mode": device.fiscal_mode,
+        "files_uploaded": uploaded,
+        "pending_receipts": pending,
+        "blocked_by_file": blocked.id if blocked is not None else None,
+    }
+
+
+def retry_file(db: Session, device: Device, file_id: int) -> None:
+    """Let a refused file's receipts be uploaded again, once the cause is fixed."""
+    fiscal_file = (
+        db.query(FiscalFile)
+        .filter(FiscalFile.id == file_id, FiscalFile.device_id == device.id, FiscalFile.status == "error")
+        .first()
+    )
+    if fiscal_file is None:
+        raise ValueError("No refused file with this id for the device")
+    if not _file_invoices(db, fiscal_file):
+        raise ValueError("The receipts of this file are no longer waiting for upload")
+    # The range is claimed by its first global number; free it for a new file
+    db.delete(fiscal_file)
+    db.commit()
+    logger.info("Offline file %s of device %s released for retry", file_id, device.device_id)
+
+
+def offline_status(db: Session, device: Device, limit: int = 20) -> dict:
+    files = (
+        db.query(FiscalFile)
+        .filter(FiscalFile.device_id == device.id)
+        .order_by(FiscalFile.id.desc())
+        .limit(limit)
+        .all()
+    )
+    blocked = _blocking_file(db, device.id)
+    return {
+        "device_id": device.id,
+        "fiscal_mode": device.fiscal_mode,
+        "offline_since": device.offline_since,
+        "pending_receipts": _pending_query(db, device.id).count(),
+        "blocked_by_file": blocked.id if blocked is not None else None,
+        "files": [
+            {
+                "id": f.id,
+                "status": f.status,
+                "fiscal_day_no": f.fiscal_day_no,
+                "file_sequence": f.file_sequence,
+                "first_global_no": f.first_global_no,
+                "last_global_no": f.last_global_no,
+                "receipt_count": f.receipt_count,
+                "accepted_count": f.accepted_count,
+                "rejected_count": f.rejected_count,
+                "operation_id": f.operation_id,
+                "last_error": f.last_error,
+                "submitted_at": f.submitted_at,
+                "completed_at": f.completed_at,
+            }
+            for f in files
+        ],
+    }
+
+
+def sync_once() -> None:
+    db = SessionLocal()
+    try:
+        device_ids = [
+            row.id for row in db.query(Device.id).filter(Device.fiscal_mode == "offline").all()
+        ]
+    finally:
+        db.close()
+    for device_id in device_ids:
+        db = SessionLocal()
+        try:
+            sync_device(db, device_id)
+        except FDMSUnavailableError:
+            db.rollback()
+        except Exception:
+            logger.exception("Offline sync failed for device %s", device_id)
+            db.rollback()
+        finally:
+            db.close()
+
+
+def _sync_loop() -> None:
+    while True:
+        try:
+            sync_once()
+        except Exception:
+            logger.exception("Offline sync pass failed")
+        threading.Event().wait(settings.fiscal_offline_sync_seconds)
+
+
+def start_offline_sync() -> None:
+    """Start the background offline sync loop for this process (idempotent)."""
+    global _started
+    with _start_lock:
+        if _started or not settings.fiscal_offline_enabled:
+            return
+        _started = True
+    threading.Thread(target=_sync_loop, daemon=True, name="fiscal-offline-sync").start()
@@ -0,0 +1,333 @@
+"""Fiscalization outbox.
+
+POS checkout and refunds write a ``FiscalOutbox`` row in the same transaction
+as the order and return straight away; a small pool of background workers
+drains the outbox, submits each receipt to FDMS and records the receipt ID and
+QR data on the invoice and POS order.  Failed submissions are retried with
+back-off until ``fiscal_outbox_max_attempts`` is reached.
+
+Workers in every process share the table: rows are claimed with
+``FOR UPDATE SKIP LOCKED`` on PostgreSQL so each entry is processed once,
+and under a transaction-scoped advisory lock on the device so two workers
+never claim entries of the same device at the same time.
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.fiscal_outbox import FiscalOutbox
+from app.models.invoice import Invoice
+from app.models.pos_session import POSOrder
+from app.models.user import User
+from app.services.fdms import submit_invoice
+
+logger = logging.getLogger(__name__)
+
+# Entries stuck in "processing" longer than this are assumed orphaned by a
+# crashed worker and are handed out again.
+_STALE_AFTER = timedelta(minutes=10)
+_MAX_BACKOFF_SECONDS = 300
+
+_wake = threading.Event()
+# Serialises claiming on databases without SKIP LOCKED (SQLite)
+_claim_lock = threading.Lock()
+# First key of the per-device advisory lock taken while claiming (PostgreSQL)
+_CLAIM_LOCK_CLASS = 0x0F15C
+_CLAIM_CANDIDATES = 20
+_started = False
+_start_lock = threading.Lock()
+
+
+def enqueue_fiscalization(
+    db: Session,
+    invoice: Invoice,
+    order: POSOrder | None = None,
+    user_id: int | None = None,
+) -> FiscalOutbox:
+    """Queue an invoice (and its POS order) for fiscalization.
+
+    The caller commits; call :func:`notify_workers` afterwards so an idle
+    worker picks the entry up immediately instead of at the next poll.
+    """
+    existing = (
+        db.query(FiscalOutbox)
+        .filter(
+            FiscalOutbox.invoice_id == invoice.id,
+            FiscalOutbox.status.in_(("pending", "processing")),
+        )
+        .first()
+    )
+    if existing:
+        return existing
+
+    entry = FiscalOutbox(
+        company_id=invoice.company_id,
+        invoice_id=invoice.id,
+        pos_order_id=order.id if order else None,
+        device_id=invoice.device_id,
+        requested_by_id=user_id,
+        status="pending",
+        available_at=datetime.utcnow(),
+    )
+    db.add(entry)
+    invoice.zimra_status = "pending"
+    invoice.zimra_errors = ""
+    if order is not None:
+        order.fiscal_status = "fiscal_pending"
+        order.fiscal_errors = ""
+    return entry
+
+
+def notify_workers() -> None:
+    _wake.set()
+
+
+def mark_fiscalized(invoice: Invoice, order: POSOrder | None, user_id: int | None) -> None:
+    """Copy a successful submission onto the invoice and its POS order."""
+    invoice.status = "fiscalized"
+    invoice.fiscalized_at = datetime.utcnow()
+    invoice.fiscalized_by_id = user_id
+    invoice.zimra_errors = ""
+    if order is not None:
+        order.is_fiscalized = True
+        order.status = "fiscalized"
+        order.fiscal_status = "fiscalized"
+        order.zimra_receipt_id = invoice.zimra_receipt_id
+        order.zimra_verification_code = invoice.zimra_verification_code
+        order.zimra_verification_url = invoice.zimra_verification_url
+        order.fiscal_errors = ""
+
+
+def mark_offline(invoice: Invoice, order: POSOrder | None, user_id: int | None) -> None:
+    """Record a receipt that was signed and chained locally while FDMS is offline.
+
+    The receipt already carries its QR data; the offline sync uploads it and
+    calls :func:`mark_fiscalized` once ZIMRA acknowledges it, with the
+    requesting user kept here in ``fiscalized_by_id``.
+    """
+    invoice.status = "fiscalized"
+    invoice.fiscalized_by_id = user_id
+    invoice.zimra_errors = ""
+    if order is not None:
+        order.fiscal_status = "fiscal_offline"
+        order.zimra_verification_code = invoice.zimra_verification_code
+        order.zimra_verification_url = invoice.zimra_verification_url
+        order.fiscal_errors = ""
+
+
+def mark_fiscal_error(invoice: Invoice, order: POSOrder | None, error: str) -> None:
+    invoice.zimra_status = "error"
+    invoice.zimra_errors = error
+    if order is not None:
+        order.fiscal_status = "fiscal_error"
+        order.fiscal_errors = error
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(_MAX_BACKOFF_SECONDS, 5 * 4 ** max(0, attempts - 1)))
+
+
+def _release_stale(db: Session) -> None:
+    cutoff = datetime.utcnow() - _STALE_AFTER
+    released = (
+        db.query(FiscalOutbox)
+        .filter(FiscalOutbox.status == "processing", FiscalOutbox.locked_at < cutoff)
+        .update({"status": "pending", "locked_by": ""}, synchronize_session=False)
+    )
+    if released:
+        logger.warning("Released %d stale fiscal outbox entries", released)
+    db.commit()
+
+
+def _claim_next(db: Session, worker_name: str) -> FiscalOutbox | None:
+    """Claim the oldest due entry whose device has nothing else in flight."""
+    now = datetime.utcnow()
+    busy_devices = select(FiscalOutbox.device_id).where(
+        FiscalOutbox.status == "processing",
+        FiscalOutbox.device_id.isnot(None),
+    )
+    query = (
+        db.query(FiscalOutbox)
+        .filter(
+            FiscalOutbox.status == "pending",
+            FiscalOutbox.available_at <= now,
+            or_(FiscalOutbox.device_id.is_(None), FiscalOutbox.device_id.notin_(busy_devices)),
+        )
+        .order_by(FiscalOutbox.id.asc())
+    )
+    if db.bind.dialect.name == "postgresql":
+        # Row locks alone do not keep a device to one entry in flight: two
+        # workers skip each other's locked rows and neither sees the other's
+        # uncommitted "processing".  The device advisory lock serialises
+        # claims per device, and the re-check after taking it sees any claim
+        # committed since our candidate query ran.
+        for entry in query.with_for_update(skip_locked=True).limit(_CLAIM_CANDIDATES).all():
+            if entry.device_id is not None:
+                locked = db.execute(
+                    select(func.pg_try_advisory_xact_lock(_CLAIM_LOCK_CLASS, entry.device_id))
+                ).scalar()
+                if not locked:
+                    continue
+                in_flight = db.execute(
+                    select(FiscalOutbox.id).where(
+                        FiscalOutbox.device_id == entry.device_id,
+                        FiscalOutbox.status == "processing",
+                    ).limit(1)
+                ).first()
+                if in_flight is not None:
+                    continue
+            entry.status = "processing"
+            entry.locked_at = now
+            entry.locked_by = worker_name
+            db.commit()
+            return entry
+        db.rollback()
+        return None
+
+    with _claim_lock:
+        entry = query.first()
+        if entry is None:
+            db.rollback()
+            return None
+        entry.status = "processing"
+        entry.locked_at = now
+        entry.locked_by = worker_name
+        db.commit()
+        return entry
+
+
+def _process(db: Session, entry: FiscalOutbox) -> None:
+    invoice = db.query(Invoice).filter(Invoice.id == entry.invoice_id).first()
+    order = None
+    if entry.pos_order_id:
+        order = db.query(POSOrder).filter(POSOrder.id == entry.pos_order_id).first()
+
+    if invoice is None:
+        entry.status = "error"
+        entry.last_error = "Invoice not found"
+        entry.completed_at = datetime.utcnow()
+        db.commit()
+        return
+
+    if invoice.zimra_status in ("submitted", "offline"):
+        # Already fiscalized (e.g. retried after a crash post-commit)
+        if invoice.zimra_status == "offline":
+            mark_offline(invoice, order, entry.requested_by_id)
+        else:
+            mark_fiscalized(invoice, order, entry.requested_by_id)
+        entry.status = "done"
+        entry.completed_at = datetime.utcnow()
+        db.commit()
+        return
+
+    try:
+        submit_invoice(invoice, db)
+        entry.status = "done"
+        entry.last_error = ""
+        entry.completed_at = datetime.utcnow()
+        if invoice.zimra_status == "offline":
+            mark_offline(invoice, order, entry.requested_by_id)
+        else:
+            mark_fiscalized(invoice, order, entry.requested_by_id)
+            if order is not None:
+                _audit_fiscalized(db, order, entry.requested_by_id)
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        error = str(exc)
+        entry = db.query(FiscalOutbox).filter(FiscalOutbox.id == entry.id).one()
+        invoice = db.query(Invoice).filter(Invoice.id == entry.invoice_id).one()
+        order = db.query(POSOrder).filter(POSOrder.id == entry.pos_order_id).first() if entry.pos_order_id else None
+
+        entry.attempts = (entry.attempts or 0) + 1
+        entry.last_error = error
+        entry.locked_by = ""
+        if entry.attempts >= settings.fiscal_outbox_max_attempts:
+            entry.status = "error"
+            entry.completed_at = datetime.utcnow()
+            mark_fiscal_error(invoice, order, error)
+        else:
+            entry.status = "pending"
+            entry.available_at = datetime.utcnow() + _backoff(entry.attempts)
+            invoice.zimra_errors = error
+            if order is not None:
+                order.fiscal_errors = error
+        db.commit()
+        logger.warning(
+            "Fiscalization of invoice %s failed (attempt %s): %s",
+            entry.invoice_id, entry.attempts, error,
+        )
+
+
+def _audit_fiscalized(db: Session, order: POSOrder, user_id: int | None) -> None:
+    from app.api.deps import log_audit
+
+    user = db.query(User).filter(User.id == user_id).first() if user_id else None
+    log_audit(
+        db=db, user=user,
+        action="pos_order_fiscalize",
+        resource_type="pos_order",
+        resource_id=order.id,
+        resource_reference=order.reference,
+        company_id=order.company_id,
+        changes_summary=f"POS order {order.reference} fiscalized",
+    )
+
+
+def drain_once(worker_name: str = "inline") -> bool:
+    """Process at most one due entry. Returns True when an entry was handled."""
+    db = SessionLocal()
+    try:
+        entry = _claim_next(db, worker_name)
+        if entry is None:
+            return False
+        _process(db, entry)
+        return True
+    finally:
+        db.close()
+
+
+def _worker_loop(worker_name: str) -> None:
+    logger.info("Fiscal outbox worker %s started", worker_name)
+    while True:
+        try:
+            if drain_once(worker_name):
+                continue
+        except Exception:
+            logger.exception("Fiscal outbox worker %s failed", worker_name)
+        _wake.wait(settings.fiscal_outbox_poll_seconds)
+        _wake.clear()
+
+
+def _reaper_loop() -> None:
+    while True:
+        db = SessionLocal()
+        try:
+            _release_stale(db)
+        except Exception:
+            logger.exception("Fiscal outbox reaper failed")
+            db.rollback()
+        finally:
+            db.close()
+        threading.Event().wait(_STALE_AFTER.total_seconds() / 2)
+
+
+def start_outbox_workers() -> None:
+    """Start the outbox worker pool for this process (idempotent)."""
+    global _started
+    with _start_lock:
+        if _started or settings.fiscal_outbox_workers <= 0:
+            return
+        _started = True
+    pid = os.getpid()
+    for i in range(settings.fiscal_outbox_workers):
+        name = f"fiscal-outbox-{pid}-{i}"
+        threading.Thread(target=_worker_loop, args=(name,), daemon=True, name=name).start()
+    threading.Thread(target=_reaper_loop, daemon=True, name=f"fiscal-outbox-reaper-{pid}").start()
+    logger.info("Started %d fiscal outbox workers in PID %s", settings.fiscal_outbox_workers, pid)
@@ -0,0 +1,237 @@
+"""Device heartbeat scheduler.
+
+FDMS expects every device to Ping at its own ``reportingFrequency``.  One
+worker across all processes wins the ``device-heartbeat`` lease (see
+``leases``) and runs the scheduler: each registered device gets its own due
+time, ``reporting_frequency`` minutes after its last ping minus a random
+jitter so devices do not ping in lockstep, and due pings run on a bounded
+thread pool so one slow FDMS response only holds up its own device.
+
+Lag (how late a ping started against its due time) and failures are kept per
+device and exposed through ``heartbeat_stats``.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.device import Device
+from app.services.leases import WORKER_ID, acquire_lease, lease_info
+from app.services.liveness import ping_and_record
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "device-heartbeat"
+
+# Retry a failed ping after this long instead of a full reporting period
+_RETRY_AFTER = timedelta(seconds=60)
+# How often the device list is re-read to pick up new registrations
+_REFRESH_EVERY = 30.0
+
+
+@dataclass
+class DeviceHeartbeat:
+    device_id: int
+    due_at: datetime
+    in_flight: bool = False
+    pings: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    last_started_at: datetime | None = None
+    last_ok_at: datetime | None = None
+    last_duration_ms: float = 0.0
+    last_lag_seconds: float = 0.0
+    max_lag_seconds: float = 0.0
+    last_error: str = ""
+
+
+def _period(reporting_frequency: int | None) -> timedelta:
+    return timedelta(minutes=max(1, reporting_frequency or 5))
+
+
+def _next_due(base: datetime, reporting_frequency: int | None) -> datetime:
+    """Due time one reporting period after ``base``, pulled earlier by jitter."""
+    period = _period(reporting_frequency)
+    jitter = period * random.uniform(0, settings.heartbeat_jitter)
+    return base + period - jitter
+
+
+class HeartbeatScheduler:
+    def __init__(self, workers: int):
+        self.devices: dict[int, DeviceHeartbeat] = {}
+        self.is_leader = False
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="heartbeat")
+        self._refreshed = 0.0
+
+    def refresh(self) -> None:
+        """Sync the schedule with the registered devices in the database."""
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(Device.id, Device.last_ping_at, Device.reporting_frequency)
+                .filter(Device.crt_data.isnot(None), Device.key_data.isnot(None))
+                .all()
+            )
+        finally:
+            db.close()
+        now = datetime.utcnow()
+        seen = set()
+        with self._lock:
+            for device_id, last_ping_at, frequency in rows:
+                seen.add(device_id)
+                if device_id in self.devices:
+                    continue
+                if last_ping_at is not None:
+                    due = _next_due(last_ping_at.replace(tzinfo=None), frequency)
+                else:
+                    # Never pinged: spread the first round over the jitter window
+                    due = now + _period(frequency) * random.uniform(0, settings.heartbeat_jitter)
+                self.devices[device_id] = DeviceHeartbeat(device_id=device_id, due_at=max(due, now))
+            for device_id in set(self.devices) - seen:
+                if not self.devices[device_id].in_flight:
+                    del self.devices[device_id]
+        self._refreshed = time.monotonic()
+
+    def tick(self) -> int:
+        """Dispatch every due ping; returns how many were started."""
+        if time.monotonic() - self._refreshed >= _REFRESH_EVERY:
+            self.refresh()
+        now = datetime.utcnow()
+        due = []
+        with self._lock:
+            for state in self.devices.values():
+                if not state.in_flight and state.due_at <= now:
+                    state.in_flight = True
+                    due.append(state)
+        for state in due:
+            self._pool.submit(self._ping, state)
+        return len(due)
+
+    def _ping(self, state: DeviceHeartbeat) -> None:
+        started = datetime.utcnow()
+        state.last_started_at = started
+        state.last_lag_seconds = max(0.0, (started - state.due_at).total_seconds())
+        state.max_lag_seconds = max(state.max_lag_seconds, state.last_lag_seconds)
+        clock = time.perf_counter()
+        db = SessionLocal()
+        try:
+            device = db.get(Device, state.device_id)
+            if device is None:
+                return
+            ping_and_record(device, db)
+            now = datetime.utcnow()
+            state.pings += 1
+            state.consecutive_failures = 0
+            state.last_ok_at = now
+            state.last_error = ""
+            state.due_at = _next_due(now, device.reporting_frequency)
+        except Exception as exc:
+            db.rollback()
+            state.failures += 1
+            state.consecutive_failures += 1
+            state.last_error = str(exc)
+            state.due_at = datetime.utcnow() + _RETRY_AFTER
+            logger.warning("Heartbeat failed for device %s: %s", state.device_id, exc)
+        finally:
+            state.last_duration_ms = (time.perf_counter() - clock) * 1000
+            state.in_flight = False
+            db.close()
+
+    def run(self) -> None:
+        renew_every = settings.heartbeat_lease_seconds / 3
+        renewed = 0.0
+        while True:
+            try:
+                if time.monotonic() - renewed >= renew_every:
+                    leader = acquire_lease(LEASE_NAME, settings.heartbeat_lease_seconds)
+                    renewed = time.monotonic()
+                    if leader != self.is_leader:
+                        logger.info("Heartbeat leadership %s (%s)", "acquired" if leader else "lost", WORKER_ID)
+                        self.is_leader = leader
+                        if leader:
+                            self.refresh()
+                        else:
+                            with self._lock:
+                                self.devices.clear()
+                if self.is_leader:
+                    self.tick()
+            except Exception:
+                logger.exception("Heartbeat scheduler pass failed")
+            time.sleep(settings.heartbeat_tick_seconds)
+
+
+_scheduler: HeartbeatScheduler | None = None
+_start_lock = threading.Lock()
+
+
+def start_heartbeat_scheduler() -> None:
+    """Start this process's heartbeat scheduler (idempotent).
+
+    Every worker runs one, but only the lease holder pings devices.
+    """
+    global _scheduler
+    with _start_lock:
+        if _scheduler is not None or not settings.heartbeat_enabled:
+            return
+        _scheduler = HeartbeatScheduler(settings.heartbeat_workers)
+    threading.Thread(target=_scheduler.run, daemon=True, name="device-heartbeat").start()
+
+
+def heartbeat_stats() -> dict:
+    """Leader and per-device heartbeat lag.
+
+    ``overdue_seconds`` comes from the database and is the same on every
+    worker; the dispatch metrics are only known to the leader process.
+    """
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        leader = lease_info(db, LEASE_NAME)
+        rows = (
+            db.query(Device.id, Device.device_id, Device.last_ping_at, Device.reporting_frequency)
+            .filter(Device.crt_data.isnot(None), Device.key_data.isnot(None))
+            .order_by(Device.id)
+            .all()
+        )
+    finally:
+        db.close()
+
+    local = _scheduler.devices if _scheduler is not None and _scheduler.is_leader else {}
+    devices = []
+    for device_id, fdms_id, last_ping_at, frequency in rows:
+        overdue = None
+        if last_ping_at is not None:
+            overdue = max(0.0, (now - last_ping_at.replace(tzinfo=None) - _period(frequency)).total_seconds())
+        entry = {
+            "device_id": device_id,
+            "fdms_device_id": fdms_id,
+            "reporting_frequency": frequency,
+            "last_ping_at": last_ping_at,
+            "overdue_seconds": overdue,
+        }
+        state = local.get(device_id)
+        if state is not None:
+            entry.update(
+                due_at=state.due_at,
+                in_flight=state.in_flight,
+                pings=state.pings,
+                failures=state.failures,
+                consecutive_failures=state.consecutive_failures,
+                last_lag_seconds=round(state.last_lag_seconds, 3),
+                max_lag_seconds=round(state.max_lag_seconds, 3),
+                last_duration_ms=round(state.last_duration_ms, 1),
+                last_error=state.last_error,
+            )
+        devices.append(entry)
+    return {
+        "worker": WORKER_ID,
+        "is_leader": bool(_scheduler and _scheduler.is_leader),
+        "lease": leader,
+        "devices": devices,
+    }
@@ -0,0 +1,86 @@
+"""Leader election through leases stored in the database.
+
+Every worker process may run background schedulers, but some of them (device
+heartbeats, automatic day close) must run in exactly one place across
+processes, containers and hosts.  A worker becomes leader by taking a named
+row in ``scheduler_leases`` and keeps the role by renewing it before
+``expires_at``; if it dies, the lease lapses and another worker takes over.
+"""
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from app.db.session import SessionLocal
+from app.models.scheduler_lease import SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process as a lease holder
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def acquire_lease(name: str, ttl_seconds: float, holder: str = WORKER_ID) -> bool:
+    """Take or renew lease ``name`` for ``ttl_seconds``; True if we hold it."""
+    now = datetime.utcnow()
+    expires = now + timedelta(seconds=ttl_seconds)
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(SchedulerLease)
+            .where(
+                SchedulerLease.name == name,
+                or_(SchedulerLease.holder == holder, SchedulerLease.expires_at < now),
+            )
+            .values(holder=holder, expires_at=expires, updated_at=now)
+        )
+        if result.rowcount:
+            db.commit()
+            return True
+        if db.get(SchedulerLease, name) is not None:
+            db.rollback()
+            return False
+        db.add(SchedulerLease(name=name, holder=holder, expires_at=expires))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker created it first
+            db.rollback()
+            return False
+        return True
+    except Exception:
+        db.rollback()
+        logger.exception("Could not acquire lease %s", name)
+        return False
+    finally:
+        db.close()
+
+
+def release_lease(name: str, holder: str = WORKER_ID) -> None:
+    """Give up lease ``name`` early if we hold it."""
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(SchedulerLease)
+            .where(SchedulerLease.name == name, SchedulerLease.holder == holder)
+            .values(expires_at=datetime.utcnow())
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def lease_info(db, name: str) -> dict | None:
+    lease = db.get(SchedulerLease, name)
+    if lease is None:
+        return None
+    return {
+        "name": lease.name,
+        "holder": lease.holder,
+        "expires_at": lease.expires_at,
+        "active": lease.expires_at is not None and lease.expires_at.replace(tzinfo=None) > datetime.utcnow(),
+    }
@@ -0,0 +1,135 @@
+"""Device liveness view for the receipt submission path.
+
+FDMS treats a device as online while it keeps pinging within its
+``reportingFrequency``.  The heartbeat scheduler does that pinging in the
+background; submissions only need to know whether the last ping is recent.
+This module answers from an in-process map of recent pings (fed by every ping
+this worker makes) and ``Device.last_ping_at`` (written by whichever worker
+pinged), without touching FDMS.  When a device looks stale it schedules a
+ping on a small background pool, at most one per device at a time, instead
+of pinging inline.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app.db.session import SessionLocal
+from app.models.device import Device
+
+logger = logging.getLogger(__name__)
+
+_last_ping: dict[int, datetime] = {}
+_in_flight: set[int] = set()
+_lock = threading.Lock()
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="liveness-ping")
+
+_stats = {
+    "checks": 0,
+    "fresh": 0,
+    # Submissions that would have paid for an inline ping before this view
+    "stale": 0,
+    "async_pings": 0,
+    "async_pings_coalesced": 0,
+    "async_ping_failures": 0,
+    "async_ping_ms_total": 0.0,
+}
+
+
+def _freshness(device: Device) -> timedelta:
+    # Same margin the inline check used: one minute inside the reporting period
+    return timedelta(minutes=max(1, (device.reporting_frequency or 5) - 1))
+
+
+def record_ping(device_id: int, when: datetime | None = None) -> None:
+    """Note a successful Ping (naive UTC)."""
+    when = when or datetime.utcnow()
+    with _lock:
+        if _last_ping.get(device_id) is None or _last_ping[device_id] < when:
+            _last_ping[device_id] = when
+
+
+def last_ping(device: Device) -> datetime | None:
+    with _lock:
+        seen = _last_ping.get(device.id)
+    stored = device.last_ping_at.replace(tzinfo=None) if device.last_ping_at else None
+    if seen is None or (stored is not None and stored > seen):
+        return stored
+    return seen
+
+
+def is_online(device: Device) -> bool:
+    seen = last_ping(device)
+    return seen is not None and datetime.utcnow() - seen < _freshness(device)
+
+
+def ensure_fresh(device: Device) -> bool:
+    """Non-blocking liveness check for the submission path.
+
+    Returns whether the device is currently considered online; if not, a
+    background ping is scheduled and the caller carries on.
+    """
+    online = is_online(device)
+    with _lock:
+        _stats["checks"] += 1
+        _stats["fresh" if online else "stale"] += 1
+    if not online:
+        request_ping(device.id)
+    return online
+
+
+def request_ping(device_id: int) -> bool:
+    """Schedule a background ping unless one is already running for the device."""
+    with _lock:
+        if device_id in _in_flight:
+            _stats["async_pings_coalesced"] += 1
+            return False
+        _in_flight.add(device_id)
+        _stats["async_pings"] += 1
+    _pool.submit(_ping, device_id)
+    return True
+
+
+def ping_and_record(device: Device, db) -> dict:
+    """Ping FDMS for ``device``, persist the result and feed the liveness view."""
+    from app.services.fdms import ping_device
+
+    result = ping_device(device, db)
+    now = datetime.utcnow()
+    device.last_ping_at = now
+    if result.get("reportingFrequency"):
+        device.reporting_frequency = int(result["reportingFrequency"])
+    db.commit()
+    record_ping(device.id, now)
+    return result
+
+
+def _ping(device_id: int) -> None:
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        device = db.get(Device, device_id)
+        if device is not None:
+            ping_and_record(device, db)
+    except Exception as exc:
+        db.rollback()
+        with _lock:
+            _stats["async_ping_failures"] += 1
+        logger.warning("Background ping failed for device %s: %s", device_id, exc)
+    finally:
+        db.close()
+        with _lock:
+            _in_flight.discard(device_id)
+            _stats["async_ping_ms_total"] += (time.perf_counter() - started) * 1000
+
+
+def liveness_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        tracked = len(_last_ping)
+        in_flight = len(_in_flight)
+    stats["async_ping_ms_total"] = round(stats["async_ping_ms_total"], 1)
+    stats["tracked_devices"] = tracked
+    stats["pings_in_flight"] = in_flight
+    return stats
@@ -0,0 +1,278 @@
+"""Versioned POS catalog for till sync.
+
+Tills used to page through ``GET /pos/products`` to refresh their product
+list: every call repeated the till checks, a stock subquery and the tax
+lookups, and shipped full image data URLs.  ``build_catalog`` instead
+returns a compact snapshot of a company's sellable products (price,
+effective VAT, barcode, category, stock for the till's warehouse) tagged
+with a catalog version, or only what changed since a version the till
+already holds.
+
+Versions come from a change log.  Session hooks append a ``CatalogChange``
+row whenever a product, tax setting, stock quant or category is written, in
+the same transaction, under a version taken from the company's ``catalog``
+sequence (see ``app.services.sequence``); the sequence row stays locked until commit,
+so versions become visible in order and a till at version ``v`` has seen
+every change up to ``v``.  After commit, callbacks registered with
+``on_catalog_change`` are told which companies changed (the scan index
+uses this to drop stale entries).
+
+Old changes are pruned after ``catalog_change_retention_days``; a till
+whose version predates the retained log gets a full snapshot again.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import case, delete, event, func, insert, or_, select
+from sqlalchemy.orm import Session, defer, lazyload
+
+from app.core.config import settings
+from app.models.catalog_change import CatalogChange
+from app.models.category import Category
+from app.models.document_sequence import DocumentSequence
+from app.models.product import Product
+from app.models.stock_quant import StockQuant
+from app.models.tax_setting import TaxSetting
+from app.services.assets import thumbnail_url
+from app.services.sequence import increment
+from app.services.tax_resolution import TaxTable
+
+logger = logging.getLogger(__name__)
+
+SEQUENCE_CODE = "catalog"
+_PENDING_KEY = "catalog_changed_companies"
+
+_listeners: list[Callable[[set[int]], None]] = []
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def on_catalog_change(callback: Callable[[set[int]], None]) -> Callable[[set[int]], None]:
+    """Register ``callback(company_ids)``, called after a commit that changed catalogs."""
+    _listeners.append(callback)
+    return callback
+
+
+def _change_key(obj) -> tuple | None:
+    """``(company_id, entity, entity_id, product_id)`` for a tracked object."""
+    if isinstance(obj, Product):
+        return obj.company_id, "product", obj.id, obj.id
+    if isinstance(obj, TaxSetting):
+        return obj.company_id, "tax", obj.id, None
+    if isinstance(obj, StockQuant):
+        return obj.company_id, "stock", obj.id, obj.product_id
+    if isinstance(obj, Category):
+        return obj.company_id, "category", obj.id, None
+    return None
+
+
+@event.listens_for(Session, "after_flush")
+def _record_changes(session: Session, flush_context) -> None:
+    keys = set()
+    for obj in session.new:
+        keys.add(_change_key(obj))
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            keys.add(_change_key(obj))
+    for obj in session.deleted:
+        keys.add(_change_key(obj))
+    keys.discard(None)
+    if not keys:
+        return
+
+    conn = session.connection()
+    versions = {
+        company_id: increment(conn, SEQUENCE_CODE, company_id)
+        for company_id in sorted({key[0] for key in keys})
+    }
+    conn.execute(
+        insert(CatalogChange),
+        [
+            {
+                "company_id": company_id,
+                "version": versions[company_id],
+                "entity": entity,
+                "entity_id": entity_id,
+                "product_id": product_id,
+            }
+            for company_id, entity, entity_id, product_id in keys
+        ],
+    )
+    session.info.setdefault(_PENDING_KEY, set()).update(versions)
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_changes(session: Session) -> None:
+    companies = session.info.pop(_PENDING_KEY, None)
+    if not companies:
+        return
+    for callback in _listeners:
+        try:
+            callback(companies)
+        except Exception:
+            logger.exception("Catalog change callback failed")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def catalog_version(db: Session, company_id: int) -> int:
+    """Current catalog version of a company (0 before its first change)."""
+    value = db.execute(
+        select(DocumentSequence.value).where(
+            DocumentSequence.company_id == company_id,
+            DocumentSequence.code == SEQUENCE_CODE,
+            DocumentSequence.period == "",
+        )
+    ).scalar()
+    return value or 0
+
+
+def prune_changes(db: Session) -> int:
+    """Drop changes older than the retention period (at most hourly per worker)."""
+    global _last_prune
+    with _prune_lock:
+        if time.monotonic() - _last_prune < 3600:
+            return 0
+        _last_prune = time.monotonic()
+    cutoff = datetime.utcnow() - timedelta(days=settings.catalog_change_retention_days)
+    deleted = db.execute(delete(CatalogChange).where(CatalogChange.created_at < cutoff)).rowcount
+    db.commit()
+    return deleted or 0
+
+
+def _delta_available(db: Session, company_id: int, since: int, version: int) -> bool:
+    """True if every change after ``since`` is still in the log."""
+    if since > version:
+        return False
+    if since == version:
+        return True
+    first = db.execute(
+        select(func.min(CatalogChange.version)).where(
+            CatalogChange.company_id == company_id,
+            CatalogChange.version > since,
+        )
+    ).scalar()
+    return first == since + 1
+
+
+def changed_products(db: Session, company_id: int, since: int, version: int) -> set[int] | None:
+    """Ids of products written between two versions, or None if the log no longer reaches ``since``."""
+    if not _delta_available(db, company_id, since, version):
+        return None
+    rows = db.execute(
+        select(CatalogChange.product_id).where(
+            CatalogChange.company_id == company_id,
+            CatalogChange.entity == "product",
+            CatalogChange.version > since,
+            CatalogChange.version <= version,
+        )
+    )
+    return {product_id for (product_id,) in rows}
+
+
+def _products_query(db: Session, company_id: int):
+    # Inline data URLs are not shipped to tills; asset URLs are
+    image_url = case((Product.image_url.like("data:%"), ""), else_=Product.image_url)
+    return (
+        db.query(Product, image_url)
+        .options(lazyload(Product.tax), defer(Product.image_url))
+        .filter(
+            Product.company_id == company_id,
+            Product.is_active == True,
+            Product.can_be_sold == True,
+            Product.show_in_pos == True,
+        )
+    )
+
+
+def _stock(db: Session, company_id: int, warehouse_id: int | None, product_ids: list[int] | None) -> dict[int, float]:
+    query = db.query(StockQuant.product_id, func.sum(StockQuant.available_quantity)).filter(
+        StockQuant.company_id == company_id
+    )
+    if warehouse_id is not None:
+        query = query.filter(StockQuant.warehouse_id == warehouse_id)
+    if product_ids is not None:
+        if not product_ids:
+            return {}
+        query = query.filter(StockQuant.product_id.in_(product_ids))
+    return {pid: qty or 0 for pid, qty in query.group_by(StockQuant.product_id)}
+
+
+def build_catalog(
+    db: Session,
+    company_id: int,
+    warehouse_id: int | None = None,
+    since: int | None = None,
+    version: int | None = None,
+) -> dict:
+    """Catalog snapshot of a company, or the changes after ``since`` if the log still has them.
+
+    ``removed`` lists products that changed but are no longer sellable in
+    POS (deleted, archived, hidden).
+    """
+    if version is None:
+        version = catalog_version(db, company_id)
+    full = not since or not _delta_available(db, company_id, since, version)
+
+    query = _products_query(db, company_id)
+    removed: list[int] = []
+    if full:
+        rows = query.order_by(Product.name).all()
+        product_ids = None
+    else:
+        changes = db.execute(
+            select(CatalogChange.entity, CatalogChange.entity_id, CatalogChange.product_id).where(
+                CatalogChange.company_id == company_id,
+                CatalogChange.version > since,
+                CatalogChange.version <= version,
+            )
+        ).all()
+        changed = {c.product_id for c in changes if c.product_id}
+        tax_ids = {c.entity_id for c in changes if c.entity == "tax"}
+        criteria = []
+        if changed:
+            criteria.append(Product.id.in_(changed))
+        if tax_ids:
+            criteria.append(Product.tax_id.in_(tax_ids))
+        rows = query.filter(or_(*criteria)).order_by(Product.name).all() if criteria else []
+        product_ids = [product.id for product, _ in rows]
+        removed = sorted(changed - set(product_ids))
+
+    products = [product for product, _ in rows]
+    stock = _stock(db, company_id, warehouse_id, product_ids)
+    tax_table = TaxTable.for_products(db, company_id, products)
+    categories = db.query(Category.id, Category.name).filter(Category.company_id == company_id).order_by(Category.name)
+
+    items = []
+    for product, image_url in rows:
+        tax = tax_table.tax(product.tax_id)
+        items.append({
+            "id": product.id,
+            "name": product.name,
+            "barcode": product.barcode,
+            "reference": product.reference,
+            "sale_price": product.sale_price,
+            "vat_rate": tax.rate if tax else (product.tax_rate or 0),
+            "tax_id": product.tax_id,
+            "uom": product.uom,
+            "category_id": product.category_id,
+            "image_url": thumbnail_url(image_url, "pos"),
+            "stock_on_hand": round(stock.get(product.id, 0), 2),
+            "track_inventory": product.track_inventory,
+            "product_type": product.product_type,
+        })
+    return {
+        "company_id": company_id,
+        "version": version,
+        "since": None if full else since,
+        "full": full,
+        "products": items,
+        "removed": removed,
+        "categories": [{"id": c.id, "name": c.name} for c in categories],
+    }
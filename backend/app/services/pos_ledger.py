@@ -0,0 +1,136 @@
+"""POS session ledger.
+
+Every sale and refund used to read-modify-write the running totals on its
+``POSSession`` row, so cashiers sharing a session queued on that row and,
+without a lock, could overwrite each other's update.  Sales and refunds now
+append ``POSSessionEntry`` rows instead, one per payment-method amount, and
+session totals are summed from them when read (one grouped query for any
+number of sessions, on the indexed ``session_id``).
+
+A session's own ``total_*`` columns are kept as the baseline recorded
+before the ledger existed; totals are that baseline plus the ledger, with
+the meaning the columns always had: ``total_cash`` is cash tendered on
+sales, ``total_card`` and ``total_mobile`` what sales took by those methods,
+and refunds only count in ``total_returns``.
+
+Change is recorded apart from the tender, as ``change`` entries (negative,
+cash handed back).  Only cash can be handed back from the drawer, so change
+beyond the cash tendered (a card or mobile overpayment) is taken off the
+method that overpaid instead.  Expected cash in the drawer is the opening
+float plus every cash and change entry, refunds included.
+"""
+from dataclasses import dataclass
+
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.models.pos_session import POSOrder, POSSession, POSSessionEntry
+
+METHODS = ("cash", "card", "mobile")
+CHANGE = "change"
+
+
+@dataclass(frozen=True)
+class SessionTotals:
+    total_sales: float = 0
+    total_returns: float = 0
+    total_cash: float = 0
+    total_card: float = 0
+    total_mobile: float = 0
+    transaction_count: int = 0
+    expected_cash: float = 0
+
+
+def record(db: Session, order: POSOrder, kind: str, amounts: dict[str, float]) -> None:
+    """Append the payment-method amounts of a sale or refund to its session's ledger."""
+    rows = [
+        {
+            "session_id": order.session_id,
+            "company_id": order.company_id,
+            "order_id": order.id,
+            "kind": kind,
+            "method": method,
+            "amount": round(amount, 2),
+        }
+        for method, amount in amounts.items()
+        if round(amount, 2)
+    ]
+    if not rows:
+        # Still counts as a transaction
+        rows = [{
+            "session_id": order.session_id, "company_id": order.company_id, "order_id": order.id,
+            "kind": kind, "method": "cash", "amount": 0,
+        }]
+    db.execute(insert(POSSessionEntry), rows)
+
+
+def _change_split(order: POSOrder) -> dict[str, float]:
+    """The order's change by the method it comes off: cash first, then the overpaying methods."""
+    left = max(order.change_amount or 0, 0)
+    split = {}
+    for method in METHODS:
+        split[method] = min(left, max(getattr(order, f"{method}_amount") or 0, 0))
+        left -= split[method]
+    return split
+
+
+def record_sale(db: Session, order: POSOrder) -> None:
+    change = _change_split(order)
+    record(db, order, "sale", {
+        "cash": order.cash_amount,
+        CHANGE: -change["cash"],
+        "card": order.card_amount - change["card"],
+        "mobile": order.mobile_amount - change["mobile"],
+    })
+
+
+def record_refund(db: Session, refund: POSOrder, original: POSOrder) -> None:
+    """Pay back each method what the original sale kept."""
+    change = _change_split(original)
+    record(db, refund, "refund", {
+        method: -(getattr(original, f"{method}_amount") - change[method]) for method in METHODS
+    })
+
+
+def session_totals(db: Session, sessions: list[POSSession]) -> dict[int, SessionTotals]:
+    """Totals of each session: its pre-ledger baseline plus its ledger entries."""
+    if not sessions:
+        return {}
+    entry = POSSessionEntry
+    sums = {
+        row.session_id: row
+        for row in db.execute(
+            select(
+                entry.session_id,
+                func.sum(case((entry.kind == "sale", entry.amount), else_=0)).label("sales"),
+                func.sum(case((entry.kind == "refund", entry.amount), else_=0)).label("refunds"),
+                *(
+                    func.sum(case(((entry.kind == "sale") & (entry.method == m), entry.amount), else_=0)).label(m)
+                    for m in METHODS
+                ),
+                func.sum(case((entry.method.in_(("cash", CHANGE)), entry.amount), else_=0)).label("drawer"),
+                func.count(func.distinct(entry.order_id)).label("transactions"),
+            )
+            .where(entry.session_id.in_([s.id for s in sessions]))
+            .group_by(entry.session_id)
+        )
+    }
+    totals = {}
+    for s in sessions:
+        row = sums.get(s.id)
+        totals[s.id] = SessionTotals(
+            total_sales=round((s.total_sales or 0) + (row.sales if row else 0), 2),
+            total_returns=round((s.total_returns or 0) - (row.refunds if row else 0), 2),
+            total_cash=round((s.total_cash or 0) + (row.cash if row else 0), 2),
+            total_card=round((s.total_card or 0) + (row.card if row else 0), 2),
+            total_mobile=round((s.total_mobile or 0) + (row.mobile if row else 0), 2),
+            transaction_count=(s.transaction_count or 0) + (row.transactions if row else 0),
+            # The baseline counted tendered cash and took returns off
+            # separately; the ledger's cash and change entries are the drawer
+            expected_cash=round(
+                (s.opening_balance or 0) + (s.total_cash or 0) - (s.total_returns or 0)
+                + (row.drawer if row else 0),
+                2,
+            ),
+        )
+    return totals
@@ -0,0 +1,118 @@
+"""In-process barcode index for POS scans.
+
+A scan used to go through ``GET /pos/products?search=``: an ``ILIKE``
+over name, barcode and reference plus the tax lookups, for what is an
+exact-match lookup.  ``scan`` answers from a per-company map of barcode
+and internal reference to the product's sale price and effective VAT, held
+in memory by each worker, so a scan does not touch the database.
+
+The map is built from the POS catalog (``build_catalog``) and remembers the
+catalog version it reflects.  Commits in this worker mark the company's map
+stale through ``on_catalog_change``; commits in other workers are noticed by
+comparing the catalog version, at most once per
+``pos_scan_recheck_seconds``.  A stale map is brought up to date with the
+catalog delta since its version, so a sale (which only moves stock) costs
+one small query on the next scan rather than a rebuild.
+"""
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.services.pos_catalog import build_catalog, catalog_version, on_catalog_change
+
+_FIELDS = (
+    "id", "name", "barcode", "reference", "sale_price", "vat_rate", "tax_id",
+    "uom", "category_id", "image_url", "track_inventory", "product_type",
+)
+
+
+class _CompanyIndex:
+    def __init__(self, company_id: int):
+        self.company_id = company_id
+        self.version = -1
+        self.checked_at = 0.0
+        self.stale = True
+        self.products: dict[int, dict] = {}
+        self.codes: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def _remove(self, product_id: int) -> None:
+        old = self.products.pop(product_id, None)
+        if old is None:
+            return
+        for code in (old["barcode"], old["reference"]):
+            if code and self.codes.get(code) == product_id:
+                del self.codes[code]
+
+    def _apply(self, catalog: dict) -> None:
+        categories = {c["id"]: c["name"] for c in catalog["categories"]}
+        if catalog["full"]:
+            self.products, self.codes = {}, {}
+        for product_id in catalog["removed"]:
+            self._remove(product_id)
+        for item in catalog["products"]:
+            self._remove(item["id"])
+            entry = {field: item[field] for field in _FIELDS}
+            entry["category_name"] = categories.get(item["category_id"], "")
+            self.products[item["id"]] = entry
+            # Barcodes win over references when both match different products
+            if entry["reference"]:
+                self.codes.setdefault(entry["reference"], item["id"])
+            if entry["barcode"]:
+                self.codes[entry["barcode"]] = item["id"]
+        self.version = catalog["version"]
+
+    def refresh(self, db: Session) -> None:
+        with self.lock:
+            now = time.monotonic()
+            if not self.stale and now - self.checked_at < settings.pos_scan_recheck_seconds:
+                return
+            # Cleared first so a commit notified while we read is not lost
+            self.stale = False
+            try:
+                version = catalog_version(db, self.company_id)
+                if version != self.version:
+                    since = self.version if self.version >= 0 else None
+                    self._apply(build_catalog(db, self.company_id, since=since, version=version))
+            except Exception:
+                self.stale = True
+                raise
+            self.checked_at = now
+
+    def lookup(self, code: str) -> dict | None:
+        product_id = self.codes.get(code)
+        return self.products.get(product_id) if product_id is not None else None
+
+
+_indexes: dict[int, _CompanyIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _index(company_id: int) -> _CompanyIndex:
+    index = _indexes.get(company_id)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(company_id, _CompanyIndex(company_id))
+    return index
+
+
+@on_catalog_change
+def _mark_stale(company_ids: set[int]) -> None:
+    for company_id in company_ids:
+        index = _indexes.get(company_id)
+        if index is not None:
+            index.stale = True
+
+
+def scan(db: Session, company_id: int, code: str) -> dict | None:
+    """Product sold under a barcode or internal reference, or None.
+
+    The session is only used when the index has to be built or refreshed.
+    """
+    index = _index(company_id)
+    if index.stale or time.monotonic() - index.checked_at >= settings.pos_scan_recheck_seconds:
+        index.refresh(db)
+    return index.lookup(code.strip())
+
@@ -0,0 +1,260 @@
+"""Ranked product search for the product list and the POS.
+
+Searching with ``ILIKE '%x%'`` over name, barcode and reference cannot use
+an index, so every keystroke scanned the products table.  ``search_products``
+returns a page of a product query's matches, best first, instead:
+
+* on PostgreSQL with ``pg_trgm`` GIN indexes on the three columns (see the
+  ``w9p0s1r2c3h4`` migration), matching substrings and word-similar names
+  (``term <% name``) and ranking by exact code, code or name prefix and
+  ``word_similarity``;
+* elsewhere (SQLite) against an n-gram index held in memory by each worker,
+  one per company.  Names are indexed as ``pg_trgm``-style trigrams, so a
+  query word matches a name word it starts, or one it resembles (half of
+  its trigrams, which tolerates a typo or two); barcodes and references
+  match exactly or by prefix.  The index is kept current the way the scan
+  index is (``app.services.pos_scan``): commits mark it stale, the catalog
+  version is re-read at most every ``product_search_recheck_seconds`` and
+  changed products are reloaded from the catalog change log.
+
+The caller's query carries its own filters (category, active, POS
+visibility).  On the in-memory path at most ``product_search_max_results``
+matches are ranked, the query is narrowed to them, and ordering and paging
+happen in Python: sorting a thousand ids in SQL through a ``CASE`` costs
+more than the search itself.
+"""
+import bisect
+import heapq
+import math
+from collections import Counter
+import re
+import threading
+import time
+
+from sqlalchemy import case, func, literal, or_
+from sqlalchemy.orm import Query, Session
+
+from app.core.config import settings
+from app.models.product import Product
+from app.services.pos_catalog import catalog_version, changed_products, on_catalog_change
+
+_WORD = re.compile(r"[^\W_]+")
+_SIMILARITY = 0.5
+
+
+def _words(text: str) -> list[str]:
+    return _WORD.findall(text.lower())
+
+
+def _word_grams(word: str, *, query: bool = False) -> set[str]:
+    # Indexed words are padded on both sides like pg_trgm; query words only
+    # in front, so a partly typed word matches the words it starts
+    padded = f"  {word}" if query else f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class _NgramIndex:
+    def __init__(self, company_id: int):
+        self.company_id = company_id
+        self.version = -1
+        self.checked_at = 0.0
+        self.stale = True
+        self.names: dict[int, str] = {}
+        self.grams: dict[str, set[int]] = {}
+        self.codes: list[tuple[str, int]] = []
+        self.doc_codes: dict[int, tuple[str, ...]] = {}
+        self.lock = threading.Lock()
+
+    # -- maintenance --------------------------------------------------
+
+    def _remove(self, product_id: int) -> None:
+        name = self.names.pop(product_id, None)
+        if name is not None:
+            for word in set(_words(name)):
+                for gram in _word_grams(word):
+                    docs = self.grams.get(gram)
+                    if docs is not None:
+                        docs.discard(product_id)
+        for code in self.doc_codes.pop(product_id, ()):
+            i = bisect.bisect_left(self.codes, (code, product_id))
+            if i < len(self.codes) and self.codes[i] == (code, product_id):
+                del self.codes[i]
+
+    def _add(self, product_id: int, name: str, barcode: str, reference: str, sort: bool = True) -> None:
+        self.names[product_id] = name
+        for word in set(_words(name)):
+            for gram in _word_grams(word):
+                self.grams.setdefault(gram, set()).add(product_id)
+        codes = tuple({c.strip().lower() for c in (barcode, reference) if c and c.strip()})
+        self.doc_codes[product_id] = codes
+        for code in codes:
+            if sort:
+                bisect.insort(self.codes, (code, product_id))
+            else:
+                self.codes.append((code, product_id))
+
+    def _load(self, db: Session, product_ids: set[int] | None) -> None:
+        query = db.query(Product.id, Product.name, Product.barcode, Product.reference).filter(
+            Product.company_id == self.company_id
+        )
+        if product_ids is None:
+            self.names, self.grams, self.codes, self.doc_codes = {}, {}, [], {}
+            for row in query.yield_per(5000):
+                self._add(row.id, row.name or "", row.barcode or "", row.reference or "", sort=False)
+            self.codes.sort()
+            return
+        for product_id in product_ids:
+            self._remove(product_id)
+        if product_ids:
+            for row in query.filter(Product.id.in_(product_ids)):
+                self._add(row.id, row.name or "", row.barcode or "", row.reference or "")
+
+    def refresh(self, db: Session) -> None:
+        with self.lock:
+            now = time.monotonic()
+            if not self.stale and now - self.checked_at < settings.product_search_recheck_seconds:
+                return
+            # Cleared first so a commit notified while we read is not lost
+            self.stale = False
+            try:
+                version = catalog_version(db, self.company_id)
+                if version != self.version:
+                    changed = None
+                    if self.version >= 0:
+                        changed = changed_products(db, self.company_id, self.version, version)
+                    self._load(db, changed)
+                    self.version = version
+            except Exception:
+                self.stale = True
+                raise
+            self.checked_at = now
+
+    # -- lookup --------------------------------------------------------
+
+    def _name_matches(self, words: list[str]) -> dict[int, float]:
+        """Products whose name matches every query word, with the mean share of trigrams matched."""
+        per_word = []
+        for word in words:
+            grams = sorted(_word_grams(word, query=True), key=lambda g: len(self.grams.get(g, ())))
+            need = math.ceil(_SIMILARITY * len(grams))
+            per_word.append((grams, need))
+        # Start from the most selective word; a product sharing ``need`` of a
+        # word's trigrams shares at least one of its ``len - need + 1`` rarest
+        per_word.sort(key=lambda w: sum(len(self.grams.get(g, ())) for g in w[0][: len(w[0]) - w[1] + 1]))
+
+        scores: dict[int, float] | None = None
+        for grams, need in per_word:
+            hits = Counter()
+            for gram in grams:
+                hits.update(self.grams.get(gram, ()))
+            if scores is None:
+                scores = {pid: count / len(grams) for pid, count in hits.items() if count >= need}
+            else:
+                scores = {
+                    pid: score + hits[pid] / len(grams)
+                    for pid, score in scores.items()
+                    if hits[pid] >= need
+                }
+            if not scores:
+                break
+        return {pid: score / len(words) for pid, score in (scores or {}).items()}
+
+    def search(self, text: str, limit: int) -> dict[int, float]:
+        # ``refresh`` mutates the sets and lists read here from other threads
+        with self.lock:
+            return self._search(text, limit)
+
+    def _search(self, text: str, limit: int) -> dict[int, float]:
+        term = text.strip().lower()
+        ranks: dict[int, float] = {}
+        i = bisect.bisect_left(self.codes, (term, -1))
+        while i < len(self.codes) and self.codes[i][0].startswith(term) and len(ranks) < limit:
+            code, product_id = self.codes[i]
+            ranks[product_id] = max(ranks.get(product_id, 0.0), 4.0 if code == term else 2.0)
+            i += 1
+
+        words = _words(term)
+        if words:
+            for product_id, score in self._name_matches(words).items():
+                if self.names[product_id].lower().startswith(term):
+                    score += 1.0
+                ranks[product_id] = max(ranks.get(product_id, 0.0), score)
+        if len(ranks) > limit:
+            ranks = dict(heapq.nlargest(limit, ranks.items(), key=lambda item: item[1]))
+        return ranks
+
+
+_indexes: dict[int, _NgramIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _index(company_id: int) -> _NgramIndex:
+    index = _indexes.get(company_id)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.setdefault(company_id, _NgramIndex(company_id))
+    return index
+
+
+@on_catalog_change
+def _mark_stale(company_ids: set[int]) -> None:
+    for company_id in company_ids:
+        index = _indexes.get(company_id)
+        if index is not None:
+            index.stale = True
+
+
+def rank_products(db: Session, company_id: int, text: str) -> dict[int, float]:
+    """Matching product ids of a company and their rank, from the in-memory index."""
+    index = _index(company_id)
+    if index.stale or time.monotonic() - index.checked_at >= settings.product_search_recheck_seconds:
+        index.refresh(db)
+    return index.search(text, settings.product_search_max_results)
+
+
+def _apply_trigram_search(query: Query, text: str) -> Query:
+    term = text.strip()
+    contains = f"%{_escape_like(term)}%"
+    prefix = f"{_escape_like(term)}%"
+    lowered = term.lower()
+    rank = (
+        case((or_(func.lower(Product.barcode) == lowered, func.lower(Product.reference) == lowered), 4.0), else_=0.0)
+        + case(
+            (or_(Product.barcode.ilike(prefix, escape="\\"), Product.reference.ilike(prefix, escape="\\")), 2.0),
+            else_=0.0,
+        )
+        + case((Product.name.ilike(prefix, escape="\\"), 1.0), else_=0.0)
+        + func.word_similarity(term, Product.name)
+    )
+    matches = or_(
+        Product.name.ilike(contains, escape="\\"),
+        Product.barcode.ilike(contains, escape="\\"),
+        Product.reference.ilike(contains, escape="\\"),
+        literal(term).op("<%")(Product.name),
+    )
+    return query.filter(matches).order_by(rank.desc())
+
+
+def search_products(
+    db: Session, query: Query, company_id: int, text: str, *, offset: int = 0, limit: int | None = None
+) -> list[Product]:
+    """A page of the products in ``query`` (one company's) matching ``text``, best first, ties by name."""
+    if db.get_bind().dialect.name == "postgresql":
+        query = _apply_trigram_search(query, text).order_by(Product.name).offset(offset)
+        return (query.limit(limit) if limit is not None else query).all()
+
+    ranks = rank_products(db, company_id, text)
+    if not ranks:
+        return []
+    rows = query.filter(Product.id.in_(ranks)).with_entities(Product.id, Product.name).all()
+    rows.sort(key=lambda row: (-ranks[row.id], (row.name or "").lower()))
+    ids = [row.id for row in rows]
+    page = ids[offset:offset + limit] if limit is not None else ids[offset:]
+    if not page:
+        return []
+    products = {p.id: p for p in query.filter(Product.id.in_(page))}
+    return [products[pid] for pid in page if pid in products]
@@ -0,0 +1,184 @@
+"""QR code images for fiscal verification URLs.
+
+Receipts and invoice views used to have every client encode the ZIMRA
+verification URL itself (or call a third-party QR service).  Images are now
+rendered here with ``segno`` (PNG or SVG) and kept in a content-addressed
+store: the key is a SHA-256 over format, scale and the encoded text, files
+live under ``qr_cache_dir`` (relative to the backend directory, not the
+working directory) and the hottest ones are also held in memory, so
+a burst of reprints at checkout never re-encodes a code.  The key doubles as
+a strong ETag.  Since a key always names the same bytes, the public
+``qr_url`` images can be cached by browsers and proxies indefinitely; the
+per-document routes are revalidated against the ETag.
+
+``qr_url`` gives a public URL for a verification URL.  The text travels in
+the URL itself with an HMAC (``secret_key``), so any worker can render a
+missing image while the endpoint cannot be used to encode arbitrary text.
+``warm`` renders a document's images in the background right after it is
+fiscalized.
+"""
+import base64
+import hashlib
+import hmac
+import io
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+_BORDER = 4
+_BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_MAX_SCALE = 20
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _mac(data: str) -> str:
+    digest = hmac.new(settings.secret_key.encode("utf-8"), f"qr:{data}".encode("utf-8"), hashlib.sha256).digest()
+    return _b64(digest[:16])
+
+
+def qr_token(data: str) -> str:
+    """URL-safe token carrying ``data`` and its HMAC."""
+    return f"{_b64(data.encode('utf-8'))}.{_mac(data)}"
+
+
+def decode_token(token: str) -> str | None:
+    """The text behind ``token``, or None if it was not issued by us."""
+    payload, _, mac = token.partition(".")
+    try:
+        data = _unb64(payload).decode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return data if hmac.compare_digest(mac, _mac(data)) else None
+
+
+def qr_url(data: str | None, fmt: str = "png") -> str:
+    """Public image URL for a verification URL ("" if there is none)."""
+    if not data:
+        return ""
+    return f"/api/qr/{qr_token(data)}.{fmt}"
+
+
+def image_key(data: str, fmt: str, scale: int) -> str:
+    return hashlib.sha256(f"{fmt}|{scale}|{_BORDER}|{data}".encode("utf-8")).hexdigest()
+
+
+def render(data: str, fmt: str, scale: int) -> bytes:
+    import segno
+
+    code = segno.make(data, error="m", micro=False)
+    out = io.BytesIO()
+    if fmt == "svg":
+        code.save(out, kind="svg", scale=scale, border=_BORDER, xmldecl=False)
+    else:
+        code.save(out, kind="png", scale=scale, border=_BORDER)
+    return out.getvalue()
+
+
+class QRImageStore:
+    """Content-addressed image store: memory LRU in front of files on disk."""
+
+    def __init__(self, directory: str, memory_items: int):
+        self.directory = directory
+        self.memory_items = memory_items
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.renders = 0
+
+    def _path(self, key: str, fmt: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.{fmt}")
+
+    def _remember(self, key: str, body: bytes) -> None:
+        with self._lock:
+            self._memory[key] = body
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, data: str, fmt: str, scale: int) -> tuple[str, bytes]:
+        """``(key, image)``, rendering and storing the image on first use."""
+        key = image_key(data, fmt, scale)
+        with self._lock:
+            body = self._memory.get(key)
+            if body is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return key, body
+
+        path = self._path(key, fmt)
+        try:
+            with open(path, "rb") as fh:
+                body = fh.read()
+            with self._lock:
+                self.disk_hits += 1
+        except FileNotFoundError:
+            body = render(data, fmt, scale)
+            with self._lock:
+                self.renders += 1
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write then rename so readers never see a partial file
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+                with os.fdopen(fd, "wb") as fh:
+                    fh.write(body)
+                os.replace(tmp, path)
+            except OSError as exc:
+                logger.warning("Could not store QR image %s: %s", path, exc)
+        self._remember(key, body)
+        return key, body
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "memory_items": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "renders": self.renders,
+            }
+
+
+# An absolute qr_cache_dir is kept as it is
+_store = QRImageStore(os.path.join(_BACKEND_ROOT, settings.qr_cache_dir), settings.qr_memory_cache_items)
+_warm_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="qr-warm")
+
+
+def get_image(data: str, fmt: str = "png", scale: int | None = None) -> tuple[str, bytes]:
+    if fmt not in CONTENT_TYPES:
+        raise ValueError("format must be 'png' or 'svg'")
+    scale = max(1, min(scale or settings.qr_default_scale, _MAX_SCALE))
+    return _store.get(data, fmt, scale)
+
+
+def _warm(data: str) -> None:
+    for fmt in CONTENT_TYPES:
+        try:
+            get_image(data, fmt)
+        except Exception:
+            logger.exception("Could not pre-render QR image")
+
+
+def warm(data: str | None) -> None:
+    """Render the default images for ``data`` in the background."""
+    if data:
+        _warm_pool.submit(_warm, data)
+
+
+def qr_stats() -> dict:
+    return _store.stats()
@@ -0,0 +1,267 @@
+"""Verification of the receipt hash chains stored on invoices.
+
+Each fiscalized invoice keeps the receipt that was signed (``zimra_payload``),
+its hash (``zimra_device_hash``) and signature.  ``verify_device_chain``
+walks a device's receipts in ``zimra_receipt_global_no`` order through a
+server-side cursor, holding only the previous receipt in memory, and checks
+that:
+
+* the hash recomputed from the stored receipt with ``build_receipt_concat``
+  (the canonicalization ``_sign_receipt`` signs) matches the stored hash,
+* the signature verifies against the device's signing key.  Only the
+  current key is stored, so a receipt dated before the current certificate
+  was issued that does not verify is reported as ``key_unavailable`` (signed
+  with an earlier key) rather than ``bad_signature``, and does not fail the
+  report,
+* global numbers run without gaps or duplicates (a duplicate is a fork),
+* receipt counters restart at 1 with each fiscal day and otherwise increase
+  by one, and every ``previousReceiptHash`` is the hash of the receipt
+  before it.
+
+Issues are counted in full but only the first ``max_issues`` are listed, so
+memory stays constant however long the chain is.  ``verify_chains`` runs
+several devices in parallel and yields one report per device.
+"""
+import base64
+import hashlib
+import json
+import logging
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Iterator
+
+from cryptography import x509
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.company_certificate import CompanyCertificate
+from app.models.device import Device
+from app.models.invoice import Invoice
+from app.services.fdms import build_receipt_concat, verify_signature
+from app.services.signing_keys import get_signing_key
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+# Findings that do not make a chain invalid
+_NOTICES = {"key_unavailable"}
+
+_COLUMNS = (
+    Invoice.id,
+    Invoice.reference,
+    Invoice.zimra_status,
+    Invoice.zimra_receipt_counter,
+    Invoice.zimra_receipt_global_no,
+    Invoice.zimra_device_hash,
+    Invoice.zimra_device_signature,
+    Invoice.zimra_payload,
+)
+
+
+class ChainReport:
+    """Accumulates the findings for one device."""
+
+    def __init__(self, device: Device, max_issues: int):
+        self.device_id = device.id
+        self.fdms_device_id = device.device_id
+        self.max_issues = max_issues
+        self.receipts = 0
+        self.first_global_no: int | None = None
+        self.last_global_no: int | None = None
+        self.signatures_checked = 0
+        self.counts: dict[str, int] = {}
+        self.issues: list[dict] = []
+
+    def issue(self, kind: str, row: Any, detail: str) -> None:
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        if len(self.issues) < self.max_issues:
+            self.issues.append({
+                "type": kind,
+                "invoice_id": row.id,
+                "reference": row.reference,
+                "receipt_global_no": row.zimra_receipt_global_no,
+                "receipt_counter": row.zimra_receipt_counter,
+                "detail": detail,
+            })
+
+    def as_dict(self, head_global_no: int | None, elapsed: float) -> dict:
+        return {
+            "device_id": self.device_id,
+            "fdms_device_id": self.fdms_device_id,
+            "ok": not set(self.counts) - _NOTICES,
+            "receipts": self.receipts,
+            "first_global_no": self.first_global_no,
+            "last_global_no": self.last_global_no,
+            "head_global_no": head_global_no,
+            "signatures_checked": self.signatures_checked,
+            "issue_counts": dict(self.counts),
+            "issues": self.issues,
+            "elapsed_seconds": round(elapsed, 3),
+        }
+
+
+def _receipt_hash(receipt: dict) -> str:
+    digest = hashlib.sha256(build_receipt_concat(receipt).encode("utf-8")).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+def _key_issued_at(device: Device, db: Session) -> str:
+    """UTC issue time of the certificate paired with the signing key, as a receiptDate string."""
+    crt_data = device.crt_data if device.key_data else (
+        db.query(CompanyCertificate.crt_data).filter(CompanyCertificate.company_id == device.company_id).scalar()
+    )
+    if not crt_data:
+        return ""
+    try:
+        cert = x509.load_pem_x509_certificate(crt_data)
+    except ValueError:
+        return ""
+    # ``not_valid_before_utc`` replaced the naive attribute in cryptography 42
+    issued: datetime = getattr(cert, "not_valid_before_utc", None) or cert.not_valid_before
+    return issued.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _check_row(report: ChainReport, row: Any, prev: Any, public_key: Any, key_issued_at: str = "") -> None:
+    """Check one receipt and its link to the receipt before it."""
+    try:
+        receipt = json.loads(row.zimra_payload)["receipt"]
+    except (TypeError, ValueError, KeyError):
+        report.issue("missing_payload", row, "Stored receipt payload is missing or not valid JSON")
+        return
+
+    if int(receipt.get("receiptGlobalNo", 0)) != row.zimra_receipt_global_no or int(
+        receipt.get("receiptCounter", 0)
+    ) != row.zimra_receipt_counter:
+        report.issue(
+            "payload_mismatch", row,
+            f"Payload has global no {receipt.get('receiptGlobalNo')} / counter {receipt.get('receiptCounter')}",
+        )
+
+    computed = _receipt_hash(receipt)
+    if computed != row.zimra_device_hash:
+        report.issue("hash_mismatch", row, f"Recomputed hash {computed} != stored {row.zimra_device_hash}")
+    if public_key is not None:
+        report.signatures_checked += 1
+        if not verify_signature(public_key, row.zimra_device_hash, row.zimra_device_signature):
+            receipt_date = str(receipt.get("receiptDate", ""))
+            if key_issued_at and receipt_date < key_issued_at:
+                report.issue(
+                    "key_unavailable", row,
+                    f"Signed on {receipt_date}, before the current certificate was issued ({key_issued_at})",
+                )
+            else:
+                report.issue("bad_signature", row, "Device signature does not verify against the stored hash")
+
+    previous_hash = receipt.get("previousReceiptHash") or ""
+    if prev is not None:
+        if row.zimra_receipt_global_no == prev.zimra_receipt_global_no:
+            report.issue("fork", row, f"Invoice {prev.id} has the same global number")
+            return
+        if row.zimra_receipt_global_no != prev.zimra_receipt_global_no + 1:
+            first, last = prev.zimra_receipt_global_no + 1, row.zimra_receipt_global_no - 1
+            report.issue(
+                "gap", row,
+                f"Global number {first} is missing" if first == last else f"Global numbers {first}..{last} are missing",
+            )
+    if row.zimra_receipt_counter == 1:
+        if previous_hash:
+            report.issue("broken_link", row, "First receipt of a fiscal day must not carry previousReceiptHash")
+    elif prev is not None and row.zimra_receipt_global_no == prev.zimra_receipt_global_no + 1:
+        if row.zimra_receipt_counter != prev.zimra_receipt_counter + 1:
+            report.issue(
+                "counter_gap", row,
+                f"Receipt counter {row.zimra_receipt_counter} follows {prev.zimra_receipt_counter}",
+            )
+        elif previous_hash != (prev.zimra_device_hash or ""):
+            report.issue("broken_link", row, f"previousReceiptHash does not match invoice {prev.id}")
+
+
+def verify_device_chain(
+    db: Session, device_id: int, verify_signatures: bool = True, max_issues: int = 100
+) -> dict:
+    """Verify the stored receipt chain of one device (see module docstring)."""
+    started = time.perf_counter()
+    device = db.get(Device, device_id)
+    if device is None:
+        raise ValueError("Device not found")
+    report = ChainReport(device, max_issues)
+    public_key = None
+    key_issued_at = ""
+    if verify_signatures:
+        signing_key = get_signing_key(device, db)
+        public_key = signing_key.public_key() if signing_key is not None else None
+        if public_key is None:
+            report.counts["no_signing_key"] = 1
+        else:
+            key_issued_at = _key_issued_at(device, db)
+    head_global_no = device.last_receipt_global_no
+
+    stmt = (
+        select(*_COLUMNS)
+        .where(
+            Invoice.device_id == device_id,
+            Invoice.zimra_receipt_global_no > 0,
+            Invoice.zimra_status.in_(("submitted", "offline")),
+        )
+        .order_by(Invoice.zimra_receipt_global_no, Invoice.id)
+        .execution_options(stream_results=True, yield_per=settings.receipt_audit_batch_size)
+    )
+    prev = None
+    for row in db.execute(stmt):
+        report.receipts += 1
+        if report.first_global_no is None:
+            report.first_global_no = row.zimra_receipt_global_no
+        report.last_global_no = row.zimra_receipt_global_no
+        _check_row(report, row, prev, public_key, key_issued_at)
+        prev = row
+
+    if prev is not None and head_global_no and prev.zimra_receipt_global_no != head_global_no:
+        report.issue(
+            "head_mismatch", prev,
+            f"Device head is global no {head_global_no}, last stored receipt is {prev.zimra_receipt_global_no}",
+        )
+    return report.as_dict(head_global_no, time.perf_counter() - started)
+
+
+def _verify_one(device_id: int, verify_signatures: bool, max_issues: int, out: queue.Queue) -> None:
+    db = SessionLocal()
+    try:
+        out.put(verify_device_chain(db, device_id, verify_signatures, max_issues))
+    except Exception as exc:
+        logger.exception("Receipt chain verification failed for device %s", device_id)
+        out.put({"device_id": device_id, "ok": False, "error": str(exc)})
+    finally:
+        db.close()
+        out.put(_DONE)
+
+
+def verify_chains(
+    device_ids: list[int], verify_signatures: bool = True, max_issues: int = 100, workers: int | None = None
+) -> Iterator[dict]:
+    """Verify several devices in parallel; yields each report as it finishes.
+
+    The last item is ``{"summary": {...}}``.
+    """
+    started = time.perf_counter()
+    out: queue.Queue = queue.Queue()
+    workers = max(1, min(workers or settings.receipt_audit_workers, len(device_ids) or 1))
+    totals = {"devices": len(device_ids), "ok": 0, "broken": 0, "receipts": 0}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="receipt-audit") as pool:
+        for device_id in device_ids:
+            pool.submit(_verify_one, device_id, verify_signatures, max_issues, out)
+        remaining = len(device_ids)
+        while remaining:
+            item = out.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            totals["ok" if item.get("ok") else "broken"] += 1
+            totals["receipts"] += item.get("receipts", 0)
+            yield item
+    totals["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    yield {"summary": totals}
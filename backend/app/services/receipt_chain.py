@@ -0,0 +1,107 @@
+"""Per-device receipt chain sequencer.
+
+Every fiscal receipt carries the device's next ``receiptCounter`` and
+``receiptGlobalNo`` plus the hash of the previous receipt, so two submissions
+for the same device must never read the chain head at the same time.  The
+sequencer hands out the next slot under a per-device lock that is held until
+the caller's transaction ends:
+
+* an in-process lock serialises threads of this worker, and
+* ``SELECT ... FOR UPDATE`` on the device row serialises other workers on
+  PostgreSQL (SQLite ignores the clause, it only runs single-process).
+
+Different devices never contend, so they fiscalize fully in parallel.  Locks
+are released by a session ``after_transaction_end`` hook on commit, rollback
+or close, so callers only need to finish their transaction as they already do.
+"""
+import threading
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.device import Device
+
+_INFO_KEY = "receipt_chain_locks"
+
+_locks: dict[int, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+@dataclass
+class ChainSlot:
+    """The chain position reserved for the next receipt of a device."""
+
+    device: Device
+    receipt_counter: int
+    receipt_global_no: int
+    previous_hash: str
+
+
+def _device_lock(device_id: int) -> threading.Lock:
+    with _locks_guard:
+        lock = _locks.get(device_id)
+        if lock is None:
+            lock = _locks[device_id] = threading.Lock()
+        return lock
+
+
+def lock_device_chain(db: Session, device_id: int) -> Device:
+    """Lock the receipt chain of a device for the rest of ``db``'s transaction.
+
+    Returns the device row re-read under the lock.  Re-entrant within one
+    session, so several receipts of a device can be sequenced in a single
+    transaction.
+    """
+    held: set[int] = db.info.setdefault(_INFO_KEY, set())
+    if device_id not in held:
+        lock = _device_lock(device_id)
+        if not lock.acquire(timeout=settings.receipt_chain_lock_timeout_seconds):
+            raise ValueError(f"Receipt chain of device {device_id} is busy, try again")
+        held.add(device_id)
+
+    # Push pending changes before the refresh overwrites them
+    db.flush()
+    device = (
+        db.query(Device)
+        .filter(Device.id == device_id)
+        .with_for_update()
+        .populate_existing()
+        .first()
+    )
+    if device is None:
+        raise ValueError("Device not found")
+    return device
+
+
+def reserve_next(db: Session, device_id: int) -> ChainSlot:
+    """Lock the device chain and return the slot for its next receipt."""
+    device = lock_device_chain(db, device_id)
+    counter = (device.last_receipt_counter or 0) + 1
+    return ChainSlot(
+        device=device,
+        receipt_counter=counter,
+        receipt_global_no=(device.last_receipt_global_no or 0) + 1,
+        previous_hash=(device.last_receipt_hash or "") if counter > 1 else "",
+    )
+
+
+def advance(slot: ChainSlot, receipt_hash: str, signature: str) -> None:
+    """Move the chain head to the receipt submitted for ``slot``."""
+    device = slot.device
+    device.last_receipt_counter = slot.receipt_counter
+    device.last_receipt_global_no = slot.receipt_global_no
+    device.last_receipt_hash = receipt_hash
+    device.last_receipt_signature = signature
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _release_chain_locks(session: Session, transaction) -> None:
+    if transaction.parent is not None:
+        return
+    held = session.info.pop(_INFO_KEY, None)
+    if not held:
+        return
+    for device_id in held:
+        _locks[device_id].release()
@@ -1,11 +1,143 @@
-﻿from datetime import datetime
+﻿"""Document reference sequences.
+
+References used to be derived by counting the day's rows with ``LIKE`` on
+every insert: a scan that grows with the day's volume, and two concurrent
+requests read the same count so one of them fails on the unique constraint.
+Numbers now come from one counter row per series in ``document_sequences``
+(see ``DocumentSequence``), incremented atomically with
+``UPDATE ... RETURNING`` (or an upsert when the series is new):
+
+* gapless (the default) - the counter is bumped inside the caller's
+  transaction.  The row stays locked until the document is committed, so
+  concurrent writers of the same series queue on it, and a rollback gives
+  the number back: no gaps and no duplicates.  Only suited to series of
+  one company (such as the POS catalog version): on a series shared by
+  all companies, one company's open transaction would hold up every other.
+* fast (``gapless=False``) - the number is taken and committed in a short
+  transaction of its own, so writers only wait on each other for that
+  commit.  A document that is rolled back afterwards leaves a gap.  SQLite
+  serializes writers anyway (and a second connection would wait on the
+  caller's own write lock), so there fast series use the caller's
+  transaction too.  Used for the daily reference series.
+
+A new series is seeded from the highest reference already stored, so it
+continues where the rows left off.
+"""
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import Connection, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
+from app.db.session import SessionLocal
+from app.models.document_sequence import DocumentSequence
 from app.models.quotation import Quotation
 
+_KEY_COLUMNS = ["company_id", "code", "period"]
 
-def next_quotation_reference(db: Session) -> str:
+
+def increment(
+    conn: Connection, code: str, company_id: int = 0, period: str = "", seed: Callable[[Connection], int] | None = None
+) -> int:
+    """Bump a series on ``conn`` and return the new value (the row stays locked until commit).
+
+    Core statements only, so it is also safe inside session flush hooks.
+    """
+    now = datetime.utcnow()
+    key = (
+        DocumentSequence.company_id == company_id,
+        DocumentSequence.code == code,
+        DocumentSequence.period == period,
+    )
+    value = conn.execute(
+        update(DocumentSequence)
+        .where(*key)
+        .values(value=DocumentSequence.value + 1, updated_at=now)
+        .returning(DocumentSequence.value)
+    ).scalar()
+    if value is not None:
+        return value
+
+    start = (seed(conn) if seed else 0) + 1
+    row = dict(company_id=company_id, code=code, period=period, value=start, created_at=now, updated_at=now)
+    dialect = conn.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        upsert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = (
+            upsert(DocumentSequence)
+            .values(**row)
+            .on_conflict_do_update(
+                index_elements=_KEY_COLUMNS,
+                set_={"value": DocumentSequence.value + 1, "updated_at": now},
+            )
+            .returning(DocumentSequence.value)
+        )
+        return conn.execute(stmt).scalar_one()
+
+    # Other backends: create the row in a savepoint; if another writer won, bump theirs
+    try:
+        with conn.begin_nested():
+            conn.execute(insert(DocumentSequence).values(**row))
+        return start
+    except IntegrityError:
+        return increment(conn, code, company_id, period)
+
+
+def next_value(
+    db: Session,
+    code: str,
+    *,
+    company_id: int = 0,
+    period: str = "",
+    gapless: bool = True,
+    seed: Callable[[Connection], int] | None = None,
+) -> int:
+    """Next number of a series; ``seed(conn)`` gives the last number used before the series existed."""
+    if gapless or db.get_bind().dialect.name == "sqlite":
+        return increment(db.connection(), code, company_id, period, seed)
+    own = SessionLocal()
+    try:
+        value = increment(own.connection(), code, company_id, period, seed)
+        own.commit()
+        return value
+    except Exception:
+        own.rollback()
+        raise
+    finally:
+        own.close()
+
+
+def next_daily_reference(
+    db: Session, column, prefix: str, *, company_id: int = 0, gapless: bool = True, width: int = 4
+) -> str:
+    """Next ``{prefix}-{YYYYMMDD}-{n}`` reference for the model attribute ``column``.
+
+    References are unique table-wide, so daily series are shared by all
+    companies unless the caller passes a company scope.  A shared series
+    should be taken with ``gapless=False``: a gapless one serializes the
+    writers of every company on its row.
+    """
     today = datetime.utcnow().strftime("%Y%m%d")
-    prefix = f"Q-{today}-"
-    count = db.query(Quotation).filter(Quotation.reference.like(f"{prefix}%")).count()
-    return f"{prefix}{count + 1:04d}"
\ No newline at end of file
+    full_prefix = f"{prefix}-{today}-"
+
+    def seed(conn: Connection) -> int:
+        last = conn.execute(
+            select(column)
+            .where(column.like(f"{full_prefix}%"))
+            .order_by(func.length(column).desc(), column.desc())
+            .limit(1)
+        ).scalar()
+        try:
+            return int(last[len(full_prefix):]) if last else 0
+        except ValueError:
+            return 0
+
+    code = f"{column.class_.__tablename__}:{prefix}"
+    number = next_value(db, code, company_id=company_id, period=today, gapless=gapless, seed=seed)
+    return f"{full_prefix}{number:0{width}d}"
+
+
+def next_quotation_reference(db: Session) -> str:
+    return next_daily_reference(db, Quotation.reference, "Q", gapless=False)
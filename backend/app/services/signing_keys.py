@@ -0,0 +1,134 @@
+"""Cache of parsed private keys used to sign receipts and CloseDay requests.
+
+Parsing a PEM key costs far more than the ECDSA/RSA signature itself, so the
+parsed key objects are kept in a bounded LRU keyed by the owner (device or
+company) plus a SHA-256 digest of the PEM bytes.  A changed key therefore
+never hits a stale entry, and the upload/registration routes drop entries
+explicitly so memory is released straight away.
+
+The company key is shared by every worker, but an upload only reaches the
+worker that handled it, so its PEM is cached against a fingerprint of the
+certificate row (id, ``updated_at``, key length) that is re-read, without
+the key bytes, on every use.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from cryptography.hazmat.primitives import serialization
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.models.company_certificate import CompanyCertificate
+from app.models.device import Device
+
+
+class SigningKeyCache:
+    """Thread-safe LRU of parsed private keys."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._keys: OrderedDict[tuple[str, str], Any] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, owner: str, pem: bytes) -> Any:
+        cache_key = (owner, hashlib.sha256(pem).hexdigest())
+        with self._lock:
+            key = self._keys.get(cache_key)
+            if key is not None:
+                self._keys.move_to_end(cache_key)
+                self.hits += 1
+                return key
+            self.misses += 1
+
+        key = serialization.load_pem_private_key(pem, password=None)
+        with self._lock:
+            # Only one entry per owner: a new digest replaces the old key
+            for stale in [k for k in self._keys if k[0] == owner]:
+                del self._keys[stale]
+            self._keys[cache_key] = key
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+        return key
+
+    def invalidate(self, owner: str) -> None:
+        with self._lock:
+            for stale in [k for k in self._keys if k[0] == owner]:
+                del self._keys[stale]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._keys),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_cache = SigningKeyCache(settings.signing_key_cache_size)
+
+# company_id -> (row fingerprint, key_pem) for devices that sign with the company key
+_company_pem: dict[int, tuple[tuple, bytes]] = {}
+
+
+def _device_owner(device_id: int) -> str:
+    return f"device:{device_id}"
+
+
+def _company_owner(company_id: int) -> str:
+    return f"company:{company_id}"
+
+
+def load_private_key(pem: bytes, owner: str = "adhoc") -> Any:
+    """Return the parsed private key for ``pem``, parsing it at most once."""
+    return _cache.get(owner, pem)
+
+
+def _company_key_pem(company_id: int, db) -> bytes | None:
+    row = (
+        db.query(CompanyCertificate.id, CompanyCertificate.updated_at, func.length(CompanyCertificate.key_data))
+        .filter(CompanyCertificate.company_id == company_id)
+        .first()
+    )
+    if row is None or not row[2]:
+        _company_pem.pop(company_id, None)
+        return None
+    fingerprint = tuple(row)
+    cached = _company_pem.get(company_id)
+    if cached and cached[0] == fingerprint:
+        return cached[1]
+    key_data = db.query(CompanyCertificate.key_data).filter(CompanyCertificate.id == row[0]).scalar()
+    if not key_data:
+        return None
+    _company_pem[company_id] = (fingerprint, key_data)
+    return key_data
+
+
+def get_signing_key(device: Device, db) -> Any | None:
+    """Return the parsed signing key of a device, falling back to the company key.
+
+    For the company key, one small query checks the certificate row has not
+    been replaced; the PEM itself is only re-read when it has.
+    """
+    if device.key_data:
+        return _cache.get(_device_owner(device.id), device.key_data)
+    pem = _company_key_pem(device.company_id, db)
+    if not pem:
+        return None
+    return _cache.get(_company_owner(device.company_id), pem)
+
+
+def invalidate_device_key(device_id: int) -> None:
+    _cache.invalidate(_device_owner(device_id))
+
+
+def invalidate_company_key(company_id: int) -> None:
+    _company_pem.pop(company_id, None)
+    _cache.invalidate(_company_owner(company_id))
+
+
+def signing_key_stats() -> dict[str, int]:
+    return _cache.stats()
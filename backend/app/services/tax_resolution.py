@@ -0,0 +1,74 @@
+"""Per-company tax resolution for a batch of products.
+
+Receipt building and POS line pricing both need, for every line, the
+product's tax setting (rate and ZIMRA tax ID) and its HS code.  ``TaxTable``
+loads the company's tax settings and all referenced products up front, in two
+queries, instead of two lookups per line.
+"""
+from dataclasses import dataclass
+from typing import Iterable
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session, lazyload
+
+from app.models.product import Product
+from app.models.tax_setting import TaxSetting
+
+
+@dataclass(frozen=True)
+class ResolvedTax:
+    tax_id: int | None
+    zimra_tax_id: int | None
+    rate: float | None
+    hs_code: str
+
+
+class TaxTable:
+    """Products and tax settings of one company, keyed by id."""
+
+    def __init__(self, products: dict[int, Product], taxes: dict[int, TaxSetting]):
+        self.products = products
+        self.taxes = taxes
+
+    @classmethod
+    def load(cls, db: Session, company_id: int | None, product_ids: Iterable[int | None]) -> "TaxTable":
+        ids = {pid for pid in product_ids if pid}
+        products = []
+        if ids:
+            products = db.query(Product).options(lazyload(Product.tax)).filter(Product.id.in_(ids)).all()
+        return cls.for_products(db, company_id, products)
+
+    @classmethod
+    def for_products(cls, db: Session, company_id: int | None, products: Iterable[Product]) -> "TaxTable":
+        """Table over products the caller has already loaded (one query)."""
+        by_id = {p.id: p for p in products}
+        # Company taxes, plus any a product points at outside the company
+        tax_ids = {p.tax_id for p in by_id.values() if p.tax_id}
+        criteria = []
+        if company_id is not None:
+            criteria.append(TaxSetting.company_id == company_id)
+        if tax_ids:
+            criteria.append(TaxSetting.id.in_(tax_ids))
+        taxes: dict[int, TaxSetting] = {}
+        if criteria:
+            taxes = {t.id: t for t in db.query(TaxSetting).filter(or_(*criteria)).all()}
+        return cls(by_id, taxes)
+
+    def product(self, product_id: int | None) -> Product | None:
+        return self.products.get(product_id) if product_id else None
+
+    def tax(self, tax_id: int | None) -> TaxSetting | None:
+        return self.taxes.get(tax_id) if tax_id else None
+
+    def resolve(self, product_id: int | None) -> ResolvedTax | None:
+        """Tax setting and HS code for a product, or None if it is unknown."""
+        product = self.product(product_id)
+        if product is None:
+            return None
+        tax = self.tax(product.tax_id)
+        return ResolvedTax(
+            tax_id=product.tax_id,
+            zimra_tax_id=tax.zimra_tax_id if tax else None,
+            rate=tax.rate if tax else None,
+            hs_code=getattr(product, "hs_code", "") or "",
+        )
@@ -0,0 +1 @@
+"""Local simulators of external services used for load and integration tests."""
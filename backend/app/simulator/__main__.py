@@ -0,0 +1,45 @@
+"""Run the FDMS simulator: ``python -m app.simulator --port 9000``.
+
+Point the backend at it with ``FDMS_API_URL=http://127.0.0.1:9000``.
+"""
+import argparse
+
+import uvicorn
+
+from app.simulator.fdms import FDMSSimulator, SimulatorConfig, create_app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local ZIMRA FDMS simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="base latency added to every call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="random extra latency (uniform)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls failing with HTTP 500")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="requests per second per device (0 = off)")
+    parser.add_argument("--reporting-frequency", type=int, default=5, help="minutes returned by Ping")
+    parser.add_argument("--no-verify-signatures", action="store_true", help="only check hashes, not signatures")
+    parser.add_argument("--ssl-certfile", default=None)
+    parser.add_argument("--ssl-keyfile", default=None)
+    args = parser.parse_args()
+
+    config = SimulatorConfig(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_per_second=args.rate_limit,
+        reporting_frequency=args.reporting_frequency,
+        verify_signatures=not args.no_verify_signatures,
+    )
+    uvicorn.run(
+        create_app(FDMSSimulator(config)),
+        host=args.host,
+        port=args.port,
+        ssl_certfile=args.ssl_certfile,
+        ssl_keyfile=args.ssl_keyfile,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,523 @@
+"""Local stand-in for the ZIMRA FDMS device API.
+
+Implements RegisterDevice, GetConfig, GetStatus, Ping, OpenDay, SubmitReceipt,
+SubmitFile/GetFileStatus (offline batches) and CloseDay with the payload shapes ``app.services.fdms`` sends and expects,
+so the backend can be pointed at it (``FDMS_API_URL``) for load tests and
+integration runs without touching the ZIMRA test environment.
+
+The simulator keeps per-device state in memory and checks what the real FDMS
+checks: receipt counters and global numbers run on without gaps, every
+receipt carries the hash of the previous one, device hashes match the
+canonical receipt/CloseDay strings, and signatures verify against the
+certificate issued at RegisterDevice (or preloaded through
+``POST /_simulator/devices/{deviceID}``).  CloseDay counters are compared with
+the counters the simulator accumulated itself.
+
+Latency, injected error rate, a per-device rate limit and a full outage
+(``unavailable``) are configurable at start-up and at runtime through
+``PUT /_simulator/config``.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app.services.fdms import (
+    _sign_digest,
+    _sort_fiscal_counters,
+    build_close_day_concat,
+    build_receipt_concat,
+    verify_signature,
+)
+
+_CERT_VALID_DAYS = 365
+
+
+@dataclass
+class SimulatorConfig:
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_per_second: float = 0.0
+    reporting_frequency: int = 5
+    verify_signatures: bool = True
+    # Answer every device call with 503, as if FDMS were down
+    unavailable: bool = False
+    qr_url: str = "https://fdmstest.zimra.co.zw"
+    taxpayer_name: str = "FDMS SIMULATOR"
+
+
+class FDMSError(Exception):
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+@dataclass
+class DeviceState:
+    device_id: int
+    public_key: Any = None
+    certificate: str = ""
+    fiscal_day_status: str = "FiscalDayClosed"
+    last_fiscal_day_no: int = 0
+    fiscal_day_opened: str = ""
+    last_receipt_counter: int = 0
+    last_receipt_global_no: int = 0
+    last_receipt_hash: str = ""
+    counters: dict[tuple, Decimal] = field(default_factory=dict)
+    receipts: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # Token bucket for the rate limit
+    tokens: float = 0.0
+    refilled_at: float = 0.0
+
+
+class FDMSSimulator:
+    """In-memory FDMS state plus the certificate authority used at registration."""
+
+    def __init__(self, config: SimulatorConfig | None = None):
+        self.config = config or SimulatorConfig()
+        self.devices: dict[int, DeviceState] = {}
+        self._lock = threading.Lock()
+        self._operation = 0
+        self.files: dict[str, dict] = {}
+        self.stats: dict[str, Any] = {"requests": {}, "injected_errors": 0, "rate_limited": 0, "rejected": {}}
+        self._ca_key = ec.generate_private_key(ec.SECP256R1())
+        self._ca_name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "FDMS Simulator CA")])
+
+    # ── bookkeeping ──────────────────────────────────────────────
+
+    def operation_id(self) -> str:
+        with self._lock:
+            self._operation += 1
+            return f"SIM{self._operation:010d}"
+
+    def device(self, device_id: int, create: bool = False) -> DeviceState:
+        with self._lock:
+            state = self.devices.get(device_id)
+            if state is None:
+                if not create:
+                    raise FDMSError(401, "DEV01", f"Device {device_id} is not registered")
+                state = self.devices[device_id] = DeviceState(device_id=device_id)
+            return state
+
+    def count(self, endpoint: str) -> None:
+        with self._lock:
+            self.stats["requests"][endpoint] = self.stats["requests"].get(endpoint, 0) + 1
+
+    def reject(self, code: str, message: str, status: int = 422) -> FDMSError:
+        with self._lock:
+            self.stats["rejected"][code] = self.stats["rejected"].get(code, 0) + 1
+        return FDMSError(status, code, message)
+
+    def take_token(self, state: DeviceState) -> bool:
+        rate = self.config.rate_limit_per_second
+        if rate <= 0:
+            return True
+        now = time.monotonic()
+        with state.lock:
+            if not state.refilled_at:
+                state.tokens = rate
+            else:
+                state.tokens = min(rate, state.tokens + (now - state.refilled_at) * rate)
+            state.refilled_at = now
+            if state.tokens < 1:
+                return False
+            state.tokens -= 1
+            return True
+
+    def sign(self, concat: str) -> dict:
+        digest = hashlib.sha256(concat.encode("utf-8")).digest()
+        return {
+            "hash": base64.b64encode(digest).decode("ascii"),
+            "signature": base64.b64encode(_sign_digest(self._ca_key, digest)).decode("ascii"),
+        }
+
+    def check_signature(self, state: DeviceState, concat: str, signature: dict, code: str) -> None:
+        expected = base64.b64encode(hashlib.sha256(concat.encode("utf-8")).digest()).decode("ascii")
+        if signature.get("hash") != expected:
+            raise self.reject(code, "Device hash does not match the canonical data")
+        if not self.config.verify_signatures:
+            return
+        if state.public_key is None:
+            raise self.reject("DEV02", "No certificate known for device", status=401)
+        if not verify_signature(state.public_key, signature.get("hash", ""), signature.get("signature", "")):
+            raise self.reject(code, "Device signature is invalid")
+
+    # ── operations ───────────────────────────────────────────────
+
+    def register(self, device_id: int, payload: dict) -> dict:
+        if not (payload.get("activationKey") or "").strip():
+            raise self.reject("DEV03", "Activation key is required")
+        try:
+            csr = x509.load_pem_x509_csr(payload.get("certificateRequest", "").encode("utf-8"))
+        except ValueError:
+            raise self.reject("DEV04", "Certificate request is not a valid PEM CSR")
+        now = datetime.now(timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(csr.subject)
+            .issuer_name(self._ca_name)
+            .public_key(csr.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - timedelta(minutes=5))
+            .not_valid_after(now + timedelta(days=_CERT_VALID_DAYS))
+            .sign(self._ca_key, hashes.SHA256())
+        )
+        state = self.device(device_id, create=True)
+        state.public_key = csr.public_key()
+        state.certificate = cert.public_bytes(serialization.Encoding.PEM).decode("utf-8")
+        return {"operationID": self.operation_id(), "certificate": state.certificate}
+
+    def preload(self, device_id: int, certificate_pem: str) -> dict:
+        cert = x509.load_pem_x509_certificate(certificate_pem.encode("utf-8"))
+        state = self.device(device_id, create=True)
+        state.public_key = cert.public_key()
+        state.certificate = certificate_pem
+        return {"deviceID": device_id}
+
+    def get_config(self, state: DeviceState) -> dict:
+        valid_till = datetime.now(timezone.utc) + timedelta(days=_CERT_VALID_DAYS)
+        return {
+            "operationID": self.operation_id(),
+            "taxPayerName": self.config.taxpayer_name,
+            "taxPayerTIN": "0000000000",
+            "vatNumber": "000000000",
+            "deviceSerialNo": f"SIM-{state.device_id}",
+            "deviceBranchName": "Simulator",
+            "deviceOperatingMode": "Online",
+            "taxPayerDayMaxHrs": 24,
+            "taxpayerDayEndNotificationHrs": 2,
+            "applicableTaxes": [
+                {"taxID": 1, "taxPercent": 15.0, "taxName": "Standard rated 15%", "taxValidFrom": "2023-01-01"},
+                {"taxID": 2, "taxPercent": 0.0, "taxName": "Zero rated 0%", "taxValidFrom": "2023-01-01"},
+                {"taxID": 3, "taxName": "Exempt", "taxValidFrom": "2023-01-01"},
+            ],
+            "certificateValidTill": valid_till.strftime("%Y-%m-%dT%H:%M:%S"),
+            "qrUrl": self.config.qr_url,
+        }
+
+    def counters_list(self, state: DeviceState) -> list[dict]:
+        result = []
+        for (counter_type, currency, tax_id, percent, money_type), value in state.counters.items():
+            counter = {
+                "fiscalCounterType": counter_type,
+                "fiscalCounterCurrency": currency,
+                "fiscalCounterValue": float(value),
+            }
+            if counter_type == "BalanceByMoneyType":
+                counter["fiscalCounterMoneyType"] = money_type
+            else:
+                counter["fiscalCounterTaxID"] = tax_id
+                if percent is not None:
+                    counter["fiscalCounterTaxPercent"] = percent
+            result.append(counter)
+        return result
+
+    def get_status(self, state: DeviceState) -> dict:
+        with state.lock:
+            return {
+                "operationID": self.operation_id(),
+                "fiscalDayStatus": state.fiscal_day_status,
+                "lastFiscalDayNo": state.last_fiscal_day_no,
+                "lastReceiptCounter": state.last_receipt_counter,
+                "lastReceiptGlobalNo": state.last_receipt_global_no,
+                "lastReceiptHash": state.last_receipt_hash,
+                "fiscalDayCounter": self.counters_list(state),
+            }
+
+    def ping(self, state: DeviceState) -> dict:
+        return {"operationID": self.operation_id(), "reportingFrequency": self.config.reporting_frequency}
+
+    def open_day(self, state: DeviceState, payload: dict) -> dict:
+        with state.lock:
+            if state.fiscal_day_status == "FiscalDayOpened":
+                raise self.reject("FISC01", "Fiscal day is already open")
+            day_no = int(payload.get("fiscalDayNo", 0))
+            if day_no != state.last_fiscal_day_no + 1:
+                raise self.reject("FISC02", f"fiscalDayNo must be {state.last_fiscal_day_no + 1}")
+            state.fiscal_day_status = "FiscalDayOpened"
+            state.fiscal_day_opened = payload.get("fiscalDayOpened", "")
+            state.last_receipt_counter = 0
+            state.last_receipt_hash = ""
+            state.counters = {}
+        return {"operationID": self.operation_id(), "fiscalDayNo": day_no}
+
+    def _accumulate(self, state: DeviceState, receipt: dict) -> None:
+        receipt_type = receipt.get("receiptType", "FiscalInvoice")
+        prefix = {"CreditNote": "CreditNote", "DebitNote": "DebitNote"}.get(receipt_type, "Sale")
+        sign = Decimal("-1") if receipt_type == "CreditNote" else Decimal("1")
+        currency = str(receipt.get("receiptCurrency", "")).upper()
+        for tax in receipt.get("receiptTaxes", []):
+            tax_id = int(tax.get("taxID", 0))
+            percent = tax.get("taxPercent")
+            for counter_type, amount in (
+                (f"{prefix}ByTax", tax.get("salesAmountWithTax", 0)),
+                (f"{prefix}TaxByTax", tax.get("taxAmount", 0)),
+            ):
+                key = (counter_type, currency, tax_id, percent, None)
+                state.counters[key] = state.counters.get(key, Decimal("0")) + sign * Decimal(str(amount))
+        for payment in receipt.get("receiptPayments", []):
+            key = ("BalanceByMoneyType", currency, None, None, str(payment.get("moneyTypeCode", "")))
+            state.counters[key] = state.counters.get(key, Decimal("0")) + sign * Decimal(str(payment.get("paymentAmount", 0)))
+
+    def _accept_receipt(self, state: DeviceState, receipt: dict) -> dict:
+        """Validate a receipt against the device chain and record it (caller holds state.lock)."""
+        if state.fiscal_day_status != "FiscalDayOpened":
+            raise self.reject("RCPT01", "Fiscal day is not open")
+        counter = int(receipt.get("receiptCounter", 0))
+        global_no = int(receipt.get("receiptGlobalNo", 0))
+        if counter != state.last_receipt_counter + 1:
+            raise self.reject("RCPT011", f"receiptCounter {counter} does not follow {state.last_receipt_counter}")
+        if global_no != state.last_receipt_global_no + 1:
+            raise self.reject("RCPT012", f"receiptGlobalNo {global_no} does not follow {state.last_receipt_global_no}")
+        previous = receipt.get("previousReceiptHash") or ""
+        if counter > 1 and previous != state.last_receipt_hash:
+            raise self.reject("RCPT013", "previousReceiptHash does not match the last receipt")
+        signature = receipt.get("receiptDeviceSignature") or {}
+        self.check_signature(state, build_receipt_concat(receipt), signature, "RCPT020")
+
+        state.last_receipt_counter = counter
+        state.last_receipt_global_no = global_no
+        state.last_receipt_hash = signature["hash"]
+        state.receipts += 1
+        self._accumulate(state, receipt)
+
+        server_date = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        return {
+            "receiptID": global_no,
+            "serverDate": server_date,
+            "receiptServerSignature": self.sign(f"{signature['hash']}{server_date}"),
+        }
+
+    def submit_receipt(self, state: DeviceState, payload: dict) -> dict:
+        with state.lock:
+            result = self._accept_receipt(state, payload.get("receipt") or {})
+        return {"operationID": self.operation_id(), **result}
+
+    def submit_file(self, state: DeviceState, payload: dict) -> dict:
+        """Process an offline file synchronously; results are read with GetFileStatus."""
+        try:
+            content = json.loads(base64.b64decode(payload.get("file", "")))
+        except ValueError:
+            raise self.reject("FILE01", "File is not base64-encoded JSON")
+        receipts = (content.get("content") or {}).get("receipts") or []
+        results = []
+        with state.lock:
+            for receipt in receipts:
+                entry = {
+                    "receiptCounter": receipt.get("receiptCounter"),
+                    "receiptGlobalNo": receipt.get("receiptGlobalNo"),
+                }
+                try:
+                    entry.update(self._accept_receipt(state, receipt))
+                    entry["validationErrors"] = []
+                except FDMSError as exc:
+                    entry["validationErrors"] = [{"validationErrorCode": exc.code, "message": exc.message}]
+                results.append(entry)
+        operation_id = self.operation_id()
+        failed = any(r["validationErrors"] for r in results)
+        with self._lock:
+            self.files[operation_id] = {
+                "operationID": operation_id,
+                "fileProcessingStatus": "FileProcessingError" if failed else "FileProcessingIsSuccessful",
+                "receipts": results,
+            }
+        return {"operationID": operation_id}
+
+    def get_file_status(self, state: DeviceState, operation_id: str) -> dict:
+        with self._lock:
+            status = self.files.get(operation_id)
+        if status is None:
+            raise self.reject("FILE02", f"Unknown operationID {operation_id}", status=404)
+        return status
+
+    def close_day(self, state: DeviceState, payload: dict) -> dict:
+        with state.lock:
+            if state.fiscal_day_status != "FiscalDayOpened":
+                raise self.reject("FISC03", "Fiscal day is not open")
+            day_no = int(payload.get("fiscalDayNo", 0))
+            if day_no != state.last_fiscal_day_no + 1:
+                raise self.reject("FISC04", f"fiscalDayNo must be {state.last_fiscal_day_no + 1}")
+            if int(payload.get("receiptCounter", -1)) != state.last_receipt_counter:
+                raise self.reject("FISC05", f"receiptCounter must be {state.last_receipt_counter}")
+
+            submitted = _sort_fiscal_counters(payload.get("fiscalDayCounters") or [])
+            expected = _sort_fiscal_counters(self.counters_list(state))
+            device_id = str(state.device_id)
+            if build_close_day_concat(device_id, day_no, "", submitted) != build_close_day_concat(
+                device_id, day_no, "", expected
+            ):
+                raise self.reject("FISC06", "Fiscal day counters do not match the submitted receipts")
+
+            # fiscalDayDate is the local date the day was opened; accept the
+            # signer's choice as long as the hash covers the same counters.
+            signature = payload.get("fiscalDayDeviceSignature") or {}
+            fiscal_day_date = self._match_day_date(state, day_no, submitted, signature)
+            self.check_signature(
+                state, build_close_day_concat(device_id, day_no, fiscal_day_date, submitted), signature, "FISC07"
+            )
+            state.fiscal_day_status = "FiscalDayClosed"
+            state.last_fiscal_day_no = day_no
+        return {"operationID": self.operation_id()}
+
+    @staticmethod
+    def _match_day_date(state: DeviceState, day_no: int, counters: list[dict], signature: dict) -> str:
+        opened = state.fiscal_day_opened[:10]
+        candidates = [opened]
+        try:
+            opened_dt = datetime.strptime(opened, "%Y-%m-%d")
+            candidates += [(opened_dt + timedelta(days=d)).strftime("%Y-%m-%d") for d in (1, -1)]
+        except ValueError:
+            pass
+        for candidate in candidates:
+            concat = build_close_day_concat(str(state.device_id), day_no, candidate, counters)
+            digest = base64.b64encode(hashlib.sha256(concat.encode("utf-8")).digest()).decode("ascii")
+            if digest == signature.get("hash"):
+                return candidate
+        return opened
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            devices = {
+                str(s.device_id): {
+                    "fiscalDayStatus": s.fiscal_day_status,
+                    "lastFiscalDayNo": s.last_fiscal_day_no,
+                    "lastReceiptCounter": s.last_receipt_counter,
+                    "lastReceiptGlobalNo": s.last_receipt_global_no,
+                    "receipts": s.receipts,
+                }
+                for s in self.devices.values()
+            }
+            return {"config": asdict(self.config), "stats": self.stats, "devices": devices}
+
+
+def create_app(simulator: FDMSSimulator | None = None) -> FastAPI:
+    sim = simulator or FDMSSimulator()
+    app = FastAPI(title="FDMS Simulator")
+    app.state.simulator = sim
+
+    async def handle(endpoint: str, device_id: int, fn, *args, create: bool = False) -> JSONResponse:
+        sim.count(endpoint)
+        config = sim.config
+        delay = config.latency_ms + random.uniform(0, config.latency_jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        try:
+            if config.unavailable:
+                raise FDMSError(503, "SIM503", "FDMS unavailable")
+            state = sim.device(device_id, create=create) if not create else None
+            if state is not None and not sim.take_token(state):
+                sim.stats["rate_limited"] += 1
+                raise FDMSError(429, "RATE01", "Too many requests")
+            if config.error_rate and random.random() < config.error_rate:
+                sim.stats["injected_errors"] += 1
+                raise FDMSError(500, "SIM500", "Injected failure")
+            result = fn(state, *args) if state is not None else fn(*args)
+        except FDMSError as exc:
+            return JSONResponse(
+                status_code=exc.status,
+                content={"errorCode": exc.code, "message": exc.message, "status": exc.status},
+            )
+        return JSONResponse(result)
+
+    @app.post("/Public/v1/{device_id}/RegisterDevice")
+    async def register_device(device_id: int, request: Request):
+        payload = await request.json()
+        return await handle("RegisterDevice", device_id, sim.register, device_id, payload, create=True)
+
+    @app.get("/Device/v1/{device_id}/GetConfig")
+    async def get_config(device_id: int):
+        return await handle("GetConfig", device_id, sim.get_config)
+
+    @app.get("/Device/v1/{device_id}/GetStatus")
+    async def get_status(device_id: int):
+        return await handle("GetStatus", device_id, sim.get_status)
+
+    @app.post("/Device/v1/{device_id}/Ping")
+    async def ping(device_id: int):
+        return await handle("Ping", device_id, sim.ping)
+
+    @app.post("/Device/v1/{device_id}/OpenDay")
+    async def open_day(device_id: int, request: Request):
+        return await handle("OpenDay", device_id, sim.open_day, await request.json())
+
+    @app.post("/Device/v1/{device_id}/SubmitReceipt")
+    async def submit_receipt(device_id: int, request: Request):
+        return await handle("SubmitReceipt", device_id, sim.submit_receipt, await request.json())
+
+    @app.post("/Device/v1/{device_id}/SubmitFile")
+    async def submit_file(device_id: int, request: Request):
+        return await handle("SubmitFile", device_id, sim.submit_file, await request.json())
+
+    @app.get("/Device/v1/{device_id}/GetFileStatus")
+    async def get_file_status(device_id: int, operationID: str):
+        return await handle("GetFileStatus", device_id, sim.get_file_status, operationID)
+
+    @app.post("/Device/v1/{device_id}/CloseDay")
+    async def close_day(device_id: int, request: Request):
+        return await handle("CloseDay", device_id, sim.close_day, await request.json())
+
+    @app.get("/_simulator/state")
+    def simulator_state():
+        return sim.snapshot()
+
+    @app.put("/_simulator/config")
+    async def update_config(request: Request):
+        for key, value in (await request.json()).items():
+            if not hasattr(sim.config, key):
+                continue
+            current = getattr(sim.config, key)
+            if isinstance(current, bool) and not isinstance(value, bool):
+                value = str(value).lower() in ("1", "true", "yes")
+            setattr(sim.config, key, type(current)(value))
+        return asdict(sim.config)
+
+    @app.post("/_simulator/devices/{device_id}")
+    async def preload_device(device_id: int, request: Request):
+        payload = await request.json()
+        return sim.preload(device_id, payload.get("certificate", ""))
+
+    return app
+
+
+def run_in_thread(config: SimulatorConfig | None = None, port: int = 0) -> tuple[str, FDMSSimulator, Any]:
+    """Serve a simulator from a background thread.
+
+    Returns ``(base_url, simulator, stop)``; call ``stop()`` to shut it down.
+    """
+    import socket
+
+    import uvicorn
+
+    sim = FDMSSimulator(config)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", port))
+    server = uvicorn.Server(uvicorn.Config(create_app(sim), log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop() -> None:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+    return f"http://127.0.0.1:{sock.getsockname()[1]}", sim, stop
@@ -0,0 +1,408 @@
+"""Fiscalization throughput benchmark.
+
+Drives invoice fiscalization (``submit_invoice`` + commit, as the invoice
+routes do) and POS-order fiscalization (outbox entries drained by
+``drain_once``, as the POS workers do) against the local FDMS simulator, over
+a matrix of device counts, receipt line counts and concurrency levels.
+
+Every receipt is timed end to end and split into stages:
+
+    chain_lock     waiting for and taking the device's receipt-chain lock
+    db             SQL statement execution (outside commit)
+    build_receipt  _build_receipt, excluding its SQL
+    sign           _sign_receipt
+    http           FDMS round trip (_call_fdms)
+    commit         session commit (flush + COMMIT)
+    other          everything else (ORM, locking, QR, bookkeeping)
+
+    python bench_fiscalization.py --devices 1 4 --lines 1 10 --concurrency 1 8 \\
+        --receipts 200 --latency-ms 20 --output results.json
+    python bench_fiscalization.py ... --compare baseline.json
+
+Uses a throwaway SQLite database unless DATABASE_URL is set; results are
+written as JSON so runs can be compared between releases.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+_tmp_db = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp_db}")
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("FISCAL_OUTBOX_WORKERS", "0")
+
+STAGES = ("chain_lock", "db", "build_receipt", "sign", "http", "commit", "other")
+
+
+class StageTimer:
+    """Per-thread exclusive stage timing (a nested stage is not counted twice)."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def reset(self) -> None:
+        self._local.totals = dict.fromkeys(STAGES, 0.0)
+        self._local.stack = []
+
+    def totals(self) -> dict[str, float]:
+        return dict(self._local.totals)
+
+    def current(self) -> str | None:
+        stack = getattr(self._local, "stack", None)
+        return stack[-1][0] if stack else None
+
+    def push(self, name: str) -> None:
+        if not hasattr(self._local, "stack"):
+            self.reset()
+        self._local.stack.append([name, time.perf_counter(), 0.0])
+
+    def pop(self) -> None:
+        name, started, children = self._local.stack.pop()
+        elapsed = time.perf_counter() - started
+        self._local.totals[name] += elapsed - children
+        if self._local.stack:
+            self._local.stack[-1][2] += elapsed
+
+    def wrap(self, name: str, fn):
+        def timed(*args, **kwargs):
+            self.push(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.pop()
+        return timed
+
+
+timer = StageTimer()
+
+
+def _instrument(engine) -> None:
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    import app.services.fdms as fdms
+
+    fdms.reserve_next = timer.wrap("chain_lock", fdms.reserve_next)
+    fdms._build_receipt = timer.wrap("build_receipt", fdms._build_receipt)
+    fdms._sign_receipt = timer.wrap("sign", fdms._sign_receipt)
+    fdms._call_fdms = timer.wrap("http", fdms._call_fdms)
+    Session.commit = timer.wrap("commit", Session.commit)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if timer.current() not in (None, "commit"):
+            timer.push("db")
+            conn.info["bench_db_timed"] = True
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        if conn.info.pop("bench_db_timed", False):
+            timer.pop()
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def _summary_ms(values: list[float]) -> dict[str, float]:
+    ms = [v * 1000 for v in values]
+    return {
+        "mean": round(statistics.fmean(ms), 3) if ms else 0.0,
+        "p50": round(_percentile(ms, 50), 3),
+        "p95": round(_percentile(ms, 95), 3),
+        "p99": round(_percentile(ms, 99), 3),
+        "max": round(max(ms), 3) if ms else 0.0,
+    }
+
+
+class Fixture:
+    """Company, user, products and registered devices shared by the runs."""
+
+    def __init__(self, SessionLocal, max_lines: int):
+        from app.models.company import Company
+        from app.models.product import Product
+        from app.models.tax_setting import TaxSetting
+        from app.models.user import User
+
+        self.SessionLocal = SessionLocal
+        self.devices: list[int] = []
+        self.seq = itertools.count(1)
+        db = SessionLocal()
+        stamp = int(time.time() * 1000)
+        self.company_id = self._add(db, Company(name=f"Bench {stamp}")).id
+        self.user_id = self._add(db, User(email=f"bench-{stamp}@example.invalid", hashed_password="x")).id
+        tax = self._add(db, TaxSetting(company_id=self.company_id, name="VAT 15%", rate=15, zimra_tax_id=1))
+        self.product_ids = [
+            self._add(db, Product(
+                company_id=self.company_id, name=f"Product {i}", sale_price=10 + i,
+                tax_id=tax.id, hs_code="12345678",
+            )).id
+            for i in range(max_lines)
+        ]
+        db.commit()
+        self.stamp = stamp
+        db.close()
+
+    @staticmethod
+    def _add(db, obj):
+        db.add(obj)
+        db.flush()
+        return obj
+
+    def ensure_devices(self, count: int) -> list[int]:
+        from app.models.device import Device
+        from app.services.fdms import open_day, register_device
+
+        db = self.SessionLocal()
+        while len(self.devices) < count:
+            n = len(self.devices)
+            device = self._add(db, Device(
+                company_id=self.company_id,
+                device_id=str(70000 + (self.stamp % 1000) * 100 + n),
+                serial_number=f"BENCH-{n}",
+                activation_key="BENCH",
+                last_ping_at=datetime.utcnow() + timedelta(days=365),
+            ))
+            register_device(device, db)
+            open_day(device, db)
+            self.devices.append(device.id)
+        db.close()
+        return self.devices[:count]
+
+    def invoices(self, devices: list[int], lines: int, receipts: int, pos: bool) -> list[int]:
+        from app.models.invoice import Invoice
+        from app.models.invoice_line import InvoiceLine
+        from app.models.pos_session import POSOrder, POSSession
+        from app.services.fiscal_outbox import enqueue_fiscalization
+
+        db = self.SessionLocal()
+        sessions = {}
+        if pos:
+            for device_id in devices:
+                sessions[device_id] = self._add(db, POSSession(
+                    company_id=self.company_id, device_id=device_id, opened_by_id=self.user_id,
+                    name=f"BENCH/{self.stamp}/{next(self.seq)}",
+                )).id
+        ids = []
+        for i in range(receipts):
+            device_id = devices[i % len(devices)]
+            ref = f"BENCH-{self.stamp}-{next(self.seq)}"
+            invoice = Invoice(company_id=self.company_id, device_id=device_id, reference=ref, status="posted")
+            invoice.lines = [
+                InvoiceLine(product_id=pid, description=f"Line {n}", quantity=1 + n % 3, unit_price=10, vat_rate=15)
+                for n, pid in enumerate(self.product_ids[:lines])
+            ]
+            self._add(db, invoice)
+            if pos:
+                order = self._add(db, POSOrder(
+                    session_id=sessions[device_id], company_id=self.company_id, invoice_id=invoice.id,
+                    created_by_id=self.user_id, reference=f"POS-{ref}", status="paid",
+                ))
+                ids.append(enqueue_fiscalization(db, invoice, order, user_id=self.user_id).id)
+            else:
+                ids.append(invoice.id)
+        db.commit()
+        db.close()
+        return ids
+
+
+def _run_invoices(fixture: Fixture, ids: list[int], concurrency: int):
+    from app.models.invoice import Invoice
+    from app.services.fdms import submit_invoice
+
+    samples: list[tuple[float, dict[str, float]]] = []
+    errors: list[str] = []
+    lock = threading.Lock()
+
+    def one(invoice_id: int) -> None:
+        timer.reset()
+        started = time.perf_counter()
+        db = fixture.SessionLocal()
+        try:
+            invoice = db.get(Invoice, invoice_id)
+            submit_invoice(invoice, db)
+            invoice.status = "fiscalized"
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            with lock:
+                errors.append(str(exc))
+            return
+        finally:
+            db.close()
+        elapsed = time.perf_counter() - started
+        with lock:
+            samples.append((elapsed, timer.totals()))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, ids))
+    return samples, errors
+
+
+def _run_pos(fixture: Fixture, ids: list[int], concurrency: int):
+    from app.models.fiscal_outbox import FiscalOutbox
+    from app.services.fiscal_outbox import drain_once
+
+    samples: list[tuple[float, dict[str, float]]] = []
+    lock = threading.Lock()
+
+    def worker(n: int) -> None:
+        idle = 0
+        while idle < 3:
+            timer.reset()
+            started = time.perf_counter()
+            if not drain_once(f"bench-{n}"):
+                idle += 1
+                time.sleep(0.01)
+                continue
+            idle = 0
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples.append((elapsed, timer.totals()))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    db = fixture.SessionLocal()
+    failed = db.query(FiscalOutbox).filter(FiscalOutbox.id.in_(ids), FiscalOutbox.status != "done").all()
+    errors = [f"outbox {e.id}: {e.status} {e.last_error}" for e in failed]
+    db.close()
+    return samples, errors
+
+
+def _result(mode, devices, lines, concurrency, samples, errors, elapsed) -> dict:
+    totals = [s[0] for s in samples]
+    stages = {}
+    for stage in STAGES:
+        if stage == "other":
+            values = [total - sum(v for k, v in parts.items() if k != "other") for total, parts in samples]
+        else:
+            values = [parts[stage] for _, parts in samples]
+        stages[stage] = _summary_ms(values)
+    return {
+        "mode": mode,
+        "devices": devices,
+        "lines": lines,
+        "concurrency": concurrency,
+        "receipts": len(samples),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": _summary_ms(totals),
+        "stages_ms": stages,
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return ""
+
+
+def _compare(results: dict, baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    key = lambda r: (r["mode"], r["devices"], r["lines"], r["concurrency"])  # noqa: E731
+    previous = {key(r): r for r in baseline.get("runs", [])}
+    print(f"\ncompared with {baseline_path} ({baseline.get('meta', {}).get('revision', '?')})")
+    for run in results["runs"]:
+        old = previous.get(key(run))
+        if not old:
+            continue
+        rps = run["throughput_rps"] / old["throughput_rps"] if old["throughput_rps"] else 0
+        p95 = run["latency_ms"]["p95"] / old["latency_ms"]["p95"] if old["latency_ms"]["p95"] else 0
+        print(f"  {key(run)}: throughput x{rps:.2f}, p95 x{p95:.2f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("invoice", "pos", "both"), default="both")
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--lines", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--receipts", type=int, default=100, help="receipts per run")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated FDMS latency")
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args()
+
+    import app.models  # noqa: F401
+    from app.core.config import settings
+    from app.db.base import Base
+    from app.db.session import SessionLocal, engine
+    from app.simulator.fdms import SimulatorConfig, run_in_thread
+
+    config = SimulatorConfig(latency_ms=args.latency_ms, latency_jitter_ms=args.jitter_ms)
+    url, _simulator, stop = run_in_thread(config)
+    settings.fdms_api_url = url
+
+    Base.metadata.create_all(engine)
+    _instrument(engine)
+    fixture = Fixture(SessionLocal, max(args.lines))
+
+    modes = ("invoice", "pos") if args.mode == "both" else (args.mode,)
+    runs = []
+    for mode, devices, lines, concurrency in itertools.product(
+        modes, args.devices, args.lines, args.concurrency
+    ):
+        device_ids = fixture.ensure_devices(devices)
+        ids = fixture.invoices(device_ids, lines, args.receipts, pos=(mode == "pos"))
+        started = time.perf_counter()
+        if mode == "invoice":
+            samples, errors = _run_invoices(fixture, ids, concurrency)
+        else:
+            samples, errors = _run_pos(fixture, ids, concurrency)
+        elapsed = time.perf_counter() - started
+        run = _result(mode, devices, lines, concurrency, samples, errors, elapsed)
+        runs.append(run)
+        lat = run["latency_ms"]
+        print(
+            f"{mode:7} devices={devices:<3} lines={lines:<3} conc={concurrency:<3} "
+            f"{run['throughput_rps']:8.1f} rps  p50={lat['p50']:.1f} p95={lat['p95']:.1f} "
+            f"p99={lat['p99']:.1f} ms  errors={run['errors']}  "
+            + " ".join(f"{s}={run['stages_ms'][s]['mean']:.1f}" for s in STAGES)
+        )
+    stop()
+
+    results = {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "python": platform.python_version(),
+            "database": engine.dialect.name,
+            "receipts_per_run": args.receipts,
+            "simulator": {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms},
+        },
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+    if args.compare:
+        _compare(results, args.compare)
+    return 1 if any(r["errors"] for r in runs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""Size and latency of the invoice list response.
+
+Seeds a company with fiscalized invoices carrying realistic fiscal artefacts
+(signed receipt payload, device and server signatures), then times
+``GET /invoices`` end to end (query + ``InvoiceRead`` JSON serialization) in
+two shapes:
+
+    legacy   every column loaded, lines loaded per invoice and the signed
+             payload serialized into each list item (the old InvoiceRead)
+    current  fiscal artefacts deferred, lines loaded in one extra query and
+             no payload in the list (the payload is served by
+             ``GET /invoices/{id}/fiscal-receipt``)
+
+    python bench_invoice_list.py --invoices 2000 --lines 5 --repeat 5
+
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+_tmp_db = os.path.join(tempfile.mkdtemp(prefix="invlist-"), "invlist.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp_db}")
+os.environ.setdefault("SECRET_KEY", "invoice-list-bench")
+os.environ.setdefault("FISCAL_OUTBOX_WORKERS", "0")
+
+
+def _fake_b64(n_bytes: int) -> str:
+    return base64.b64encode(random.randbytes(n_bytes)).decode("ascii")
+
+
+def _payload(invoice_no: int, lines: int) -> str:
+    receipt_lines = [
+        {
+            "receiptLineType": "Sale",
+            "receiptLineNo": n + 1,
+            "receiptLineHSCode": "00000000",
+            "receiptLineName": f"Product {n} with a reasonably descriptive name",
+            "receiptLinePrice": 11.5,
+            "receiptLineQuantity": 1,
+            "receiptLineTotal": 11.5,
+            "taxID": 1,
+            "taxPercent": 15.0,
+        }
+        for n in range(lines)
+    ]
+    receipt = {
+        "receiptType": "FiscalInvoice",
+        "receiptCurrency": "USD",
+        "receiptCounter": invoice_no,
+        "receiptGlobalNo": invoice_no,
+        "invoiceNo": f"INV-{invoice_no:06d}",
+        "receiptDate": "2026-10-17T10:00:00",
+        "receiptLinesTaxInclusive": True,
+        "receiptLines": receipt_lines,
+        "receiptTaxes": [{"taxID": 1, "taxPercent": 15.0, "taxAmount": 1.5 * lines, "salesAmountWithTax": 11.5 * lines}],
+        "receiptPayments": [{"moneyTypeCode": "Cash", "paymentAmount": 11.5 * lines}],
+        "receiptTotal": 11.5 * lines,
+        "receiptPrintForm": "Receipt48",
+        "receiptDeviceSignature": {"hash": _fake_b64(32), "signature": _fake_b64(256)},
+        "previousReceiptHash": _fake_b64(32),
+    }
+    return json.dumps({"deviceID": 12345, "receipt": receipt})
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--invoices", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=5, help="lines per invoice")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    import app.models  # noqa: F401
+    from pydantic import TypeAdapter
+    from sqlalchemy.orm import undefer_group
+
+    from app.api.routes.invoices import list_invoices
+    from app.db.base import Base
+    from app.db.session import SessionLocal, engine
+    from app.models.company import Company
+    from app.models.invoice import Invoice
+    from app.models.invoice_line import InvoiceLine
+    from app.schemas.invoice import InvoiceRead
+
+    class LegacyInvoiceRead(InvoiceRead):
+        zimra_payload: str
+
+    legacy_adapter = TypeAdapter(list[LegacyInvoiceRead])
+    current_adapter = TypeAdapter(list[InvoiceRead])
+
+    def _respond(adapter: TypeAdapter, rows: list) -> bytes:
+        # What FastAPI does with response_model: validate from attributes, then dump
+        return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    company = Company(name=f"Invoice list bench {time.time():.0f}")
+    db.add(company)
+    db.flush()
+    for n in range(1, args.invoices + 1):
+        invoice = Invoice(
+            company_id=company.id,
+            reference=f"BENCH-{company.id}-{n}",
+            status="posted",
+            zimra_status="submitted",
+            zimra_receipt_counter=n,
+            zimra_receipt_global_no=n,
+            zimra_device_hash=_fake_b64(32),
+            zimra_device_signature=_fake_b64(256),
+            zimra_server_hash=_fake_b64(32),
+            zimra_server_signature=_fake_b64(256),
+            zimra_verification_code="ABCD-EF01-2345-6789",
+            zimra_payload=_payload(n, args.lines),
+        )
+        invoice.lines = [
+            InvoiceLine(description=f"Product {i}", quantity=1, unit_price=10, vat_rate=15, total_price=11.5)
+            for i in range(args.lines)
+        ]
+        db.add(invoice)
+    db.commit()
+    company_id = company.id
+    db.close()
+
+    def legacy() -> bytes:
+        session = SessionLocal()
+        try:
+            rows = (
+                session.query(Invoice)
+                .options(undefer_group("fiscal_artefacts"))
+                .filter(Invoice.company_id == company_id)
+                .order_by(Invoice.created_at.desc())
+                .all()
+            )
+            return _respond(legacy_adapter, rows)
+        finally:
+            session.close()
+
+    def current() -> bytes:
+        session = SessionLocal()
+        try:
+            rows = list_invoices(company_id=company_id, db=session, user=None, _=None)
+            return _respond(current_adapter, rows)
+        finally:
+            session.close()
+
+    results = {}
+    for name, fn in (("legacy", legacy), ("current", current)):
+        fn()  # warm up
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            body = fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = (len(body), statistics.median(timings))
+
+    print(f"{args.invoices} invoices x {args.lines} lines, median of {args.repeat}")
+    print(f"{'shape':<10}{'response KB':>14}{'latency ms':>14}")
+    for name, (size, ms) in results.items():
+        print(f"{name:<10}{size / 1024:>14.1f}{ms:>14.1f}")
+    (old_size, old_ms), (new_size, new_ms) = results["legacy"], results["current"]
+    print(f"size -{(1 - new_size / old_size) * 100:.0f}%, latency -{(1 - new_ms / old_ms) * 100:.0f}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Scans per second: search query vs the in-memory scan index.
+
+Seeds a company with products (each with a barcode, a reference and one of
+a few tax settings), then looks up random barcodes the way a till would:
+
+    search   ``GET /pos/products?search=<barcode>`` (product search, then the
+             stock and tax lookups), the old scan path
+    index    ``app.services.pos_scan.scan``, answered from memory
+
+and reports scans per second and the median latency of each.  Finally it
+checks a lookup by reference and that a price change is picked up.
+
+    python bench_pos_scan.py --products 20000 --scans 20000 --search-scans 200
+
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+_tmp_db = os.path.join(tempfile.mkdtemp(prefix="posscan-"), "posscan.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp_db}")
+os.environ.setdefault("SECRET_KEY", "pos-scan-bench")
+os.environ.setdefault("FISCAL_OUTBOX_WORKERS", "0")
+
+
+def _timed(fn, codes: list[str]) -> tuple[float, float]:
+    latencies = []
+    started = time.perf_counter()
+    for code in codes:
+        t = time.perf_counter()
+        fn(code)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    return len(codes) / elapsed, statistics.median(latencies) * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--scans", type=int, default=20000, help="scans through the index")
+    parser.add_argument("--search-scans", type=int, default=200, help="scans through the search query")
+    args = parser.parse_args()
+
+    from sqlalchemy import insert
+
+    import app.models  # noqa: F401
+    from app.api.routes.pos import pos_products
+    from app.db.base import Base
+    from app.db.session import SessionLocal, engine
+    from app.models.company import Company
+    from app.models.product import Product
+    from app.models.tax_setting import TaxSetting
+    from app.models.user import User
+    from app.services.pos_scan import scan
+
+    Base.metadata.create_all(engine)
+    run = f"{time.time():.0f}"
+    db = SessionLocal()
+    user = User(email=f"pos-scan-{run}@example.com", hashed_password="x", is_admin=True)
+    company = Company(name=f"POS scan bench {run}")
+    db.add_all([user, company])
+    db.flush()
+    taxes = [TaxSetting(company_id=company.id, name=f"VAT {r}", rate=r, zimra_tax_id=n + 1)
+             for n, r in enumerate((0, 5, 15))]
+    db.add_all(taxes)
+    db.flush()
+    db.execute(insert(Product), [
+        {
+            "company_id": company.id, "name": f"Product {n}", "barcode": f"600{run}{n:07d}",
+            "reference": f"REF-{n:06d}", "sale_price": 1 + n % 50, "tax_id": taxes[n % 3].id,
+            "product_type": "consumable", "track_inventory": False,
+        }
+        for n in range(args.products)
+    ])
+    db.commit()
+    rates = {t.id: t.rate for t in taxes}
+    company_id = company.id
+
+    rng = random.Random(1)
+    codes = [f"600{run}{rng.randrange(args.products):07d}" for _ in range(args.scans)]
+    search_codes = codes[: args.search_scans]
+
+    def by_search(code: str):
+        found = pos_products(company_id=company_id, search=code, category_id=None, till_id=None,
+                             employee_id=None, limit=100, offset=0, db=db, user=user)
+        assert found and found[0]["barcode"] == code
+
+    def by_index(code: str):
+        found = scan(db, company_id, code)
+        assert found and found["barcode"] == code
+
+    started = time.perf_counter()
+    scan(db, company_id, codes[0])
+    build = time.perf_counter() - started
+
+    search_rate, search_median = _timed(by_search, search_codes)
+    index_rate, index_median = _timed(by_index, codes)
+    print(f"{args.products} products, index built in {build * 1000:.0f} ms")
+    print(f"search: {search_rate:>10.0f} scans/s  median {search_median:>9.1f} us  ({len(search_codes)} scans)")
+    print(f"index:  {index_rate:>10.0f} scans/s  median {index_median:>9.1f} us  ({len(codes)} scans)")
+
+    ok = True
+    product = db.query(Product).filter(Product.barcode == codes[0]).one()
+    expected_rate = rates[product.tax_id]
+    hit = scan(db, company_id, product.reference)
+    if hit is None or hit["id"] != product.id or hit["vat_rate"] != expected_rate:
+        print(f"  ! reference lookup returned {hit}")
+        ok = False
+    product.sale_price = 999
+    db.commit()
+    hit = scan(db, company_id, codes[0])
+    if hit["sale_price"] != 999:
+        print(f"  ! price change not picked up ({hit['sale_price']})")
+        ok = False
+    if scan(db, company_id, "no-such-code") is not None:
+        print("  ! unknown code matched")
+        ok = False
+    db.close()
+    print("scan index OK" if ok else "scan index BROKEN")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
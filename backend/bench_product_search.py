@@ -0,0 +1,135 @@
+"""Product search latency on a large catalog: ILIKE vs the search index.
+
+Seeds a company with products named from a small vocabulary (so common
+words match thousands of rows), each with a barcode and a reference, then
+times ``list_products(search=...)`` page by page for a mix of queries:
+partly typed words, multi-word names, a misspelling, a barcode prefix and a
+reference.  Each query is run through
+
+    ilike    the old ``ILIKE '%x%'`` filter over name, barcode and reference
+    search   ``app.services.product_search.search_products`` (the in-memory
+             n-gram index here; pg_trgm on PostgreSQL)
+
+and the median latency per query is reported, together with what the top
+hit was.
+
+    python bench_product_search.py --products 100000 --repeat 5
+
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+_tmp_db = os.path.join(tempfile.mkdtemp(prefix="prodsearch-"), "prodsearch.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp_db}")
+os.environ.setdefault("SECRET_KEY", "product-search-bench")
+os.environ.setdefault("FISCAL_OUTBOX_WORKERS", "0")
+
+_ADJECTIVES = ["fresh", "frozen", "organic", "classic", "spicy", "sweet", "lite", "family", "premium", "value"]
+_NOUNS = ["chocolate", "biscuits", "maize meal", "cooking oil", "rice", "sugar", "milk", "bread", "tea", "coffee",
+          "soap", "toothpaste", "juice", "yoghurt", "peanut butter", "jam", "beans", "pasta", "flour", "salt"]
+_SIZES = ["100g", "250g", "500g", "1kg", "2kg", "5kg", "330ml", "500ml", "1l", "2l"]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--page", type=int, default=50, help="page size")
+    args = parser.parse_args()
+
+    from sqlalchemy import insert
+
+    import app.models  # noqa: F401
+    from app.api.routes.products import list_products
+    from app.db.base import Base
+    from app.db.session import SessionLocal, engine
+    from app.models.company import Company
+    from app.models.product import Product
+    from app.models.user import User
+    from app.services.product_search import rank_products
+
+    Base.metadata.create_all(engine)
+    run = f"{time.time():.0f}"
+    db = SessionLocal()
+    user = User(email=f"product-search-{run}@example.com", hashed_password="x", is_admin=True)
+    company = Company(name=f"Product search bench {run}")
+    db.add_all([user, company])
+    db.flush()
+    rng = random.Random(7)
+    rows = []
+    for n in range(args.products):
+        name = f"{rng.choice(_ADJECTIVES).title()} {rng.choice(_NOUNS).title()} {rng.choice(_SIZES)} #{n}"
+        rows.append({
+            "company_id": company.id, "name": name, "barcode": f"6{n:012d}", "reference": f"SKU-{n:06d}",
+            "product_type": "consumable",
+        })
+    for i in range(0, len(rows), 10000):
+        db.execute(insert(Product), rows[i:i + 10000])
+    db.commit()
+    company_id = company.id
+    target = args.products // 2
+
+    queries = [
+        "choc", "organic choc", "cooking oil 2l", "chocolte", "peanut buter", "frozen", "toothpaste 100g",
+        f"6{target:012d}"[:9], f"SKU-{target:06d}", "nothing like this",
+    ]
+
+    def legacy(search: str) -> list:
+        like = f"%{search}%"
+        return (
+            db.query(Product)
+            .filter(
+                Product.company_id == company_id,
+                Product.name.ilike(like) | Product.barcode.ilike(like) | Product.reference.ilike(like),
+            )
+            .order_by(Product.name)
+            .limit(args.page)
+            .all()
+        )
+
+    def ranked(search: str) -> list:
+        return list_products(company_id=company_id, category_id=None, search=search, is_active=None,
+                             can_be_sold=None, limit=args.page, offset=0, db=db, user=user, _=None)
+
+    def median_ms(fn, search: str) -> tuple[float, list]:
+        times, result = [], []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = fn(search)
+            times.append(time.perf_counter() - started)
+        return statistics.median(times) * 1000, result
+
+    started = time.perf_counter()
+    rank_products(db, company_id, "warm up")
+    print(f"{args.products} products, search index built in {time.perf_counter() - started:.2f}s")
+    print(f"{'query':<22}{'ilike ms':>10}{'hits':>6}{'search ms':>11}{'hits':>6}  top hit")
+    ok = True
+    for search in queries:
+        legacy_ms, legacy_rows = median_ms(legacy, search)
+        ranked_ms, ranked_rows = median_ms(ranked, search)
+        top = ranked_rows[0].name if ranked_rows else "-"
+        print(f"{search:<22}{legacy_ms:>10.1f}{len(legacy_rows):>6}{ranked_ms:>11.1f}{len(ranked_rows):>6}  {top}")
+        if search.startswith("SKU-") and (not ranked_rows or ranked_rows[0].reference != search):
+            print("  ! exact reference is not the top hit")
+            ok = False
+    for search in ("chocolte", "peanut buter"):
+        top = ranked(search)
+        if not top:
+            print(f"  ! misspelling {search!r} found nothing")
+            ok = False
+    if ranked("nothing like this"):
+        print("  ! unrelated query matched")
+        ok = False
+    db.close()
+    print("search OK" if ok else "search BROKEN")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
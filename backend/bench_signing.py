@@ -0,0 +1,72 @@
+"""Micro-benchmark: per-receipt signing time with and without the key cache.
+
+Usage (from backend/):
+    PYTHONPATH=$PWD python bench_signing.py [--receipts 2000] [--rsa]
+
+"before" re-parses the PEM key for every receipt (the old behaviour of
+_sign_receipt); "after" signs with the parsed key from app.services.signing_keys.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.getcwd())
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+from app.services.fdms import _sign_receipt
+from app.services.signing_keys import load_private_key
+
+
+def _sample_receipt(global_no: int) -> dict:
+    return {
+        "deviceID": 32322,
+        "receiptType": "FiscalInvoice",
+        "receiptCurrency": "USD",
+        "receiptGlobalNo": global_no,
+        "receiptDate": "2026-01-01T10:00:00",
+        "receiptTotal": 115.0,
+        "receiptTaxes": [
+            {"taxID": "1", "taxPercent": 15.0, "taxAmount": 15.0, "salesAmountWithTax": 115.0},
+        ],
+        "previousReceiptHash": "q9Yt0mJc0lJ1m0Jq1c0mJc0lJ1m0Jq1c0mJc0lJ1m0=",
+    }
+
+
+def _run(label: str, count: int, sign) -> float:
+    start = time.perf_counter()
+    for i in range(count):
+        sign(_sample_receipt(i + 1))
+    elapsed = time.perf_counter() - start
+    per_receipt_us = elapsed / count * 1_000_000
+    print(f"{label:<8} {count} receipts in {elapsed:.3f}s -> {per_receipt_us:.1f} us/receipt")
+    return per_receipt_us
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--receipts", type=int, default=2000)
+    parser.add_argument("--rsa", action="store_true", help="benchmark an RSA-2048 key instead of ECC P-256")
+    args = parser.parse_args()
+
+    if args.rsa:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+    before = _run("before", args.receipts, lambda r: _sign_receipt(r, serialization.load_pem_private_key(pem, password=None)))
+    after = _run("after", args.receipts, lambda r: _sign_receipt(r, load_private_key(pem, owner="device:1")))
+    print(f"speed-up: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Query-count check for POS order creation.
+
+Creates POS orders of increasing basket size (every line a distinct
+storable product with its own tax setting and stock quant) through
+``create_order`` and counts the SQL statements it issues.  Products, taxes
+and quants are resolved for the whole basket in a few queries and each line
+is priced once, so the count must not grow with the number of lines.  Also
+checks that order and invoice lines agree and that stock was deducted.
+
+    python check_pos_order_queries.py --lines 1 10 30
+
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+_tmp_db = os.path.join(tempfile.mkdtemp(prefix="posq-"), "posq.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp_db}")
+os.environ.setdefault("SECRET_KEY", "pos-query-check")
+os.environ.setdefault("FISCAL_OUTBOX_WORKERS", "0")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, nargs="+", default=[1, 10, 30])
+    args = parser.parse_args()
+
+    from sqlalchemy import event
+
+    import app.models  # noqa: F401
+    from app.api.routes.pos import create_order
+    from app.db.base import Base
+    from app.db.session import SessionLocal, engine
+    from app.models.company import Company
+    from app.models.invoice_line import InvoiceLine
+    from app.models.location import Location
+    from app.models.pos_session import POSSession
+    from app.models.product import Product
+    from app.models.stock_quant import StockQuant
+    from app.models.tax_setting import TaxSetting
+    from app.models.user import User
+    from app.models.warehouse import Warehouse
+    from app.schemas.pos import POSOrderCreate, POSOrderLineCreate
+
+    Base.metadata.create_all(engine)
+    statements: list[str] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    run = f"{time.time():.0f}"
+    db = SessionLocal()
+    user = User(email=f"pos-queries-{run}@example.com", hashed_password="x", is_admin=True)
+    company = Company(name=f"POS query check {run}")
+    db.add_all([user, company])
+    db.flush()
+    warehouse = Warehouse(company_id=company.id, name="Main")
+    db.add(warehouse)
+    db.flush()
+    location = Location(warehouse_id=warehouse.id, name="Stock", is_primary=True)
+    session = POSSession(company_id=company.id, opened_by_id=user.id, name=f"POS-QC-{run}")
+    db.add_all([location, session])
+    db.flush()
+    serial = iter(range(1, 1_000_000))
+
+    def make_basket(n_lines: int) -> list[int]:
+        ids = []
+        for _ in range(n_lines):
+            n = next(serial)
+            tax = TaxSetting(company_id=company.id, name=f"VAT {n}", rate=15, zimra_tax_id=n % 3 + 1)
+            db.add(tax)
+            db.flush()
+            product = Product(
+                company_id=company.id, name=f"Product {n}", sale_price=10, tax_id=tax.id,
+                product_type="storable", track_inventory=True,
+            )
+            db.add(product)
+            db.flush()
+            db.add(StockQuant(
+                company_id=company.id, product_id=product.id, warehouse_id=warehouse.id,
+                location_id=location.id, quantity=100, available_quantity=100,
+            ))
+            ids.append(product.id)
+        db.commit()
+        return ids
+
+    def order_payload(product_ids: list[int]) -> POSOrderCreate:
+        return POSOrderCreate(
+            session_id=session.id,
+            company_id=company.id,
+            cash_amount=25 * len(product_ids),
+            lines=[POSOrderLineCreate(product_id=pid, quantity=2) for pid in product_ids],
+        )
+
+    # First order of the day creates the reference counters; keep it out of the counts
+    create_order(order_payload(make_basket(1)), db=db, user=user)
+
+    counts: dict[int, int] = {}
+    failures: list[str] = []
+    for n_lines in args.lines:
+        product_ids = make_basket(n_lines)
+        payload = order_payload(product_ids)
+        db.expire_all()
+        statements.clear()
+        order = create_order(payload, db=db, user=user)
+        counts[n_lines] = len(statements)
+
+        if len(order.lines) != n_lines or abs(order.total_amount - 23 * n_lines) > 0.01:
+            failures.append(f"{n_lines} lines: order has {len(order.lines)} lines, total {order.total_amount}")
+        invoice_lines = db.query(InvoiceLine).filter(InvoiceLine.invoice_id == order.invoice_id).all()
+        if sorted((l.product_id, l.total_price) for l in invoice_lines) != sorted(
+            (l.product_id, l.total_price) for l in order.lines
+        ):
+            failures.append(f"{n_lines} lines: invoice lines differ from order lines")
+        stock = {q.product_id: q.quantity for q in db.query(StockQuant).filter(StockQuant.product_id.in_(product_ids))}
+        if any(stock.get(pid) != 98 for pid in product_ids):
+            failures.append(f"{n_lines} lines: stock not deducted {sorted(set(stock.values()))}")
+    db.close()
+
+    for n_lines, count in counts.items():
+        print(f"{n_lines:>4} lines: {count} queries")
+    if len(set(counts.values())) != 1:
+        failures.append(f"query count grows with line count {sorted(set(counts.values()))}")
+    for line in failures:
+        print("  !", line)
+    print("query count constant" if not failures else "query count NOT constant")
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
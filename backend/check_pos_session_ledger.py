@@ -0,0 +1,140 @@
+"""Concurrency check for the POS session ledger.
+
+Several cashiers (threads, each with its own database session) sell into
+one shared POS session at once, paying by cash or card (either sometimes
+overpaid, leaving change) or mobile, and a few sales are refunded.  Every
+sale must be counted: the session's totals, read back from the ledger, must
+equal the sums over its orders (cash as tendered, card and mobile net of any
+change taken off them, refunds only in total_returns), and closing the
+session must reconcile the cash drawer exactly (expected cash = opening
+float + cash kept from sales - cash refunded; change on a card overpayment
+never comes out of the drawer).
+
+    python check_pos_session_ledger.py --threads 8 --orders 25
+
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_tmp_db = os.path.join(tempfile.mkdtemp(prefix="ledger-"), "ledger.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp_db}")
+os.environ.setdefault("SECRET_KEY", "pos-ledger-check")
+os.environ.setdefault("FISCAL_OUTBOX_WORKERS", "0")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--orders", type=int, default=25, help="orders per thread")
+    parser.add_argument("--refunds", type=int, default=5)
+    args = parser.parse_args()
+
+    import app.models  # noqa: F401
+    from app.api.routes.pos import close_session, create_order, get_session, refund_order
+    from app.db.base import Base
+    from app.db.session import SessionLocal, engine
+    from app.models.company import Company
+    from app.models.pos_session import POSOrder, POSSession
+    from app.models.product import Product
+    from app.models.user import User
+    from app.schemas.pos import POSOrderCreate, POSOrderLineCreate, POSOrderRefund, POSSessionClose
+
+    Base.metadata.create_all(engine)
+    run = f"{time.time():.0f}"
+    db = SessionLocal()
+    user = User(email=f"pos-ledger-{run}@example.com", hashed_password="x", is_admin=True)
+    company = Company(name=f"POS ledger check {run}")
+    db.add_all([user, company])
+    db.flush()
+    product = Product(company_id=company.id, name="Item", sale_price=10, product_type="service", track_inventory=False)
+    session = POSSession(company_id=company.id, opened_by_id=user.id, name=f"POS-LEDGER-{run}", opening_balance=50)
+    db.add_all([product, session])
+    db.commit()
+    ids = dict(company=company.id, product=product.id, session=session.id, user=user.id)
+    db.close()
+
+    def cashier(seed: int) -> list[str]:
+        rng = random.Random(seed)
+        errors = []
+        own = SessionLocal()
+        try:
+            me = own.get(User, ids["user"])
+            for _ in range(args.orders):
+                qty = rng.randint(1, 3)
+                method = rng.choice(["cash", "card", "mobile"])
+                amount = 10 * qty
+                pay = {f"{method}_amount": amount + (rng.choice([0, 5]) if method != "mobile" else 0)}
+                try:
+                    create_order(POSOrderCreate(
+                        session_id=ids["session"], company_id=ids["company"], payment_method=method,
+                        lines=[POSOrderLineCreate(product_id=ids["product"], quantity=qty)], **pay,
+                    ), db=own, user=me)
+                except Exception as exc:
+                    own.rollback()
+                    errors.append(str(exc))
+        finally:
+            own.close()
+        return errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        errors = [e for r in pool.map(cashier, range(args.threads)) for e in r]
+    elapsed = time.perf_counter() - started
+
+    db = SessionLocal()
+    user = db.get(User, ids["user"])
+    sales = db.query(POSOrder).filter(POSOrder.session_id == ids["session"]).order_by(POSOrder.id).all()
+    for order in sales[: args.refunds]:
+        refund_order(order.id, POSOrderRefund(reason="check"), db=db, user=user)
+
+    def kept(o: POSOrder) -> dict[str, float]:
+        # Change comes out of the cash tendered; the rest off the card or mobile that overpaid
+        cash_change = min(o.change_amount, o.cash_amount)
+        card_change = min(o.change_amount - cash_change, o.card_amount)
+        return {
+            "cash": o.cash_amount - cash_change,
+            "card": o.card_amount - card_change,
+            "mobile": o.mobile_amount - (o.change_amount - cash_change - card_change),
+        }
+
+    orders = db.query(POSOrder).filter(POSOrder.session_id == ids["session"]).all()
+    sold = [o for o in orders if o.total_amount >= 0]
+    refunded = sales[: args.refunds]
+    expected = {
+        "total_sales": round(sum(o.total_amount for o in sold), 2),
+        "total_returns": round(sum(o.total_amount for o in refunded), 2),
+        "total_cash": round(sum(o.cash_amount for o in sold), 2),
+        "total_card": round(sum(kept(o)["card"] for o in sold), 2),
+        "total_mobile": round(sum(kept(o)["mobile"] for o in sold), 2),
+        "transaction_count": len(orders),
+    }
+    read = get_session(ids["session"], db=db, user=user).session
+    drawer = 50 + sum(kept(o)["cash"] for o in sold) - sum(kept(o)["cash"] for o in refunded)
+    summary = close_session(ids["session"], POSSessionClose(closing_balance=drawer), db=db, user=user)
+    db.close()
+
+    print(f"{args.threads} cashiers: {len(sales)} sales in {elapsed:.2f}s, {len(errors)} errors, {args.refunds} refunds")
+    ok = not errors and len(sales) == args.threads * args.orders
+    for error in errors[:10]:
+        print(f"  ! {error}")
+    for field, value in expected.items():
+        got = getattr(read, field)
+        if abs(got - value) > 0.005:
+            print(f"  ! {field}: ledger {got}, orders {value}")
+            ok = False
+    if abs(summary.expected_cash - round(drawer, 2)) > 0.005 or abs(summary.difference) > 0.005:
+        print(f"  ! close: expected cash {summary.expected_cash}, drawer {drawer:.2f}, difference {summary.difference}")
+        ok = False
+    print(f"totals {expected}")
+    print("ledger OK" if ok else "ledger BROKEN")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Concurrency check for the per-device receipt chain sequencer.
+
+Registers several devices with the local FDMS simulator (``app.simulator``),
+opens a fiscal day on each, fires many concurrent ``submit_invoice`` calls and
+closes the days again.  The simulator rejects any receipt whose counter,
+global number, previousReceiptHash or signature does not continue the device's
+chain, and CloseDay fails if its counters disagree with the receipts; the
+chain stored on the invoices is verified afterwards with ``receipt_audit``
+(hashes, signatures, links), and the local fiscal day counters must agree
+with GetStatus.
+
+    python check_receipt_chain.py --devices 4 --receipts 50 --concurrency 16
+
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+_tmp_db = os.path.join(tempfile.mkdtemp(prefix="chain-"), "chain.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp_db}")
+os.environ.setdefault("SECRET_KEY", "chain-check")
+os.environ.setdefault("FISCAL_OUTBOX_WORKERS", "0")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--receipts", type=int, default=40, help="receipts per device")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="simulated FDMS latency")
+    args = parser.parse_args()
+
+    from app.core.config import settings
+    from app.simulator.fdms import SimulatorConfig, run_in_thread
+
+    url, simulator, stop = run_in_thread(SimulatorConfig(latency_ms=args.latency_ms))
+    settings.fdms_api_url = url
+
+    import app.models  # noqa: F401
+    from app.db.base import Base
+    from app.db.session import SessionLocal, engine
+    from app.models.company import Company
+    from app.models.device import Device
+    from app.models.invoice import Invoice
+    from app.models.invoice_line import InvoiceLine
+    from app.services.fdms import (
+        close_day,
+        open_day,
+        reconcile_fiscal_day_counters,
+        register_device,
+        submit_invoice,
+    )
+    from app.services.receipt_audit import verify_device_chain
+
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    company = Company(name=f"Chain check {time.time():.0f}")
+    db.add(company)
+    db.flush()
+    invoice_ids: list[int] = []
+    device_ids: list[int] = []
+    for d in range(args.devices):
+        device = Device(
+            company_id=company.id,
+            device_id=str(90000 + company.id * 100 + d),
+            serial_number=f"CHK-{d}",
+            activation_key="CHECK",
+            last_ping_at=datetime.utcnow() + timedelta(days=1),
+        )
+        db.add(device)
+        db.flush()
+        register_device(device, db)
+        open_day(device, db)
+        device_ids.append(device.id)
+        for n in range(args.receipts):
+            invoice = Invoice(
+                company_id=company.id,
+                device_id=device.id,
+                reference=f"CHK-{company.id}-{device.id}-{n}",
+                status="posted",
+            )
+            invoice.lines = [InvoiceLine(description="Item", quantity=1, unit_price=10, vat_rate=15)]
+            db.add(invoice)
+            db.flush()
+            invoice_ids.append(invoice.id)
+    db.commit()
+    db.close()
+
+    random.shuffle(invoice_ids)
+    failures: list[str] = []
+
+    def submit(invoice_id: int) -> None:
+        session = SessionLocal()
+        try:
+            invoice = session.get(Invoice, invoice_id)
+            submit_invoice(invoice, session)
+            session.commit()
+        except Exception as exc:
+            session.rollback()
+            failures.append(f"invoice {invoice_id}: {exc}")
+        finally:
+            session.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(submit, invoice_ids))
+    elapsed = time.perf_counter() - started
+
+    db = SessionLocal()
+    broken: list[str] = []
+    for device_id in device_ids:
+        report = reconcile_fiscal_day_counters(db.get(Device, device_id), db)
+        if not report["in_sync"]:
+            broken.append(f"device {device_id}: local counters drift {report['drift'][:3]}")
+        try:
+            close_day(db.get(Device, device_id), db)
+        except Exception as exc:
+            broken.append(f"device {device_id}: CloseDay failed: {exc}")
+    for device_id in device_ids:
+        rows = (
+            db.query(Invoice)
+            .filter(Invoice.device_id == device_id, Invoice.zimra_status == "submitted")
+            .order_by(Invoice.zimra_receipt_counter)
+            .all()
+        )
+        counters = [r.zimra_receipt_counter for r in rows]
+        if counters != list(range(1, args.receipts + 1)):
+            broken.append(f"device {device_id}: counters {counters[:10]}...")
+        audit = verify_device_chain(db, device_id)
+        if not audit["ok"]:
+            broken.append(f"device {device_id}: chain audit {audit['issue_counts']} {audit['issues'][:2]}")
+        device = db.get(Device, device_id)
+        if device.last_receipt_counter != len(rows):
+            broken.append(f"device {device_id}: head {device.last_receipt_counter} != {len(rows)}")
+    db.close()
+    stop()
+
+    total = len(invoice_ids)
+    print(f"{total} receipts on {args.devices} devices, concurrency {args.concurrency}")
+    print(f"elapsed {elapsed:.2f}s  ({total / elapsed:.1f} receipts/s)")
+    print(f"simulator: {simulator.snapshot()['stats']}")
+    for line in (failures + broken)[:20]:
+        print("  !", line)
+    ok = not failures and not broken
+    print("chain OK" if ok else "chain BROKEN")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
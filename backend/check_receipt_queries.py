@@ -0,0 +1,110 @@
+"""Query-count check for fiscal receipt building.
+
+Builds receipts for invoices of increasing line count (every line a distinct
+product with its own tax setting) and counts the SQL statements
+``_build_receipt`` issues.  Products and tax settings come from one
+``TaxTable`` load, so the count must not grow with the number of lines; a
+credit note may add one constant lookup for the original receipt.
+
+    python check_receipt_queries.py --lines 1 10 50
+
+Uses a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+_tmp_db = os.path.join(tempfile.mkdtemp(prefix="queries-"), "queries.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp_db}")
+os.environ.setdefault("SECRET_KEY", "query-check")
+os.environ.setdefault("FISCAL_OUTBOX_WORKERS", "0")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, nargs="+", default=[1, 10, 50])
+    args = parser.parse_args()
+
+    from sqlalchemy import event
+
+    import app.models  # noqa: F401
+    from app.db.base import Base
+    from app.db.session import SessionLocal, engine
+    from app.models.company import Company
+    from app.models.invoice import Invoice
+    from app.models.invoice_line import InvoiceLine
+    from app.models.product import Product
+    from app.models.tax_setting import TaxSetting
+    from app.services.fdms import _build_receipt
+
+    Base.metadata.create_all(engine)
+    statements: list[str] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    db = SessionLocal()
+    company = Company(name=f"Query check {time.time():.0f}")
+    db.add(company)
+    db.flush()
+    serial = iter(range(1, 1_000_000))
+
+    def make_invoice(n_lines: int, invoice_type: str = "invoice", reversed_id: int | None = None) -> Invoice:
+        invoice = Invoice(
+            company_id=company.id,
+            reference=f"QC-{company.id}-{next(serial)}",
+            invoice_type=invoice_type,
+            reversed_invoice_id=reversed_id,
+            zimra_receipt_global_no=1,
+        )
+        for i in range(n_lines):
+            tax = TaxSetting(company_id=company.id, name=f"VAT {i}", rate=15, zimra_tax_id=i % 3 + 1)
+            db.add(tax)
+            db.flush()
+            product = Product(company_id=company.id, name=f"P{n_lines}-{i}", tax_id=tax.id, hs_code="1234.56")
+            db.add(product)
+            db.flush()
+            invoice.lines.append(
+                InvoiceLine(product_id=product.id, description=product.name, quantity=1, unit_price=10, vat_rate=15)
+            )
+        db.add(invoice)
+        db.flush()
+        return invoice
+
+    counts: dict[str, int] = {}
+    failures: list[str] = []
+    for n_lines in args.lines:
+        for invoice_type in ("invoice", "credit_note"):
+            original = make_invoice(n_lines) if invoice_type == "credit_note" else None
+            invoice = make_invoice(n_lines, invoice_type, original.id if original else None)
+            db.commit()
+            db.expire_all()
+            invoice = db.get(Invoice, invoice.id)
+            lines = list(invoice.lines)
+
+            statements.clear()
+            receipt = _build_receipt(invoice, lines, "12345", db=db)
+            counts[f"{invoice_type}/{n_lines}"] = len(statements)
+            if len(receipt["receiptLines"]) != n_lines:
+                failures.append(f"{invoice_type}/{n_lines}: {len(receipt['receiptLines'])} receipt lines")
+            if any(line["receiptLineHSCode"] != "12345600" for line in receipt["receiptLines"]):
+                failures.append(f"{invoice_type}/{n_lines}: HS code not resolved")
+    db.close()
+
+    for name, count in counts.items():
+        print(f"{name:>18}: {count} queries")
+    for invoice_type in ("invoice", "credit_note"):
+        per_type = {counts[f"{invoice_type}/{n}"] for n in args.lines}
+        if len(per_type) != 1:
+            failures.append(f"{invoice_type}: query count grows with line count {sorted(per_type)}")
+    for line in failures:
+        print("  !", line)
+    print("query count constant" if not failures else "query count NOT constant")
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Verify the receipt hash chains stored on invoices.
+
+Streams every device's fiscalized invoices in receipt global number order
+(server-side cursor, constant memory) and checks hashes, signatures, gaps,
+forks and previousReceiptHash links with ``app.services.receipt_audit``.
+Devices are verified in parallel worker processes, since signature checks
+are CPU bound.
+
+    python verify_receipt_chain.py                      # every device
+    python verify_receipt_chain.py --company-id 3 --workers 8
+    python verify_receipt_chain.py --device-id 12 --device-id 14 --no-signatures
+    python verify_receipt_chain.py --output report.ndjson
+
+Runs against DATABASE_URL; exits non-zero if any chain is broken.
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def _init_worker() -> None:
+    from app.db.session import engine
+
+    # Connections inherited from the parent process must not be shared
+    engine.dispose(close=False)
+
+
+def _verify(device_id: int, signatures: bool, max_issues: int) -> dict:
+    import app.models  # noqa: F401
+    from app.db.session import SessionLocal
+    from app.services.receipt_audit import verify_device_chain
+
+    db = SessionLocal()
+    try:
+        return verify_device_chain(db, device_id, verify_signatures=signatures, max_issues=max_issues)
+    except Exception as exc:
+        return {"device_id": device_id, "ok": False, "error": str(exc)}
+    finally:
+        db.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--company-id", type=int)
+    parser.add_argument("--device-id", type=int, action="append", help="repeat for several devices")
+    parser.add_argument("--workers", type=int, default=4, help="parallel worker processes")
+    parser.add_argument("--no-signatures", action="store_true", help="skip signature verification")
+    parser.add_argument("--max-issues", type=int, default=20, help="issues listed per device")
+    parser.add_argument("--output", help="write every device report as NDJSON")
+    args = parser.parse_args()
+
+    import app.models  # noqa: F401
+    from app.db.session import SessionLocal
+    from app.models.device import Device
+
+    db = SessionLocal()
+    try:
+        query = db.query(Device.id)
+        if args.company_id is not None:
+            query = query.filter(Device.company_id == args.company_id)
+        if args.device_id:
+            query = query.filter(Device.id.in_(args.device_id))
+        device_ids = [row.id for row in query.order_by(Device.id).all()]
+    finally:
+        db.close()
+
+    started = time.perf_counter()
+    receipts = 0
+    broken = 0
+    output = open(args.output, "w", encoding="utf-8") if args.output else None
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=_init_worker) as pool:
+            futures = [
+                pool.submit(_verify, device_id, not args.no_signatures, args.max_issues)
+                for device_id in device_ids
+            ]
+            for future in as_completed(futures):
+                report = future.result()
+                receipts += report.get("receipts", 0)
+                if output:
+                    output.write(json.dumps(report, default=str) + "\n")
+                if report.get("ok"):
+                    print(f"device {report['device_id']}: OK, {report['receipts']} receipts")
+                    continue
+                broken += 1
+                print(f"device {report['device_id']}: BROKEN {report.get('error') or report.get('issue_counts')}")
+                for issue in report.get("issues", []):
+                    print(f"  ! global no {issue['receipt_global_no']} ({issue['reference']}): "
+                          f"{issue['type']} - {issue['detail']}")
+    finally:
+        if output:
+            output.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"{len(device_ids)} devices, {receipts} receipts in {elapsed:.2f}s"
+          f" ({receipts / elapsed if elapsed else 0:.0f} receipts/s), {broken} broken")
+    return 1 if broken else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -77,7 +77,6 @@ type Invoice = {
   zimra_receipt_global_no?: number;
   zimra_verification_code?: string;
   zimra_verification_url?: string;
-  zimra_payload?: string;
   zimra_errors?: string;
   lines: InvoiceLine[];
 };
@@ -92,6 +92,7 @@ type POSOrder = {
   zimra_verification_url: string;
   qr_url?: string;
   fiscal_errors: string;
+  fiscal_status?: string;
   change_amount: number;
   cash_amount: number;
   card_amount: number;
@@ -1324,7 +1325,17 @@ export default function POSPage() {
     if (found) {
       addToCart(found);
       setSearchTerm("");
+      return;
     }
+    // Not in the loaded list (filtered or paged out): ask the scan index
+    apiFetch<Omit<POSProduct, "description" | "stock_on_hand">>(
+      `/pos/scan/${encodeURIComponent(val)}?company_id=${companyId}`,
+    )
+      .then((p) => {
+        addToCart({ description: "", stock_on_hand: 0, ...p });
+        setSearchTerm("");
+      })
+      .catch(() => {});
   };
 
   const openPaymentDialog = useCallback(async () => {
@@ -1440,7 +1451,7 @@ export default function POSPage() {
     }
 
     try {
-      const order = await apiFetch<POSOrder>("/pos/orders", {
+      let order = await apiFetch<POSOrder>("/pos/orders", {
         method: "POST",
         body: JSON.stringify({
           session_id: session.id,
@@ -1469,6 +1480,18 @@ export default function POSPage() {
         }),
       });
 
+      // Fiscalization runs in the background; wait briefly for the receipt
+      // ID and QR code so the printed slip carries them.
+      if (order.fiscal_status === "fiscal_pending") {
+        try {
+          order = await apiFetch<POSOrder>(
+            `/pos/orders/${order.id}/fiscal-status?wait=10`,
+          );
+        } catch {
+          // Print the unfiscalized receipt; the order list shows the outcome
+        }
+      }
+
       setLastOrder(order);
       setShowPayment(false);
       setShowReceipt(true);
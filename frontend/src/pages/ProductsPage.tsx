@@ -16,6 +16,7 @@ type Product = {
   name: string;
   description: string;
   image_url: string;
+  thumbnail_url?: string;
   sale_price: number;
   tax_rate: number;
   sales_cost: number;
@@ -335,7 +336,7 @@ export default function ProductsPage() {
                 >
                   <div style={{ display: "flex", alignItems: "center", gap: 10, flex: 1 }}>
                     {p.image_url ? (
-                      <img src={p.image_url} alt="" style={{ width: 36, height: 36, borderRadius: 6, objectFit: "cover", flexShrink: 0 }} />
+                      <img src={p.thumbnail_url || p.image_url} alt="" style={{ width: 36, height: 36, borderRadius: 6, objectFit: "cover", flexShrink: 0 }} />
                     ) : (
                       <div style={{ width: 36, height: 36, borderRadius: 6, background: "var(--bg-secondary, #f0f0f0)", display: "flex", alignItems: "center", justifyContent: "center", flexShrink: 0 }}>
                         <svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="#bbb" strokeWidth="1.5"><rect x="3" y="3" width="18" height="18" rx="2"/><circle cx="8.5" cy="8.5" r="1.5"/><path d="M21 15l-5-5L5 21"/></svg>